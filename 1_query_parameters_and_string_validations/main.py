@@ -1,8 +1,33 @@
+import sys
+from pathlib import Path
 from typing import Annotated
 
 from fastapi import FastAPI, Query
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.metrics import instrument
+from common.response_cache import CacheRule, ResponseCache, ResponseCacheMiddleware
+
 app = FastAPI()
+instrument(app)
+
+"""
+The first three endpoints only depend on their query string, so their responses are cached. The cache key resolves the
+'item-query' alias and ignores the parameters an endpoint doesn't read. The values of `q` in /items/list/ keep their
+order, because the response echoes them in that order.
+"""
+response_cache = ResponseCache(rules=[
+    CacheRule("/items/", params={"q": "q"}),
+    CacheRule("/items/list/", params={"q": "q"}),
+    CacheRule("/items/alias/", params={"item-query": "q"}),
+])
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return response_cache.stats()
 
 """
 This example demonstrates how to use FastAPI to define query parameters with string validation.
@@ -49,7 +74,9 @@ You can achieve that using Pydantic's 'AfterValidator' inside of Annotated.
 (Pydantic also has BeforeValidator and others)
 """
 from pydantic import AfterValidator
-import random
+
+from common.catalog import Catalog, MappedCatalog
+from common.snapshot import AppSnapshot
 
 data = {
     "isbn-9781529046137": "The Hitchhiker's Guide to the Galaxy",
@@ -57,16 +84,28 @@ data = {
     "isbn-9781439512982": "Isaac Asimov: The Complete Stories, Vol. 2",
 }
 
+"""
+The catalog indexes the same data for the lookups below: point lookups by ID, sorted prefix and range searches and
+random sampling, all without scanning or copying the whole catalog on each request.
+Once the catalog holds millions of IDs, building it on every start takes a while. `python -m common.snapshot snapshot 1`
+saves it in a snapshot, that the next starts open with mmap instead: the lookups then search the sorted IDs in the
+mapped file, shared by all the workers (see common/snapshot.py).
+"""
+app_snapshot = AppSnapshot(__file__)
+if app_snapshot.has("catalog"):
+    catalog = MappedCatalog(app_snapshot.snapshot, "catalog")
+else:
+    catalog = Catalog(prefixes=("isbn-", "imdb-"), entries=data.items())
+app_snapshot.register("catalog", catalog)
+
 def check_valid_id(id: str):
     """
     For example, this custom validator checks that the item ID starts with 'isbn-' for an ISBN book number or with
-    'imdb-' for an IMDB movie URL ID
+    'imdb-' for an IMDB movie URL ID (the prefixes accepted by the catalog)
     :param id:
     :return:
     """
-    if not id.startswith(("isbn-", "imdb-")):
-        raise ValueError('Invalid ID format, it must start with "isbn-" or "imdb-"')
-    return id
+    return catalog.check_id(id)
 
 
 @app.get("/items/custom_validation/")
@@ -77,7 +116,39 @@ async def read_items_custom_validation(id: Annotated[str | None, AfterValidator(
     another API, you should instead use FastAPI Dependencies, you will learn about them later.
     """
     if id:
-        item = data.get(id)
+        item = catalog.get(id)
     else:
-        id, item = random.choice(list(data.items()))
+        id, item = catalog.sample()
     return {"id": id, "name": item}
+
+
+@app.get("/items/catalog/")
+async def list_catalog(
+    prefix: Annotated[str, Query(max_length=64)] = "",
+    after: Annotated[str | None, Query(max_length=64)] = None,
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+):
+    """
+    Lists the catalog in ID order, optionally only the IDs starting with a prefix, e.g.
+    http://localhost:8000/items/catalog/?prefix=isbn-978&limit=10
+    To get the next page, pass the `next` value of the response as `after`.
+    """
+    entries = catalog.search_prefix(prefix, limit=limit, after=after)
+    return {
+        "items": [{"id": id, "name": name} for id, name in entries],
+        "next": entries[-1][0] if len(entries) == limit else None,
+    }
+
+
+@app.get("/items/catalog/range/")
+async def search_catalog_range(
+    start: Annotated[str, Query(max_length=64)],
+    end: Annotated[str | None, Query(max_length=64)] = None,
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+):
+    """
+    Lists the IDs between `start` (inclusive) and `end` (exclusive), e.g. a range of ISBNs:
+    http://localhost:8000/items/catalog/range/?start=isbn-9781400000000&end=isbn-9781500000000
+    """
+    entries = catalog.search_range(start, end, limit=limit)
+    return {"items": [{"id": id, "name": name} for id, name in entries]}
@@ -1,8 +1,24 @@
+import sys
+from pathlib import Path as FilePath
 from typing import Annotated
 
 from fastapi import FastAPI, Path
 
+sys.path.append(str(FilePath(__file__).resolve().parent.parent))
+
+from common.metrics import instrument
+from common.response_cache import CacheRule, ResponseCache, ResponseCacheMiddleware
+
 app = FastAPI()
+instrument(app)
+
+response_cache = ResponseCache(rules=[CacheRule("/items/{item_id}", params={"q": "q"})])
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return response_cache.stats()
 
 
 @app.get("/items/{item_id}")
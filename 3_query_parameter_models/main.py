@@ -1,9 +1,20 @@
+import random
+import sys
+from pathlib import Path
 from typing import Annotated, Literal
 
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel, Field
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.compression import CompressionMiddleware, CompressionRule
+from common.indexed_items import IndexedItemStore, StoredItem
+from common.metrics import instrument
+from common.response_cache import CacheRule, ResponseCache, ResponseCacheMiddleware
+
 app = FastAPI()
+instrument(app)
 
 """
 If you have a group of query parameters that are related, you can create a Pydantic model to declare them.
@@ -15,6 +26,7 @@ class FilterParams(BaseModel):
     offset: int = Field(0, ge=0)
     order_by: Literal["created_at", "updated_at"] = "created_at"
     tags: list[str] = []
+    cursor: str | None = None
 
 class FilterParamsRestricted(BaseModel):
     """
@@ -29,12 +41,73 @@ class FilterParamsRestricted(BaseModel):
     offset: int = Field(0, ge=0)
     order_by: Literal["created_at", "updated_at"] = "created_at"
     tags: list[str] = []
+    cursor: str | None = None
+
+
+"""
+The filters are applied to an in-memory store with a sorted index per order_by field and an inverted index of tags.
+Besides offset, pages can be requested with the opaque `cursor` returned as `next_cursor` by the previous page, which
+keeps deep pages as fast as the first one:
+http://localhost:8000/items/?limit=10&tags=rock&tags=metal&cursor=WyJjcmVhdGVkX2F0Iiw1MC4wLDVd
+"""
+store = IndexedItemStore()
+
+_random = random.Random(0)
+_tags = ["rock", "metal", "pop", "jazz", "blues", "folk", "punk", "indie"]
+for _item_id in range(1, 1001):
+    _created_at = 1_700_000_000 + _item_id * 3600
+    store.put(StoredItem(
+        id=_item_id,
+        name=f"Item {_item_id}",
+        tags=frozenset(_random.sample(_tags, _random.randint(0, 3))),
+        created_at=_created_at,
+        updated_at=_created_at + _random.randint(0, 90 * 24 * 3600),
+    ))
+
+
+"""
+Both routes only depend on their query parameters (the store doesn't change while the app runs), so their responses
+are cached. The cache key fills in the defaults of the model and sorts the tags, since they are matched as a set.
+"""
+response_cache = ResponseCache(rules=[
+    CacheRule.from_model("/items/", FilterParams, unordered=("tags",)),
+    CacheRule.from_model("/items/restricted/", FilterParamsRestricted, unordered=("tags",)),
+])
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+"""
+Pages of items with their tags are compressed when the client accepts it. The compression middleware is added last, so
+it is outside the cache: the cache keeps the plain body, which is compressed for each client in its encoding.
+"""
+app.add_middleware(CompressionMiddleware, rules=[
+    CompressionRule("/items/"),
+    CompressionRule("/items/restricted/"),
+])
+
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return response_cache.stats()
+
+
+def query_store(filter_query: FilterParams | FilterParamsRestricted):
+    try:
+        items, next_cursor = store.query(
+            order_by=filter_query.order_by,
+            limit=filter_query.limit,
+            offset=filter_query.offset,
+            tags=filter_query.tags,
+            cursor=filter_query.cursor,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"items": [item.to_dict() for item in items], "next_cursor": next_cursor}
 
 
 @app.get("/items/")
 async def read_items(filter_query: Annotated[FilterParams, Query()]):
-    return filter_query
+    return query_store(filter_query)
 
 @app.get("/items/restricted/")
 async def read_items_restricted(filter_query: Annotated[FilterParamsRestricted, Query()]):
-    return filter_query
\ No newline at end of file
+    return query_store(filter_query)
\ No newline at end of file
@@ -1,9 +1,123 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path as FilePath
 from typing import Annotated
 
-from fastapi import FastAPI, Path, Body
-from pydantic import BaseModel
+from fastapi import FastAPI, Path, Body, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
 
-app = FastAPI()
+sys.path.append(str(FilePath(__file__).resolve().parent.parent))
+
+from common.binary_formats import enable_binary_formats
+from common.change_feed import ChangeFeed, Overflow
+from common.dense_store import DenseStore
+from common.idempotency import IdempotencyCache, IdempotencyMiddleware
+from common.metrics import instrument
+from common.responses import fast_json_response
+from common.snapshot import AppSnapshot
+from common.write_behind import WriteBehindStore
+
+"""
+Every update is persisted to a shared item store. Writes are buffered and flushed in batches to an append-only log by a
+background task, repeated updates of the same item within a flush window becoming a single line. The log file, the
+durability mode ("none", "async", "fsync" or "sync", see common/write_behind.py) and the flush window are configured
+from the environment.
+"""
+store = WriteBehindStore(
+    path=os.environ.get("ITEM_STORE_PATH", FilePath(__file__).resolve().parent / "items.log"),
+    durability=os.environ.get("ITEM_STORE_DURABILITY", "async"),
+    flush_interval=float(os.environ.get("ITEM_STORE_FLUSH_INTERVAL", "0.05")),
+)
+
+"""
+Replaying a long log on every start is slow. `python -m common.snapshot snapshot 4` saves the items in a snapshot, then
+a start maps it and only replays the log written after it (`compact` also starts a new log). The items not updated
+since the snapshot are served from the mapped file, see read_item below.
+"""
+app_snapshot = AppSnapshot(__file__)
+if app_snapshot.has("items"):
+    store.load_snapshot(app_snapshot.snapshot, "items")
+app_snapshot.register("items", store)
+
+"""
+The IDs of this app are bounded (0 to 1000), so reads are served from a DenseStore: one slot per possible ID, each
+holding the JSON of the item rendered when it was last written. A GET copies those bytes instead of encoding the item.
+"""
+MAX_ITEM_ID = 1000
+rendered_items = DenseStore(low=0, high=MAX_ITEM_ID)
+
+
+async def save_many(records: dict[int, dict]):
+    await store.put_many(records)
+    for item_id, record in records.items():
+        idempotency_cache.written(item_id)
+        if rendered_items.covers(item_id):
+            rendered_items.put(item_id, {"item_id": item_id, **store.get(item_id)})
+        item_changes.publish(item_id, record)
+
+
+async def save(item_id: int, record: dict):
+    await save_many({item_id: record})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await store.start()
+    for item_id, record in store.items_since_snapshot():
+        if rendered_items.covers(item_id):
+            rendered_items.put(item_id, {"item_id": item_id, **record})
+    yield
+    await store.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+
+"""
+Other services send the item and user bodies as MessagePack or CBOR (Content-Type: application/msgpack or
+application/cbor) and can ask for the responses in those formats with Accept. See common/binary_formats.py.
+"""
+enable_binary_formats(app, paths={
+    "/items/{item_id}/multiple_body/",
+    "/items/{item_id}/single_body_param/",
+    "/items/{item_id}/body_and_query/",
+})
+
+"""
+Mobile clients retry these two routes aggressively. A retry (same path, query and body, or same Idempotency-Key
+header) gets the stored response of the first request back, without validating the body or running the handler again.
+The resource of both routes is the item: every write of an item, by any route, goes through save_many, which tells the
+cache, so a request identical to an earlier one is run again once the item was written in between.
+"""
+idempotency_cache = IdempotencyCache(routes=[
+    ("PUT", "/items/{item_id}/multiple_body/"),
+    ("PUT", "/items/{item_id}/single_body_param/"),
+], resource=lambda params: int(params["item_id"]))
+app.add_middleware(IdempotencyMiddleware, cache=idempotency_cache)
+
+
+"""
+Every successful item update is published to a change feed: instead of polling the items, a cache can subscribe to
+GET /items/changes/ (Server-Sent Events) and resume from the sequence number of the last change it got. A subscriber
+falling too far behind gets a snapshot of what it missed, or is disconnected (see common/change_feed.py).
+"""
+item_changes = ChangeFeed()
+
+
+@app.get("/items/changes/")
+async def stream_item_changes(request: Request, after: Annotated[int | None, Query(ge=0)] = None,
+                              on_overflow: Overflow = "snapshot"):
+    """
+    The item updates as they happen, after the sequence number `after` (or the Last-Event-ID header of a reconnecting
+    EventSource) when given
+    """
+    return item_changes.stream(request, after, on_overflow)
+
+
+@app.get("/items/changes/stats")
+async def read_item_changes_stats():
+    return item_changes.stats()
 
 
 class Item(BaseModel):
@@ -18,9 +132,24 @@ class User(BaseModel):
 
 
 
+@app.get("/items/{item_id}")
+async def read_item(item_id: Annotated[int, Path(title="The ID of the item to get", ge=0, le=MAX_ITEM_ID)]):
+    """
+    Returns the last stored version of the item, e.g. {"item_id": 5, "item": {...}, "user": {...}, "importance": 5}
+    """
+    rendered = rendered_items.get_rendered(item_id)
+    if rendered is None:
+        stored = store.get_json(item_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        rendered = b'{"item_id":%d,%s' % (item_id, stored[1:]) if stored != b"{}" else b'{"item_id":%d}' % item_id
+    return Response(content=rendered, media_type="application/json")
+
+
 @app.put("/items/{item_id}")
+@fast_json_response
 async def update_item(
-    item_id: Annotated[int, Path(title="The ID of the item to get", ge=0, le=1000)],
+    item_id: Annotated[int, Path(title="The ID of the item to get", ge=0, le=MAX_ITEM_ID)],
     q: str | None = None,
     item: Item | None = None,
 ):
@@ -41,11 +170,13 @@ async def update_item(
         results.update({"q": q})
     if item:
         results.update({"item": item})
+        await save(item_id, {"item": item.model_dump()})
     return results
 
 
 
 @app.put("/items/{item_id}/multiple_body/")
+@fast_json_response
 async def update_item_multiple_body(item_id: int, item: Item, user: User):
     """
     You can also declare multiple body parameters, e.g. item and user.
@@ -66,10 +197,12 @@ async def update_item_multiple_body(item_id: int, item: Item, user: User):
     }
     """
     results = {"item_id": item_id, "item": item, "user": user}
+    await save(item_id, {"item": item.model_dump(), "user": user.model_dump()})
     return results
 
 
 @app.put("/items/{item_id}/single_body_param/")
+@fast_json_response
 async def update_item_single_body_param(
     item_id: int, item: Item, user: User, importance: Annotated[int, Body()]
 ):
@@ -93,10 +226,12 @@ async def update_item_single_body_param(
     }
     """
     results = {"item_id": item_id, "item": item, "user": user, "importance": importance}
+    await save(item_id, {"item": item.model_dump(), "user": user.model_dump(), "importance": importance})
     return results
 
 
 @app.put("/items/{item_id}/body_and_query/")
+@fast_json_response
 async def update_item_body_and_query(
     *,
     item_id: int,
@@ -116,11 +251,13 @@ async def update_item_body_and_query(
     """
 
     results = {"item_id": item_id, "item": item, "user": user, "importance": importance}
+    await save(item_id, {"item": item.model_dump(), "user": user.model_dump(), "importance": importance})
     if q:
         results.update({"q": q})
     return results
 
 @app.put("/items/{item_id}/embedded")
+@fast_json_response
 async def update_item_embedded(item_id: int, item: Annotated[Item, Body(embed=True)]):
     """
     If you want it to expect a JSON with a key item and inside of it the model contents, as it does when you declare
@@ -143,4 +280,19 @@ async def update_item_embedded(item_id: int, item: Annotated[Item, Body(embed=Tr
     }
     """
     results = {"item_id": item_id, "item": item}
-    return results
\ No newline at end of file
+    await save(item_id, {"item": item.model_dump()})
+    return results
+
+
+@app.put("/items/")
+async def update_items_bulk(items: dict[Annotated[int, Field(ge=0, le=MAX_ITEM_ID)], Item]):
+    """
+    Updates many items in one request, the body maps each item_id to its item:
+    {
+        "1": {"name": "Foo", "price": 42.0},
+        "2": {"name": "Bar", "description": "The bartenders", "price": 62, "tax": 20.2}
+    }
+    All the items go to the store in one call, so they are flushed together.
+    """
+    await save_many({item_id: {"item": item.model_dump()} for item_id, item in items.items()})
+    return {"updated": len(items)}
@@ -1,9 +1,18 @@
+import sys
+from pathlib import Path
 from typing import Annotated
 
-from fastapi import Body, FastAPI
-from pydantic import BaseModel, Field
+from fastapi import Body, FastAPI, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.change_feed import ChangeFeed, Overflow
+from common.metrics import instrument
 
 app = FastAPI()
+instrument(app)
 
 
 class Item(BaseModel):
@@ -13,7 +22,83 @@ class Item(BaseModel):
     tax: float | None = None
 
 
+items: dict[int, Item] = {}
+
+
+"""
+Every successful item update is published to a change feed: instead of polling the items, a cache can subscribe to
+GET /items/changes/ (Server-Sent Events) and resume from the sequence number of the last change it got. A subscriber
+falling too far behind gets a snapshot of what it missed, or is disconnected (see common/change_feed.py).
+"""
+item_changes = ChangeFeed()
+
+
+@app.get("/items/changes/")
+async def stream_item_changes(request: Request, after: Annotated[int | None, Query(ge=0)] = None,
+                              on_overflow: Overflow = "snapshot"):
+    """
+    The item updates as they happen, after the sequence number `after` (or the Last-Event-ID header of a reconnecting
+    EventSource) when given
+    """
+    return item_changes.stream(request, after, on_overflow)
+
+
+@app.get("/items/changes/stats")
+async def read_item_changes_stats():
+    return item_changes.stats()
+
+
 @app.put("/items/{item_id}")
 async def update_item(item_id: int, item: Annotated[Item, Body(embed=True)]):
+    items[item_id] = item
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
-    return results
\ No newline at end of file
+    return results
+
+
+"""
+To load whole catalogs, the bulk endpoint validates a JSON array of items in one pass: the raw body goes straight to a
+TypeAdapter(list[Item]), which parses and validates it in pydantic-core without building intermediate Python dicts, and
+reports the errors of every row at once.
+"""
+ItemBatch = TypeAdapter(list[Item])
+
+
+@app.post("/items/bulk/")
+async def create_items_bulk(request: Request, dry_run: bool = False):
+    """
+    Expects a JSON array of items, e.g.:
+    [
+        {"name": "Foo", "price": 35.4},
+        {"name": "Bar", "description": "The bartenders", "price": 62, "tax": 20.2}
+    ]
+    The batch is all or nothing: when any row is invalid nothing is stored and the response lists only the failing rows,
+    with their index in the array:
+    {
+        "failed": 1,
+        "errors": [{"index": 1, "errors": [{"loc": ["price"], "type": "greater_than", "msg": "..."}]}]
+    }
+    With `?dry_run=true` the batch is only validated, nothing is stored even if it is valid.
+    """
+    body = await request.body()
+    try:
+        batch = ItemBatch.validate_json(body)
+    except ValidationError as exc:
+        rows: dict[int, list] = {}
+        for error in exc.errors(include_url=False, include_context=False, include_input=False):
+            loc = error["loc"]
+            if not loc or not isinstance(loc[0], int):
+                # Not a row error: the body isn't JSON or isn't an array
+                return JSONResponse(status_code=422, content={"detail": [{"loc": list(loc), "type": error["type"], "msg": error["msg"]}]})
+            rows.setdefault(loc[0], []).append({"loc": list(loc[1:]), "type": error["type"], "msg": error["msg"]})
+        return JSONResponse(status_code=422, content={
+            "failed": len(rows),
+            "errors": [{"index": index, "errors": errors} for index, errors in sorted(rows.items())],
+        })
+    if dry_run or not batch:
+        return {"valid": len(batch), "stored": 0}
+    first_id = max(items, default=0) + 1
+    items.update(zip(range(first_id, first_id + len(batch)), batch))
+    for item_id, item in zip(range(first_id, first_id + len(batch)), batch):
+        item_changes.publish(item_id, {"item": item})
+    return {"valid": len(batch), "stored": len(batch), "first_id": first_id, "last_id": first_id + len(batch) - 1}
@@ -1,7 +1,138 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, HttpUrl
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated, Literal
 
-app = FastAPI()
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import AfterValidator, BaseModel, HttpUrl, ValidationError, WrapValidator
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.admission import AdmissionController, AdmissionMiddleware, AdmissionRule, admission_enabled, lanes_from_env
+from common.binary_formats import enable_binary_formats
+from common.change_feed import ChangeFeed, Overflow
+from common.compression import CompressionMiddleware, CompressionRule
+from common.jobs import Job, JobQueue, QueueFull
+from common.json_stream import StreamFormatError, is_ndjson, iter_json_array, iter_ndjson_lines
+from common.metrics import instrument
+from common.offer_store import OfferAggregates, OfferStore, StoredOffer
+from common.responses import fast_json_response
+from common.snapshot import AppSnapshot
+from common.tag_index import TagIndex, TagQueryError
+from common.validation_cache import ValidationCache
+from common.weights import MergeMode, Norm, WeightStore, WeightVector
+
+"""
+Offers can be processed in the background (see create_offer): they wait in a bounded queue for one of the workers of
+`offer_jobs`. The number of workers, the size of the queue, and the size of the process pool the summaries are computed
+in (0 computes them on the event loop, between other requests) are configured from the environment.
+"""
+OFFER_JOB_CHUNK = 500
+
+
+async def process_offer(jobs: JobQueue, job: Job):
+    """
+    Summarizes the items of the offer, OFFER_JOB_CHUNK items at a time so that the progress of the job can be followed
+    """
+    offer = job.payload
+    aggregates = OfferAggregates()
+    for start in range(0, len(offer["items"]), OFFER_JOB_CHUNK):
+        chunk = offer["items"][start:start + OFFER_JOB_CHUNK]
+        aggregates.merge(await jobs.run(OfferAggregates.from_items, chunk))
+        job.advance(len(chunk))
+    return {"name": offer["name"], "description": offer["description"], "price": offer["price"],
+            "summary": aggregates.summary()}
+
+
+offer_jobs = JobQueue(
+    process=process_offer,
+    workers=int(os.environ.get("OFFER_JOB_WORKERS", "4")),
+    max_queued=int(os.environ.get("OFFER_JOB_QUEUE_SIZE", "100")),
+    processes=int(os.environ.get("OFFER_JOB_PROCESSES", "0")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await offer_jobs.start()
+    yield
+    await offer_jobs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+enable_binary_formats(app, paths={"/offers/", "/items/{item_id}/nested"})
+
+"""
+Lists of images and offers can be many megabytes of the same keys repeated, their responses are compressed (gzip,
+brotli or zstd, as the client accepts) while they are sent. Offers are the biggest, a faster level keeps the CPU in check.
+"""
+app.add_middleware(CompressionMiddleware, rules=[
+    CompressionRule("/images/multiple/", minimum_size=4096),
+    CompressionRule("/offers/", minimum_size=4096, levels={"gzip": 4, "br": 2, "zstd": 1}),
+])
+
+"""
+Validating a big Offer or list of images holds the event loop for as long as it takes, and every other request waits.
+Past the lag and in-flight thresholds of their lane, requests are rejected upfront with 503 and Retry-After: the bulk
+POSTs first (and never more than a few at once), the reads last (see common/admission.py). Turned on with
+ADMISSION_CONTROL=1.
+"""
+admission = AdmissionController(lanes_from_env(), rules=[
+    AdmissionRule("/offers/", "bulk", methods={"POST"}),
+    AdmissionRule("/images/multiple/", "bulk", methods={"POST"}),
+    AdmissionRule("/images/multiple/stream/", "bulk", methods={"POST"}),
+    AdmissionRule("/index-weights/{path:path}", "bulk", methods={"POST"}),  # The vector POSTs too
+    AdmissionRule("/{path:path}", "priority", methods={"GET", "HEAD"}),
+])
+if admission_enabled():
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
+
+@app.get("/admission/stats")
+async def read_admission_stats():
+    return admission.stats()
+
+
+"""
+Every successful item update is published to a change feed: instead of polling the items, a cache can subscribe to
+GET /items/changes/ (Server-Sent Events) and resume from the sequence number of the last change it got. A subscriber
+falling too far behind gets a snapshot of what it missed, or is disconnected (see common/change_feed.py).
+"""
+item_changes = ChangeFeed()
+
+
+@app.get("/items/changes/")
+async def stream_item_changes(request: Request, after: Annotated[int | None, Query(ge=0)] = None,
+                              on_overflow: Overflow = "snapshot"):
+    """
+    The item updates as they happen, after the sequence number `after` (or the Last-Event-ID header of a reconnecting
+    EventSource) when given
+    """
+    return item_changes.stream(request, after, on_overflow)
+
+
+@app.get("/items/changes/stats")
+async def read_item_changes_stats():
+    return item_changes.stats()
+
+
+"""
+The items put with PUT /items/{item_id} and /items/{item_id}/nested are indexed by tag: each tag maps to a compressed
+bitmap of the IDs of its items, which answers boolean tag queries with a few bitmap operations (see
+common/tag_index.py). The tags of the indexed items are interned, each distinct tag kept as a single string object that
+validation hands to the next items carrying it. Items with IDs that don't fit in 32 bits unsigned are not indexed.
+"""
+tag_index = TagIndex()
+
+"""
+Image URLs repeat a lot (a catalog reuses the same few thousand CDN URLs across all its items): each distinct URL string
+is validated once and the following images get the same HttpUrl object, from a bounded cache (see
+common/validation_cache.py). Its hit rate and the memory it saved are served at /images/url-cache/.
+"""
+image_url_cache = ValidationCache(max_entries=int(os.environ.get("IMAGE_URL_CACHE_SIZE", "10000")))
 
 
 class Image(BaseModel):
@@ -11,7 +142,7 @@ class Image(BaseModel):
     field, we can declare it to be an instance of Pydantic's HttpUrl instead of a str.
     The string will be checked to be a valid URL, and documented in JSON Schema / OpenAPI as such.
     """
-    url: HttpUrl
+    url: Annotated[HttpUrl, WrapValidator(image_url_cache)]
     name: str
 
 
@@ -25,7 +156,7 @@ class ItemNested(BaseModel):
     description: str | None = None
     price: float
     tax: float | None = None
-    tags: set[str] = set()
+    tags: Annotated[set[str], AfterValidator(tag_index.canonical)] = set()
     #image: Image | None = None
     images: list[Image] | None = None
 
@@ -40,7 +171,7 @@ class Item(BaseModel):
     description: str | None = None
     price: float
     tax: float | None = None
-    tags: set[str] = set()
+    tags: Annotated[set[str], AfterValidator(tag_index.canonical)] = set()
 
 
 class Offer(BaseModel):
@@ -54,11 +185,16 @@ class Offer(BaseModel):
 
 
 @app.put("/items/{item_id}")
+@fast_json_response
 async def update_item(item_id: int, item: Item):
+    if tag_index.indexable(item_id):
+        tag_index.put(item_id, item.tags)
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
 @app.put("/items/{item_id}/nested")
+@fast_json_response
 async def update_item_nested(item_id: int, item: ItemNested):
     """
     FastAPI would expect a body similar to:
@@ -85,19 +221,132 @@ async def update_item_nested(item_id: int, item: ItemNested):
     }
     Note that the image attribute is itself an object with a specific structure.
     """
+    if tag_index.indexable(item_id):
+        tag_index.put(item_id, item.tags)
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
 
+@app.get("/items/tags/")
+async def read_tag_index():
+    return tag_index.stats()
+
+
+@app.get("/items/tags/query")
+async def query_items_by_tags(q: Annotated[str, Query(max_length=1000)],
+                              limit: Annotated[int, Query(gt=0, le=10_000)] = 100):
+    """
+    IDs of the items matching a boolean expression of tags, e.g.
+    http://localhost:8000/items/tags/query?q=rock AND (metal OR punk) AND NOT pop
+    The IDs are sorted, `count` is the number of matching items and `item_ids` the first `limit` of them.
+    """
+    try:
+        matches = tag_index.query(q)
+    except TagQueryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"count": len(matches), "item_ids": matches.to_array(limit).tolist()}
+
+
+"""
+Offers posted with ?mode=store are kept server-side, with the aggregates of their items (counts, totals, price sums per
+tag, min and max price) updated by every item added, replaced or removed: reading them is as fast for an offer of 100k
+items as for one of 10 (see common/offer_store.py).
+"""
+offer_store = OfferStore()
+
+
+def get_stored_offer(offer_id: str) -> StoredOffer:
+    try:
+        return offer_store.get(offer_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Offer not found")
+
+
 @app.post("/offers/")
-async def create_offer(offer: Offer):
+@fast_json_response
+async def create_offer(offer: Offer, mode: Literal["inline", "async", "store"] = "inline"):
     """
     Notice how Offer has a list of Items, which in turn have an optional list of Images
+    With `?mode=async` the validated offer is queued to be summarized in the background, and the answer is a 202 with
+    the job to follow at /offers/jobs/{job_id}. When the queue is full, it is a 429 with a Retry-After header.
+    With `?mode=store` the offer is kept, the answer is a 201 with its ID and the summary to follow at
+    /offers/{offer_id}/summary.
+    """
+    if mode == "inline":
+        return offer
+    if mode == "store":
+        offer_id = offer_store.add(offer.model_dump())
+        return JSONResponse(status_code=201, content={"id": offer_id, **get_stored_offer(offer_id).summary()},
+                            headers={"Location": f"/offers/{offer_id}/summary"})
+    try:
+        job = offer_jobs.submit(offer.model_dump(mode="json"), total=len(offer.items))
+    except QueueFull as exc:
+        return JSONResponse(status_code=429, content={"detail": str(exc)},
+                            headers={"Retry-After": str(exc.retry_after)})
+    return JSONResponse(status_code=202, content=job.to_dict(), headers={"Location": f"/offers/jobs/{job.id}"})
+
+
+@app.get("/offers/jobs/")
+async def read_offer_jobs():
+    return offer_jobs.stats()
+
+
+@app.get("/offers/jobs/{job_id}")
+async def read_offer_job(job_id: str):
+    """
+    Status of an offer job: queued, running, done (with the summary as result) or failed (with the error), and how
+    many of its items have been processed
     """
-    return offer
+    try:
+        return offer_jobs.get(job_id).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+
+@app.get("/offers/{offer_id}/summary")
+async def read_offer_summary(offer_id: str):
+    return get_stored_offer(offer_id).summary()
+
+
+@app.post("/offers/{offer_id}/items/", status_code=201)
+async def add_offer_item(offer_id: str, item: ItemNested):
+    stored = get_stored_offer(offer_id)
+    item_id = stored.add_item(item.model_dump())
+    return {"item_id": item_id, "summary": stored.aggregates.summary()}
+
+
+@app.put("/offers/{offer_id}/items/{item_id}")
+async def replace_offer_item(offer_id: str, item_id: int, item: ItemNested):
+    stored = get_stored_offer(offer_id)
+    try:
+        stored.replace_item(item_id, item.model_dump())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"item_id": item_id, "summary": stored.aggregates.summary()}
+
+
+@app.delete("/offers/{offer_id}/items/{item_id}", status_code=204)
+async def delete_offer_item(offer_id: str, item_id: int):
+    try:
+        get_stored_offer(offer_id).remove_item(item_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+
+@app.delete("/offers/{offer_id}", status_code=204)
+async def delete_offer(offer_id: str):
+    get_stored_offer(offer_id)
+    offer_store.remove(offer_id)
+
+
+@app.get("/images/url-cache/")
+async def read_image_url_cache():
+    return image_url_cache.stats()
 
 
 @app.post("/images/multiple/")
+@fast_json_response
 async def create_multiple_images(images: list[Image]):
     """
     If the top level value of the JSON body you expect is a JSON array (a Python list), you can declare the type in the parameter of the function
@@ -106,6 +355,51 @@ async def create_multiple_images(images: list[Image]):
     """
     return images
 
+
+MAX_REPORTED_ERRORS = 100
+
+
+@app.post("/images/multiple/stream/")
+async def create_multiple_images_stream(request: Request):
+    """
+    The same body as /images/multiple/, a JSON array of images, but read as a stream: every image is validated (url
+    included) as soon as it has been received, so the whole array is never held in memory and very large uploads can
+    be accepted. The body can also be sent as NDJSON, one image per line, with `Content-Type: application/x-ndjson`.
+    Invalid images don't reject the whole upload, they are reported with their index in the array:
+    {
+        "received": 3,
+        "accepted": 2,
+        "errors": [{"index": 1, "errors": [{"type": "url_parsing", "loc": ["url"], "msg": "..."}]}]
+    }
+    """
+    received = accepted = 0
+    errors = []
+
+    def report(index: int, exc: ValidationError):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"index": index, "errors": exc.errors(include_url=False, include_context=False, include_input=False)})
+
+    try:
+        if is_ndjson(request.headers.get("content-type")):
+            async for line in iter_ndjson_lines(request.stream()):
+                try:
+                    Image.model_validate_json(line)
+                    accepted += 1
+                except ValidationError as exc:
+                    report(received, exc)
+                received += 1
+        else:
+            async for element in iter_json_array(request.stream()):
+                try:
+                    Image.model_validate(element)
+                    accepted += 1
+                except ValidationError as exc:
+                    report(received, exc)
+                received += 1
+    except StreamFormatError as exc:
+        return JSONResponse(status_code=400, content={"detail": str(exc), "index": exc.index, "received": received})
+    return {"received": received, "accepted": accepted, "error_count": received - accepted, "errors": errors}
+
 @app.post("/index-weights/")
 async def create_index_weights(weights: dict[int, float]):
     """
@@ -124,4 +418,86 @@ Keep in mind that JSON only supports str as keys. But Pydantic has automatic dat
 This means that, even though your API clients can only send strings as keys, as long as those strings contain pure 
 integers, Pydantic will convert them and validate them.
 And the dict you receive as weights will actually have int keys and float values.
-"""
\ No newline at end of file
+"""
+
+
+"""
+For large weight dicts (think ranking weights with millions of keys) the dict is only used to receive the body: it is
+converted into a compact WeightVector, two NumPy arrays with the sorted keys and their weights, and kept server-side
+under an ID. Normalizing, picking the top k, dot products and merges then run as vectorized NumPy operations.
+"""
+weight_store = WeightStore()
+
+"""
+The vectors only live in the process that received them: POST /index-weights/vectors/snapshot saves them in the snapshot
+of the app, and the next starts map it instead of waiting for the vectors to be sent again. Their keys and weights are
+then read from the mapped file, shared by the workers (see common/snapshot.py).
+"""
+app_snapshot = AppSnapshot(__file__)
+if app_snapshot.has("weights"):
+    weight_store.load_snapshot(app_snapshot.snapshot, "weights")
+app_snapshot.register("weights", weight_store)
+
+
+def get_vector(vector_id: str) -> WeightVector:
+    try:
+        return weight_store.get(vector_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Weight vector not found")
+
+
+def describe_vector(vector_id: str, vector: WeightVector) -> dict:
+    return {"id": vector_id, "size": len(vector), "nbytes": vector.nbytes}
+
+
+@app.post("/index-weights/vectors/", status_code=201)
+async def create_weight_vector(weights: dict[int, float]):
+    vector = WeightVector.from_mapping(weights)
+    return describe_vector(weight_store.add(vector), vector)
+
+
+@app.post("/index-weights/vectors/snapshot")
+async def snapshot_weight_vectors():
+    size = await app_snapshot.write_async()
+    return {"path": str(app_snapshot.path), "size": size, "vectors": len(weight_store)}
+
+
+@app.get("/index-weights/vectors/{vector_id}")
+async def read_weight_vector(vector_id: str):
+    return get_vector(vector_id).to_dict()
+
+
+@app.delete("/index-weights/vectors/{vector_id}", status_code=204)
+async def delete_weight_vector(vector_id: str):
+    get_vector(vector_id)
+    weight_store.remove(vector_id)
+
+
+@app.post("/index-weights/vectors/{vector_id}/normalize")
+async def normalize_weight_vector(vector_id: str, norm: Norm = "l2"):
+    """
+    Scales the stored weights in place so that their l1, l2 or max norm is 1
+    """
+    vector = get_vector(vector_id).normalized(norm)
+    weight_store.replace(vector_id, vector)
+    return describe_vector(vector_id, vector)
+
+
+@app.get("/index-weights/vectors/{vector_id}/top")
+async def read_top_weights(vector_id: str, k: Annotated[int, Query(gt=0, le=10_000)] = 10):
+    top = get_vector(vector_id).top_k(k)
+    return [{"key": key, "weight": weight} for key, weight in zip(top.keys.tolist(), top.values.tolist())]
+
+
+@app.get("/index-weights/vectors/{vector_id}/dot/{other_id}")
+async def dot_weight_vectors(vector_id: str, other_id: str):
+    return {"dot": get_vector(vector_id).dot(get_vector(other_id))}
+
+
+@app.post("/index-weights/vectors/{vector_id}/merge/{other_id}", status_code=201)
+async def merge_weight_vectors(vector_id: str, other_id: str, mode: MergeMode = "sum"):
+    """
+    Stores the sparse union of both vectors as a new vector, see WeightVector.merged for the merge modes
+    """
+    vector = get_vector(vector_id).merged(get_vector(other_id), mode)
+    return describe_vector(weight_store.add(vector), vector)
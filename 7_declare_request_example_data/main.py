@@ -2,11 +2,61 @@
 You can declare examples of the data your app can receive. Here are several ways to do it.
 That extra info will be added as-is to the output JSON Schema for that model, and it will be used in the API docs.
 """
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Annotated
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Query, Request
 from pydantic import BaseModel, Field
 
-app = FastAPI()
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.change_feed import ChangeFeed, Overflow
+from common.metrics import instrument
+from common.openapi_cache import OpenAPICache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await openapi_cache.warm()
+    yield
+
+
+"""
+All those examples make the OpenAPI schema of this app expensive to generate, so instead of letting FastAPI build it
+on the first request to /openapi.json, it is cached on disk (keyed by a hash of the routes and models) and served with
+an ETag. It can be generated ahead of time with `python -m common.openapi_cache 7` from the repository root.
+"""
+app = FastAPI(lifespan=lifespan, openapi_url=None, docs_url=None, redoc_url=None)
+instrument(app)
+openapi_cache = OpenAPICache(
+    app, cache_dir=os.environ.get("OPENAPI_CACHE_DIR", Path(__file__).resolve().parent / ".openapi_cache")
+)
+openapi_cache.install()
+
+
+"""
+Every successful item update is published to a change feed: instead of polling the items, a cache can subscribe to
+GET /items/changes/ (Server-Sent Events) and resume from the sequence number of the last change it got. A subscriber
+falling too far behind gets a snapshot of what it missed, or is disconnected (see common/change_feed.py).
+"""
+item_changes = ChangeFeed()
+
+
+@app.get("/items/changes/")
+async def stream_item_changes(request: Request, after: Annotated[int | None, Query(ge=0)] = None,
+                              on_overflow: Overflow = "snapshot"):
+    """
+    The item updates as they happen, after the sequence number `after` (or the Last-Event-ID header of a reconnecting
+    EventSource) when given
+    """
+    return item_changes.stream(request, after, on_overflow)
+
+
+@app.get("/items/changes/stats")
+async def read_item_changes_stats():
+    return item_changes.stats()
 
 
 class Item(BaseModel):
@@ -54,16 +104,19 @@ class ItemField(BaseModel):
 
 @app.put("/items/{item_id}")
 async def update_item(item_id: int, item: Item):
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
 @app.put("/items/{item_id}/no_example")
 async def update_item_no_example(item_id: int, item: ItemNoExample):
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
 @app.put("/items/{item_id}/field_example")
 async def update_item_field(item_id: int, item: ItemField):
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
@@ -111,6 +164,7 @@ async def update_item_multiple_body_examples(
     :param item:
     :return:
     """
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
 
@@ -170,5 +224,6 @@ async def update_item_openapi_example(
         ),
     ],
 ):
+    item_changes.publish(item_id, {"item": item})
     results = {"item_id": item_id, "item": item}
     return results
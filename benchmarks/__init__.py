@@ -0,0 +1,4 @@
+"""
+Benchmarks for the exercise apps. Run them from the repository root as modules, for example:
+    python -m benchmarks.http_bench --apps 4 6
+"""
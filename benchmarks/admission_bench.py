@@ -0,0 +1,85 @@
+"""
+Latency of a cheap read while a flood of bulk writes runs, without and with admission control. Every app is served
+from one process (compose.py, one uvicorn worker started by common/launcher.py) and the clients run in other processes.
+
+The cheap read is GET /path-parameters-and-numeric-validations/items/{item_id} of app 2, measured:
+    - alone
+    - while `--flood` connections POST big Offers to app 6 back to back, with ADMISSION_CONTROL=0
+    - the same, with the admission controller of compose.py
+The flood doesn't honor Retry-After: its rejected requests are sent again at once, the worst case for the server. An
+admitted Offer still holds the event loop while it is validated, so its size (`--offer-items`) bounds the p99 of the
+reads from below, admission or not.
+
+    python -m benchmarks.admission_bench --duration 10 --flood 8 --offer-items 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+
+from benchmarks.corpus import Corpus
+from common.launcher import Launcher, run_load_client
+
+CHEAP_PATH = "/path-parameters-and-numeric-validations/items/42?q=bench"
+BULK_PATH = "/body-nested-models/offers/"
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000 if latencies else 0.0
+
+
+def run(args: argparse.Namespace, body: bytes, flood: bool, admission: bool) -> dict:
+    os.environ["ADMISSION_CONTROL"] = "1" if admission else "0"  # Inherited by the worker
+    launcher = Launcher("compose:app", args.host, args.port, workers=1, drain_timeout=1, log_level="warning")
+    launcher.start()
+    try:
+        # Warm-up: loads apps 2 and 6 and fills the response cache of app 2
+        run_load_client(args.host, args.port, CHEAP_PATH, 0.5, 1)
+        run_load_client(args.host, args.port, BULK_PATH, 0.5, 1, method="POST", body=body)
+        with multiprocessing.get_context("spawn").Pool(2) as pool:
+            cheap = pool.apply_async(run_load_client, (args.host, args.port, CHEAP_PATH, args.duration,
+                                                       args.connections))
+            bulk = pool.apply_async(run_load_client, (args.host, args.port, BULK_PATH, args.duration, args.flood,
+                                                      "POST", body)) if flood else None
+            cheap_latencies, cheap_errors = cheap.get()
+            bulk_latencies, bulk_errors = bulk.get() if bulk else ([], 0)
+    finally:
+        launcher.stop()
+    cheap_latencies.sort()
+    return {
+        "cheap_rps": len(cheap_latencies) / args.duration,
+        "p50": percentile(cheap_latencies, 0.5),
+        "p99": percentile(cheap_latencies, 0.99),
+        "max": cheap_latencies[-1] * 1000 if cheap_latencies else 0.0,
+        "cheap_errors": cheap_errors,
+        "bulk_ok": (len(bulk_latencies) - bulk_errors) / args.duration,
+        "bulk_rejected": bulk_errors / args.duration,
+        "bulk_mean": statistics.fmean(bulk_latencies) * 1000 if bulk_latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cheap read latency under a bulk flood, with and without admission")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--connections", type=int, default=4, help="connections sending the cheap read")
+    parser.add_argument("--flood", type=int, default=8, help="connections sending the bulk POSTs")
+    parser.add_argument("--offer-items", type=int, default=200, help="items of each bulk Offer")
+    args = parser.parse_args()
+
+    body = json.dumps(Corpus(payload_items=args.offer_items).fallbacks["Offer"]).encode()
+    print(f"bulk body: {len(body):,} bytes")
+    print(f"{'scenario':<28} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} "
+          f"{'bulk ok/s':>10} {'503/s':>8} {'bulk ms':>8}")
+    for name, flood, admission in [("reads alone", False, True), ("flood, no admission", True, False),
+                                   ("flood, admission", True, True)]:
+        result = run(args, body, flood, admission)
+        print(f"{name:<28} {result['cheap_rps']:>8.0f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+              f"{result['max']:>8.1f} {result['cheap_errors']:>7} {result['bulk_ok']:>10.1f} "
+              f"{result['bulk_rejected']:>8.1f} {result['bulk_mean']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
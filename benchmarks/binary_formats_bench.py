@@ -0,0 +1,74 @@
+"""
+JSON against MessagePack and CBOR for Offer bodies of several sizes: the size of the body, the time to parse it, to
+validate the result (the same Offer.model_validate for every format), to encode the response content, and a whole
+POST /offers/ through app 6 (in-process) sending and accepting the format.
+
+    python -m benchmarks.binary_formats_bench --items 10 100 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.corpus import Corpus
+from common.apps import APP_DIRS, load_module
+from common.binary_formats import available_formats
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def timed(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def request_time(app, body: bytes, media_type: str, repeat: int) -> float:
+    headers = {"content-type": media_type, "accept": media_type}
+    best = math.inf
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.post("/offers/", content=body, headers=headers)
+            best = min(best, time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare JSON, MessagePack and CBOR bodies for Offers")
+    parser.add_argument("--items", nargs="*", type=int, default=[10, 100, 1_000, 10_000], help="items per Offer")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    module = load_module(APP_DIRS[5])
+    codecs = {"json": (JSON_MEDIA_TYPE, lambda content: json.dumps(content).encode(), json.loads)}
+    for binary_format in available_formats():
+        codecs[binary_format.name] = (binary_format.media_type, binary_format.encode, binary_format.decode)
+    if len(codecs) == 1:
+        print("Neither msgpack nor cbor2 is installed, only JSON is measured")
+
+    print(f"{'items':>7} {'format':>8} {'bytes':>11} {'parse':>10} {'validate':>10} {'encode':>10} {'request':>10}")
+    for size in args.items:
+        offer = Corpus(payload_items=size).fallbacks["Offer"]
+        content = jsonable_encoder(module.Offer.model_validate(offer))
+        for name, (media_type, encode, decode) in codecs.items():
+            body = encode(offer)
+            decoded = decode(body)
+            parse = timed(lambda: decode(body), args.repeat)
+            validate = timed(lambda: module.Offer.model_validate(decoded), args.repeat)
+            encoding = timed(lambda: encode(content), args.repeat)
+            request = asyncio.run(request_time(module.app, body, media_type, args.repeat))
+            print(f"{size:>7} {name:>8} {len(body):>11,} {parse:>8.2f}ms {validate:>8.2f}ms {encoding:>8.2f}ms "
+                  f"{request:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Validation throughput of app 5 items: one PUT /items/{item_id} per item against one POST /items/bulk/ for the whole
+batch (both through the app, in-process), and the bare TypeAdapter(list[Item]) for reference. A fraction of the rows is
+made invalid so that the error reporting is part of the measure.
+
+    python -m benchmarks.bulk_validation_bench --items 500000 --invalid 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from pydantic import ValidationError
+
+from common.apps import APP_DIRS, load_module
+
+
+def make_rows(count: int, invalid: float) -> list[dict]:
+    rng = random.Random(0)
+    rows = []
+    for index in range(count):
+        row = {"name": f"Item {index}", "description": "A very nice Item", "price": round(rng.uniform(1, 100), 2)}
+        if rng.random() < invalid:
+            row["price"] = -row["price"]
+        rows.append(row)
+    return rows
+
+
+async def per_request(app, rows: list[dict], concurrency: int) -> float:
+    pending = iter(enumerate(rows))
+
+    async def worker(client: httpx.AsyncClient):
+        for item_id, row in pending:
+            await client.put(f"/items/{item_id}", json={"item": row})
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+async def bulk(app, body: bytes) -> tuple[float, dict]:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        response = await client.post("/items/bulk/", params={"dry_run": "true"}, content=body,
+                                     headers={"content-type": "application/json"})
+        return time.perf_counter() - start, response.json()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-request and bulk item validation")
+    parser.add_argument("--items", type=int, default=500_000)
+    parser.add_argument("--invalid", type=float, default=0.01, help="fraction of invalid rows")
+    parser.add_argument("--per-request-sample", type=int, default=5_000,
+                        help="items sent one by one, the per-request rate is measured on this sample")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    module = load_module(APP_DIRS[4])
+    rows = make_rows(args.items, args.invalid)
+    body = json.dumps(rows).encode()
+
+    elapsed = asyncio.run(per_request(module.app, rows[:args.per_request_sample], args.concurrency))
+    print(f"{'per request':<14} {args.per_request_sample / elapsed:>12,.0f} items/s  ({args.per_request_sample:,} items)")
+
+    elapsed, result = asyncio.run(bulk(module.app, body))
+    print(f"{'bulk endpoint':<14} {args.items / elapsed:>12,.0f} items/s  ({args.items:,} items, "
+          f"{result.get('failed', 0):,} failing rows reported)")
+
+    start = time.perf_counter()
+    try:
+        module.ItemBatch.validate_json(body)
+    except ValidationError:
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{'TypeAdapter':<14} {args.items / elapsed:>12,.0f} items/s")
+
+
+if __name__ == "__main__":
+    main()
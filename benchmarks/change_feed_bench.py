@@ -0,0 +1,91 @@
+"""
+Broadcast of item changes to many subscribers of a change feed (common/change_feed.py), in-process: each subscriber is
+a task reading its event stream, as the SSE response of GET /items/changes/ does, without the sockets.
+
+The changes are published in bursts while the subscribers read. A fraction of them (`--slow`) only read every
+`--slow-delay` seconds: they fall behind more than the buffer and get snapshots instead, and the memory of the feed
+doesn't grow with them. Reported: the cost of a publish (most of it is waking the waiting subscribers, once per burst),
+how long until every subscriber got the last change, the events delivered per second, the snapshots sent, and the
+memory traced per subscriber.
+
+    python -m benchmarks.change_feed_bench --subscribers 10000 --changes 2000 --burst 20
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from common.change_feed import ChangeFeed
+
+END_ITEM_ID = -1
+END_MARKER = b'"item_id":-1'
+
+
+async def subscriber(feed: ChangeFeed, delay: float, received: list[int]) -> None:
+    events = 0
+    async for chunk in feed.events(overflow="snapshot"):
+        events += chunk.count(b"\nevent: change\n") + chunk.count(b"\nevent: snapshot\n")
+        if END_MARKER in chunk:
+            break
+        if delay:
+            await asyncio.sleep(delay)
+    received.append(events)
+
+
+async def run(args: argparse.Namespace) -> None:
+    feed = ChangeFeed(max_entries=args.log_size, buffer=args.buffer)
+    received: list[int] = []
+    slow = int(args.subscribers * args.slow)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(subscriber(feed, args.slow_delay if index < slow else 0.0, received))
+             for index in range(args.subscribers)]
+    await asyncio.sleep(0.1)  # Every subscriber is waiting for the first change
+    per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / args.subscribers
+    tracemalloc.stop()
+
+    data = {"item": {"name": "Foo", "description": "The pretender", "price": 42.0, "tax": 3.2}}
+    idle_feed = ChangeFeed(max_entries=args.log_size)
+    start = time.perf_counter()
+    for item_id in range(args.changes):
+        idle_feed.publish(item_id % 1000, data)
+    idle_publish = (time.perf_counter() - start) / args.changes
+
+    publish_time = 0.0
+    start = time.perf_counter()
+    for burst_start in range(0, args.changes, args.burst):
+        burst = time.perf_counter()
+        for item_id in range(burst_start, min(burst_start + args.burst, args.changes)):
+            feed.publish(item_id % 1000, data)
+        publish_time += time.perf_counter() - burst
+        await asyncio.sleep(0)  # The subscribers read between two bursts
+    feed.publish(END_ITEM_ID, None)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    delivered = sum(received)
+    print(f"subscribers: {args.subscribers:,} ({slow:,} slow)   changes: {args.changes:,} in bursts of {args.burst}")
+    print(f"publish: {publish_time / args.changes * 1e6:.2f}us per change, waking the waiting subscribers included, "
+          f"{idle_publish * 1e6:.2f}us without subscribers")
+    print(f"every subscriber got the last change after {elapsed:.2f}s, "
+          f"{delivered / elapsed:,.0f} events/s, {args.subscribers * args.changes / elapsed:,.0f} changes/s fanned out")
+    print(f"snapshots: {feed.counters['snapshots']:,}   resets: {feed.counters['resets']:,}")
+    print(f"memory: {per_subscriber:,.0f} bytes per subscriber, log of {len(feed._log):,} changes")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Broadcast item changes to many change feed subscribers")
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--changes", type=int, default=2_000)
+    parser.add_argument("--burst", type=int, default=20, help="changes published between two reads")
+    parser.add_argument("--buffer", type=int, default=200)
+    parser.add_argument("--log-size", type=int, default=10_000)
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of slow subscribers")
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="seconds a slow subscriber waits between reads")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+CPU against bytes of the response compression: the list[Image] and Offer bodies of app 6 at several sizes, and a full
+page of app 3 items, compressed the way CompressionMiddleware does (in chunks) with every available encoding and a
+few levels of each. For each one it reports the compressed size, the ratio, the CPU time and the throughput.
+
+    python -m benchmarks.compression_bench --items 100 1000 10000 100000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.corpus import Corpus
+from common.apps import APP_DIRS, load_module
+from common.compression import COMPRESSORS, available_encodings
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 9, 11), "zstd": (1, 3, 9, 19)}
+
+
+def compress(encoding: str, level: int, body: bytes, chunk_size: int) -> tuple[int, float]:
+    compressor = COMPRESSORS[encoding](level)
+    size = 0
+    start = time.process_time()
+    view = memoryview(body)
+    for offset in range(0, len(view), chunk_size):
+        size += len(compressor.compress(view[offset:offset + chunk_size]))
+    size += len(compressor.finish())
+    return size, time.process_time() - start
+
+
+def payloads(sizes: list[int]) -> dict[str, bytes]:
+    bodies = {}
+    for size in sizes:
+        fallbacks = Corpus(payload_items=size).fallbacks
+        bodies[f"images x{size}"] = json.dumps(fallbacks["list[Image]"]).encode()
+        bodies[f"offer x{size}"] = json.dumps(fallbacks["Offer"]).encode()
+    app3 = load_module(APP_DIRS[2])
+    bodies["app 3 page"] = json.dumps(app3.query_store(app3.FilterParams(limit=100))).encode()
+    return bodies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare compressed size and CPU time by encoding and level")
+    parser.add_argument("--items", nargs="*", type=int, default=[100, 1_000, 10_000, 100_000],
+                        help="images in the list[Image] body and items in the Offer body")
+    parser.add_argument("--chunk-size", type=int, default=64 << 10)
+    args = parser.parse_args()
+
+    encodings = available_encodings()
+    missing = [encoding for encoding in LEVELS if encoding not in encodings]
+    print(f"encodings: {', '.join(encodings)}" + (f" ({', '.join(missing)} not installed)" if missing else ""))
+    print(f"{'payload':<14} {'bytes':>11} {'encoding':>8} {'level':>5} {'compressed':>11} {'ratio':>7} "
+          f"{'cpu ms':>9} {'MB/s':>8}")
+    for name, body in payloads(args.items).items():
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                size, cpu = compress(encoding, level, body, args.chunk_size)
+                throughput = len(body) / cpu / 1e6 if cpu else float("inf")
+                print(f"{name:<14} {len(body):>11,} {encoding:>8} {level:>5} {size:>11,} {len(body) / size:>7.1f} "
+                      f"{cpu * 1000:>9.2f} {throughput:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
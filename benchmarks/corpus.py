@@ -0,0 +1,229 @@
+"""
+Request corpus for the benchmarks: one realistic request for every route of every exercise app.
+
+The bodies come from the examples that already document the apps. First the JSON example written in the endpoint
+docstring ("Expected body example: {...}"), then the examples declared with Body(examples=...), openapi_examples,
+json_schema_extra or Field(examples=...), and only when a route has none of those, a body assembled from the docstring
+examples of the other routes (e.g. an Offer is built from the update_item_nested payload).
+
+Path parameters are SAMPLE_ITEM_ID, except those naming a resource the app creates with a generated ID (a stored offer,
+a job, a weight vector): the benchmark creates one first with the request of `setup_requests` and fills in the `id` of
+its response. The routes deleting such a resource are left out, only their first request would find it.
+"""
+import json
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Any, get_args, get_origin
+
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from common.apps import APP_DIRS, app_number, load_module
+
+SAMPLE_ITEM_ID = 5
+
+QUERY_PARAMS: dict[tuple[int, str], list[tuple[str, str]]] = {
+    (1, "/items/"): [("q", "fixedquery")],
+    (1, "/items/list/"): [("q", "foo"), ("q", "bar")],
+    (1, "/items/alias/"): [("item-query", "foobaritems")],
+    (1, "/items/custom_validation/"): [("id", "isbn-9781529046137")],
+    (2, "/items/{item_id}"): [("q", "foo")],
+    (3, "/items/"): [("limit", "10"), ("order_by", "updated_at"), ("tags", "rock")],
+    (3, "/items/restricted/"): [("limit", "10")],
+    (4, "/items/{item_id}"): [("q", "foo")],
+    (4, "/items/{item_id}/body_and_query/"): [("q", "foo")],
+}
+
+# Body types without any example, with the fallback body that fits them
+FALLBACK_ALIASES: dict[str, str] = {"ItemNoExample": "Item"}
+
+# Server-Sent Events streams, they only end when the client disconnects
+STREAMING_ROUTES: set[str] = {"/items/changes/"}
+
+# Path parameters naming a resource with a generated ID: the request creating one, as (method, path, query, fallback
+# body), its ID being the `id` of the response
+RESOURCE_SETUP: dict[tuple[int, str], tuple[str, str, list[tuple[str, str]], str]] = {
+    (6, "offer_id"): ("POST", "/offers/", [("mode", "store")], "Offer"),
+    (6, "job_id"): ("POST", "/offers/", [("mode", "async")], "Offer"),
+    (6, "vector_id"): ("POST", "/index-weights/vectors/", [], "dict[int, float]"),
+    (6, "other_id"): ("POST", "/index-weights/vectors/", [], "dict[int, float]"),
+}
+
+# Routes deleting a resource with a generated ID: every request after the first one would be a 404
+ONE_SHOT_ROUTES: set[tuple[int, str, str]] = {
+    (6, "DELETE", "/offers/{offer_id}"),
+    (6, "DELETE", "/offers/{offer_id}/items/{item_id}"),
+    (6, "DELETE", "/index-weights/vectors/{vector_id}"),
+}
+
+# Path parameters other than SAMPLE_ITEM_ID, per route
+PATH_VALUES: dict[tuple[int, str], dict[str, Any]] = {
+    (6, "/offers/{offer_id}/items/{item_id}"): {"item_id": 0},  # The first item of the stored offer
+}
+
+# Routes that read the raw request body themselves, with the fallback body they expect
+RAW_BODIES: dict[tuple[int, str], str] = {
+    (5, "/items/bulk/"): "list[Item]",
+    (6, "/images/multiple/stream/"): "list[Image]",
+}
+
+
+@dataclass
+class RequestSpec:
+    app: int
+    method: str
+    route: str
+    path: str
+    params: list[tuple[str, str]] = field(default_factory=list)
+    json: Any = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.app} {self.method} {self.route}"
+
+    @property
+    def body(self) -> bytes | None:
+        return None if self.json is None else json.dumps(self.json).encode()
+
+
+def docstring_example(endpoint) -> Any:
+    """
+    Returns the first JSON object written in the docstring of an endpoint, or None
+    """
+    doc = endpoint.__doc__ or ""
+    decoder = json.JSONDecoder()
+    start = doc.find("{")
+    while start != -1:
+        try:
+            return decoder.raw_decode(doc, start)[0]
+        except json.JSONDecodeError:
+            start = doc.find("{", start + 1)
+    return None
+
+
+def model_example(model: type[BaseModel]) -> dict | None:
+    """
+    Builds an example from json_schema_extra examples or, failing that, from the examples of every field
+    """
+    extra = model.model_config.get("json_schema_extra")
+    if isinstance(extra, dict) and extra.get("examples"):
+        return deepcopy(extra["examples"][0])
+    fields = model.model_fields
+    if fields and all(info.examples for info in fields.values()):
+        return {name: info.examples[0] for name, info in fields.items()}
+    return None
+
+
+def is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def type_key(annotation) -> str:
+    origin = get_origin(annotation)
+    if origin is None:
+        return getattr(annotation, "__name__", repr(annotation))
+    return f"{origin.__name__}[{', '.join(type_key(arg) for arg in get_args(annotation))}]"
+
+
+class Corpus:
+    """
+    Holds the fallback bodies, which are derived from the docstring examples of apps 4 and 6, and builds a
+    RequestSpec for any route.
+    :param payload_items: how many items an Offer gets and how many images go in a list[Image] body
+    """
+
+    def __init__(self, payload_items: int = 10):
+        app4 = load_module(APP_DIRS[3])
+        app6 = load_module(APP_DIRS[5])
+        single_body = docstring_example(app4.update_item_single_body_param)
+        nested = docstring_example(app6.update_item_nested)
+        images = nested["images"]
+        item = docstring_example(app4.update_item)
+        self.fallbacks: dict[str, Any] = {
+            "Item": {**item, "tags": nested["tags"]},
+            "list[Item]": [{**item, "name": f"{item['name']} {i}"} for i in range(payload_items)],
+            "User": single_body["user"],
+            "int": single_body["importance"],
+            "ItemNested": nested,
+            "Image": images[0],
+            "Offer": {
+                "name": "Offer",
+                "description": "A bundle of items",
+                "price": nested["price"] * payload_items,
+                "items": [{**nested, "name": f"{nested['name']} {i}"} for i in range(payload_items)],
+            },
+            "list[Image]": [images[i % len(images)] for i in range(payload_items)],
+            "dict[int, float]": {str(i): i / payload_items for i in range(payload_items)},
+        }
+
+    def param_example(self, param) -> Any:
+        info = param.field_info
+        if getattr(info, "examples", None):
+            return deepcopy(info.examples[0])
+        if getattr(info, "openapi_examples", None):
+            return deepcopy(next(iter(info.openapi_examples.values()))["value"])
+        annotation = info.annotation
+        if is_model(annotation):
+            example = model_example(annotation)
+            if example is not None:
+                return example
+        key = type_key(annotation)
+        return deepcopy(self.fallbacks[FALLBACK_ALIASES.get(key, key)])
+
+    def body_example(self, app: int, route: APIRoute) -> Any:
+        if (app, route.path) in RAW_BODIES:
+            return deepcopy(self.fallbacks[RAW_BODIES[app, route.path]])
+        params = route.dependant.body_params
+        if not params:
+            return None
+        example = docstring_example(route.endpoint)
+        if example is not None:
+            return example
+        if len(params) == 1 and not getattr(params[0].field_info, "embed", False):
+            return self.param_example(params[0])
+        return {param.alias: self.param_example(param) for param in params}
+
+    def setup_requests(self, dirname: str) -> dict[str, RequestSpec]:
+        """
+        Per path parameter naming a resource with a generated ID, the request creating one
+        """
+        app = app_number(dirname)
+        return {
+            name: RequestSpec(app=app, method=method, route=path, path=path, params=list(params),
+                              json=deepcopy(self.fallbacks[body]))
+            for (setup_app, name), (method, path, params, body) in RESOURCE_SETUP.items() if setup_app == app
+        }
+
+    def request(self, app: int, route: APIRoute, method: str, resources: dict[str, Any] | None = None) -> RequestSpec:
+        """
+        :param resources: the IDs of the resources created with `setup_requests`, by path parameter
+        """
+        path_values = {param.name: SAMPLE_ITEM_ID for param in route.dependant.path_params}
+        path_values.update(PATH_VALUES.get((app, route.path), {}))
+        path_values.update((name, value) for name, value in (resources or {}).items() if name in path_values)
+        params = list(QUERY_PARAMS.get((app, route.path), []))
+        given = {name for name, _ in params}
+        params += [(param.alias, "foo") for param in route.dependant.query_params
+                   if param.field_info.is_required() and param.alias not in given
+                   and not is_model(param.field_info.annotation)]
+        return RequestSpec(
+            app=app,
+            method=method,
+            route=route.path,
+            path=route.path.format(**path_values),
+            params=params,
+            json=self.body_example(app, route) if method in ("POST", "PUT", "PATCH") else None,
+        )
+
+    def for_app(self, dirname: str, resources: dict[str, Any] | None = None) -> list[RequestSpec]:
+        """
+        The requests of every route of the app, writes first so that the reads find something stored
+        :param resources: the IDs of the resources created with `setup_requests`, by path parameter
+        """
+        app, number = load_module(dirname).app, app_number(dirname)
+        specs = [
+            self.request(number, route, method, resources)
+            for route in app.routes if isinstance(route, APIRoute) and route.path not in STREAMING_ROUTES
+            for method in sorted(route.methods) if (number, method, route.path) not in ONE_SHOT_ROUTES
+        ]
+        return sorted(specs, key=lambda spec: spec.method in ("GET", "HEAD", "DELETE"))
@@ -0,0 +1,53 @@
+"""
+Reads of stored items at full occupancy: a dict of items encoded on every GET (jsonable_encoder + JSONResponse, what
+FastAPI does with a returned dict) against the DenseStore, which hands out the JSON rendered at write time.
+
+    python -m benchmarks.dense_store_bench --reads 200000
+"""
+import argparse
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from benchmarks.corpus import Corpus, docstring_example
+from common.apps import APP_DIRS, load_module
+from common.dense_store import DenseStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare dict and dense pre-rendered item reads")
+    parser.add_argument("--reads", type=int, default=200_000)
+    parser.add_argument("--max-id", type=int, default=1000)
+    args = parser.parse_args()
+
+    app4 = load_module(APP_DIRS[3])
+    record = docstring_example(app4.update_item_single_body_param)
+    record["item"] = app4.Item.model_validate(Corpus().fallbacks["Item"])
+    ids = range(args.max_id + 1)
+
+    by_dict = {item_id: {"item_id": item_id, **record} for item_id in ids}
+    dense = DenseStore(low=0, high=args.max_id)
+    start = time.perf_counter()
+    for item_id in ids:
+        dense.put(item_id, {"item_id": item_id, **record})
+    write_us = (time.perf_counter() - start) / len(ids) * 1e6
+
+    reads = [random.randrange(args.max_id + 1) for _ in range(args.reads)]
+    readers = {
+        "dict + encode": lambda item_id: JSONResponse(jsonable_encoder(by_dict[item_id])),
+        "dense pre-rendered": lambda item_id: Response(dense.get_rendered(item_id), media_type="application/json"),
+    }
+    assert readers["dict + encode"](1).body == readers["dense pre-rendered"](1).body
+    print(f"{len(ids)} items stored, {write_us:.1f} us per write to the dense store (includes rendering)")
+    for name, read in readers.items():
+        start = time.perf_counter()
+        for item_id in reads:
+            read(item_id)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {args.reads / elapsed:>12,.0f} reads/s   {elapsed / args.reads * 1e6:6.2f} us/read")
+
+
+if __name__ == "__main__":
+    main()
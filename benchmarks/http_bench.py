@@ -0,0 +1,205 @@
+"""
+HTTP benchmark for every route of the exercise apps.
+
+The apps are driven in-process through httpx's ASGI transport, so what is measured is FastAPI + Pydantic + the
+handlers, without sockets or a server in the way. Every route is hit with its corpus request (see corpus.py) by a
+number of concurrent clients, and the run reports requests per second, p50/p95/p99 latency and the memory allocated per
+request (traced with tracemalloc in a separate, sequential pass so that tracing does not distort the latencies).
+
+Results are written as JSON. Passing a previous result with --baseline compares both runs and exits with status 1 when a
+route got slower than the tolerance allows, e.g.:
+    python -m benchmarks.http_bench --output before.json
+    python -m benchmarks.http_bench --baseline before.json --output after.json
+Two saved results can also be compared without running anything:
+    python -m benchmarks.http_bench --compare before.json after.json
+
+Everything the apps persist (the snapshots, the item log of app 4, the OpenAPI cache of app 7) goes to a temporary
+directory, not next to the apps where their next start would load it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+import httpx
+
+from benchmarks.corpus import Corpus, RequestSpec
+from common.apps import APP_DIRS, load_app, resolve_app_dir
+
+STATE_DIR = Path(tempfile.mkdtemp(prefix="http_bench_state_"))
+os.environ.setdefault("SNAPSHOT_DIR", str(STATE_DIR / "snapshots"))
+os.environ.setdefault("ITEM_STORE_PATH", str(STATE_DIR / "items.log"))
+os.environ.setdefault("OPENAPI_CACHE_DIR", str(STATE_DIR / "openapi_cache"))
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def send(client: httpx.AsyncClient, spec: RequestSpec, body: bytes | None) -> httpx.Response:
+    headers = {"content-type": "application/json"} if body is not None else None
+    return await client.request(spec.method, spec.path, params=spec.params, content=body, headers=headers)
+
+
+async def bench_route(client: httpx.AsyncClient, spec: RequestSpec, requests: int, concurrency: int,
+                      alloc_samples: int) -> dict:
+    body = spec.body
+    for _ in range(min(20, requests)):
+        await send(client, spec, body)
+
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await send(client, spec, body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    allocated: list[int] = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await send(client, spec, body)
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "request_bytes": len(body) if body else 0,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "alloc_bytes_per_request": statistics.mean(allocated) if allocated else 0,
+    }
+
+
+async def run(apps: list[str], route_filter: re.Pattern | None, requests: int, concurrency: int, alloc_samples: int,
+              payload_items: int) -> dict:
+    corpus = Corpus(payload_items=payload_items)
+    results = {}
+    for dirname in apps:
+        app = load_app(dirname)
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+            )
+            resources = {}
+            for name, spec in corpus.setup_requests(dirname).items():
+                response = await send(client, spec, spec.body)
+                response.raise_for_status()
+                resources[name] = response.json()["id"]
+            for spec in corpus.for_app(dirname, resources):
+                if route_filter and not route_filter.search(spec.name):
+                    continue
+                results[spec.name] = await bench_route(client, spec, requests, concurrency, alloc_samples)
+                print(format_row(spec.name, results[spec.name]), flush=True)
+    return results
+
+
+def format_row(name: str, result: dict) -> str:
+    return (
+        f"{name:<55} {result['rps']:>9.0f} req/s  p50 {result['p50_ms']:>7.2f}ms  p95 {result['p95_ms']:>7.2f}ms  "
+        f"p99 {result['p99_ms']:>7.2f}ms  {result['alloc_bytes_per_request'] / 1024:>8.1f} KiB/req"
+        + (f"  {result['errors']} errors" if result["errors"] else "")
+    )
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """
+    Returns a line for every route that got slower than the tolerance allows: fewer requests per second or a higher
+    p95 latency. Routes that only exist in one of the runs are ignored.
+    """
+    regressions = []
+    for name, result in current["routes"].items():
+        before = baseline["routes"].get(name)
+        if before is None:
+            continue
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']:.0f} -> {result['rps']:.0f} req/s")
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: {before['errors']} -> {result['errors']} errors")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--apps", nargs="*", default=APP_DIRS, help="apps to run, by number or directory name")
+    parser.add_argument("--routes", help="only run the routes whose name ('<app> <METHOD> <path>') matches this regex")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--alloc-samples", type=int, default=50, help="requests traced to measure allocations")
+    parser.add_argument("--payload-items", type=int, default=10, help="items per Offer and images per list[Image]")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="fail when this run is slower than the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown against the baseline")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASELINE", "CURRENT"),
+                        help="compare two saved results instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = (json.loads(path.read_text()) for path in args.compare)
+    else:
+        routes = asyncio.run(run(
+            apps=[resolve_app_dir(name) for name in args.apps],
+            route_filter=re.compile(args.routes) if args.routes else None,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            alloc_samples=args.alloc_samples,
+            payload_items=args.payload_items,
+        ))
+        current = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "payload_items": args.payload_items,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "routes": routes,
+        }
+        if args.output:
+            args.output.write_text(json.dumps(current, indent=2))
+        baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+
+    if baseline is None:
+        return 0
+    regressions = compare(baseline, current, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Aggregates of a stored offer of app 6, kept up to date item by item, against recomputing them with a full rescan of the
+items, for offers of growing size.
+
+For each size it reports a full rescan of the items (item by item in Python, and vectorized with NumPy as the first
+build of a stored offer does), the incremental update of an item (add, replace and remove, per operation), and the summary
+read directly and through GET /offers/{offer_id}/summary (in-process).
+
+    python -m benchmarks.offer_summary_bench --items 1000 10000 100000
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+
+import httpx
+
+from common.apps import APP_DIRS, load_module
+from common.offer_store import OfferAggregates
+
+TAGS = [f"tag-{index}" for index in range(200)]
+
+
+def make_items(count: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {"name": f"item {index}", "description": None, "price": round(rng.uniform(1, 500), 2),
+         "tax": rng.choice((None, round(rng.uniform(0, 50), 2))), "tags": set(rng.sample(TAGS, rng.randint(0, 4))),
+         "images": None}
+        for index in range(count)
+    ]
+
+
+def python_build(items: list[dict]) -> OfferAggregates:
+    aggregates = OfferAggregates()
+    for item in items:
+        aggregates.add(item)
+    return aggregates
+
+
+def timed(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def request_time(app, offer_id: str, repeat: int) -> float:
+    best = math.inf
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.get(f"/offers/{offer_id}/summary")
+            best = min(best, time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare incremental offer aggregates with a full rescan")
+    parser.add_argument("--items", nargs="*", type=int, default=[1_000, 10_000, 100_000], help="items per offer")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    module = load_module(APP_DIRS[5])
+    extra = make_items(1_000, seed=1)
+    print(f"{'items':>8} {'rescan py':>10} {'rescan np':>10} {'update':>10} {'summary':>10} {'GET':>10}")
+    for size in args.items:
+        items = make_items(size)
+        rescan_python = timed(lambda: python_build(items), args.repeat)
+        rescan_numpy = timed(lambda: OfferAggregates.from_items(items), args.repeat)
+
+        offer_id = module.offer_store.add({"name": "Offer", "price": 1.0, "items": items})
+        stored = module.offer_store.get(offer_id)
+        start = time.perf_counter()
+        for item in extra:
+            item_id = stored.add_item(item)
+            stored.replace_item(item_id, extra[-1 - item_id % len(extra)])
+            stored.remove_item(item_id)
+        update = (time.perf_counter() - start) / (3 * len(extra)) * 1e6
+
+        summary = timed(stored.aggregates.summary, args.repeat * 100)
+        request = asyncio.run(request_time(module.app, offer_id, args.repeat * 10))
+        module.offer_store.remove(offer_id)
+        print(f"{size:>8,} {rescan_python:>8.2f}ms {rescan_numpy:>8.2f}ms {update:>8.2f}us {summary:>8.3f}ms "
+              f"{request:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Cold start of the OpenAPI schema of app 7: generated by FastAPI against read from the on-disk cache.
+
+Every measure runs in a fresh interpreter, so nothing is warm: the app is imported, then the time to get the schema
+bytes is measured, either with `app.openapi()` + json.dumps (what FastAPI does on the first /openapi.json request) or
+through the cache (hashing the route and model definitions, then reading the file).
+    python -m benchmarks.openapi_bench --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common.apps import ROOT
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+from common.apps import load_module, resolve_app_dir
+module = load_module(resolve_app_dir("7"))
+imported = time.perf_counter()
+if sys.argv[1] == "generate":
+    body = json.dumps(module.app.openapi()).encode()
+else:
+    module.openapi_cache.cache_dir = __import__("pathlib").Path(sys.argv[2])
+    body = module.openapi_cache.load_or_build()
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "schema_ms": (done - imported) * 1000, "bytes": len(body)}))
+"""
+
+
+def measure(mode: str, cache_dir: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE, mode, cache_dir], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare generating and loading the cached OpenAPI schema")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        measure("cached", cache_dir)  # Writes the cache file
+        for mode in ("generate", "cached"):
+            runs = [measure(mode, cache_dir) for _ in range(args.runs)]
+            print(f"{mode:<9} import {statistics.median(run['import_ms'] for run in runs):8.1f} ms   "
+                  f"schema {statistics.median(run['schema_ms'] for run in runs):8.1f} ms   "
+                  f"({runs[0]['bytes']:,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
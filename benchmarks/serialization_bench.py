@@ -0,0 +1,53 @@
+"""
+Response serialization of nested Offer payloads: FastAPI's default path (jsonable_encoder, then JSONResponse) against
+the fast_json_response modes, which render straight from the models.
+
+    python -m benchmarks.serialization_bench --items 10 100 1000 10000
+"""
+import argparse
+import math
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.corpus import Corpus
+from common.apps import APP_DIRS, load_module
+from common.responses import ORJSONModelResponse, PydanticJSONResponse
+
+
+def timed(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare JSON serialization paths for Offer responses")
+    parser.add_argument("--items", nargs="*", type=int, default=[10, 100, 1_000, 10_000], help="items per Offer")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    Offer = load_module(APP_DIRS[5]).Offer
+    paths = {
+        "default": lambda offer: JSONResponse(jsonable_encoder(offer)),
+        "pydantic": PydanticJSONResponse,
+        "orjson": ORJSONModelResponse,
+    }
+    print(f"{'items':>7} {'bytes':>11} " + " ".join(f"{name:>12}" for name in paths) + "   speedup")
+    for size in args.items:
+        offer = Offer.model_validate(Corpus(payload_items=size).fallbacks["Offer"])
+        bodies = {name: render(offer).body for name, render in paths.items()}
+        assert bodies["pydantic"] == bodies["default"], "the fast path must render the same JSON"
+        times = {name: timed(lambda: render(offer), args.repeat) for name, render in paths.items()}
+        fastest = min(times["pydantic"], times["orjson"])
+        print(f"{size:>7} {len(bodies['default']):>11,} "
+              + " ".join(f"{times[name]:>10.2f}ms" for name in paths)
+              + f"   x{times['default'] / fastest:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Startup of the state the apps hold server-side, reloaded from JSON against opened from a snapshot (common/snapshot.py):
+the catalog of app 1 (from a JSON object of IDs and names), the items of app 4 (from its write-behind log, each item
+written several times) and the weight vectors of app 6 (from a JSON object of vectors).
+
+Each load runs in a fresh process. Reported: the time until the state is ready, the time of a few random reads right
+after (from the mapped pages, the first reads fetch them from the page cache), and the anonymous memory the process
+grew by. Anonymous memory is the private copy each worker pays for; the pages of a snapshot are file-backed instead,
+one copy in the page cache whatever the number of workers mapping it.
+
+    python -m benchmarks.snapshot_bench --catalog 1000000 --items 200000 --weights 8 250000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from common.catalog import Catalog, MappedCatalog
+from common.snapshot import Snapshot, write_snapshot
+from common.weights import WeightStore, WeightVector
+from common.write_behind import WriteBehindStore
+
+PREFIXES = ("isbn-", "imdb-")
+PROBES = 1_000
+
+
+def anonymous_memory() -> int:
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            if line.startswith("Anonymous:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def build(directory: Path, args: argparse.Namespace) -> dict[str, list]:
+    """
+    Writes the JSON sources and the snapshots, returns the keys the reads probe
+    """
+    rng = random.Random(0)
+    ids = {f"isbn-{rng.randrange(10 ** 13):013d}" for _ in range(args.catalog)}
+    data = {id: f"Book {index % 10_000}" for index, id in enumerate(ids)}
+    (directory / "catalog.json").write_text(json.dumps(data))
+    catalog = Catalog(PREFIXES, entries=data.items())
+    catalog_sections, catalog_meta = catalog.snapshot_sections("catalog", catalog.snapshot_state())
+
+    log = directory / "items.log"
+    with open(log, "w") as file:
+        for version in range(args.item_versions):
+            for item_id in range(args.items):
+                record = {"item": {"name": f"Item {item_id}", "description": None, "price": 9.5 + version,
+                                   "tax": None}, "user": {"username": "dave", "full_name": None}, "importance": 5}
+                file.write(json.dumps({"id": item_id, "data": record}, separators=(",", ":")) + "\n")
+    store = WriteBehindStore(log)
+    asyncio.run(store.start())  # Replays the log, as the snapshot command does
+    items_sections, items_meta = store.snapshot_sections("items", store.snapshot_state())
+
+    vectors, size = args.weights
+    weights = WeightStore()
+    weights_json = {}
+    for _ in range(vectors):
+        mapping = {rng.randrange(10 * size): rng.random() for _ in range(size)}
+        weights_json[weights.add(WeightVector.from_mapping(mapping))] = mapping
+    (directory / "weights.json").write_text(json.dumps(weights_json))
+    weights_sections, weights_meta = weights.snapshot_sections("weights", weights.snapshot_state())
+
+    write_snapshot(directory / "state.snapshot", catalog_sections | items_sections | weights_sections,
+                   {"catalog": catalog_meta, "items": items_meta, "weights": weights_meta})
+    return {"catalog": rng.sample(sorted(data), PROBES), "items": [rng.randrange(args.items) for _ in range(PROBES)],
+            "weights": list(weights_json)}
+
+
+def load(directory: str, kind: str, source: str, probes: list) -> tuple[float, float, int]:
+    """
+    Runs in a fresh process: loads one kind of state from one source, then reads it
+    :return: the load time and the mean read time in seconds, and the anonymous memory the process grew by
+    """
+    directory = Path(directory)
+    memory = anonymous_memory()
+    start = time.perf_counter()
+    snapshot = Snapshot(directory / "state.snapshot") if source == "snapshot" else None
+    if kind == "catalog":
+        if snapshot is None:
+            state = Catalog(PREFIXES, entries=json.loads((directory / "catalog.json").read_text()).items())
+        else:
+            state = MappedCatalog(snapshot, "catalog")
+        read = state.get
+    elif kind == "items":
+        state = WriteBehindStore(directory / "items.log")
+        if snapshot is not None:
+            state.load_snapshot(snapshot, "items")
+        asyncio.run(state.start())
+        read = state.get
+    else:
+        state = WeightStore()
+        if snapshot is None:
+            for vector_id, mapping in json.loads((directory / "weights.json").read_text()).items():
+                mapping = {int(key): value for key, value in mapping.items()}
+                state._vectors[vector_id] = WeightVector.from_mapping(mapping)
+        else:
+            state.load_snapshot(snapshot, "weights")
+        read = lambda vector_id: state.get(vector_id).top_k(10)
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in probes:
+        read(key)
+    return loaded, (time.perf_counter() - start) / len(probes), anonymous_memory() - memory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare reloading state from JSON with opening a snapshot")
+    parser.add_argument("--catalog", type=int, default=1_000_000, help="catalog entries")
+    parser.add_argument("--items", type=int, default=200_000, help="items in the log")
+    parser.add_argument("--item-versions", type=int, default=3, help="lines per item in the log")
+    parser.add_argument("--weights", nargs=2, type=int, default=[8, 250_000], metavar=("VECTORS", "SIZE"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        probes = build(Path(directory), args)
+        sizes = {path.name: path.stat().st_size for path in Path(directory).iterdir()}
+        print(", ".join(f"{name}: {size / 1e6:.1f}MB" for name, size in sorted(sizes.items())))
+        print(f"{'state':<9} {'source':<9} {'ready':>10} {'read':>10} {'anon mem':>10}")
+        for kind in ("catalog", "items", "weights"):
+            for source in ("json", "snapshot"):
+                # A new process each time, nothing is loaded or imported yet but the modules
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    loaded, read, memory = pool.submit(load, directory, kind, source, probes[kind]).result()
+                print(f"{kind:<9} {source:<9} {loaded * 1000:>8.1f}ms {read * 1e6:>8.2f}us {memory / 1e6:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Memory and query time of the tag index of app 6 against items holding their own set[str] of tags, on a synthetic
+catalog where a few tags are on most items and most tags are rare (Zipf-distributed).
+
+The memory of the sets is measured on a sample of the items and scaled. The queries are timed on the bitmaps and,
+for reference, as a Python scan over the sets of every item.
+
+    python -m benchmarks.tag_index_bench --items 1000000 --tags 5000 --tags-per-item 4
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from common.tag_index import TagIndex, parse_tag_query
+
+QUERIES = [
+    "tag-0",
+    "tag-0 AND tag-1",
+    "tag-0 AND tag-1 AND tag-2",
+    "tag-0 OR tag-5 OR tag-50",
+    "tag-1 AND NOT tag-0",
+    "(tag-2 OR tag-3) AND NOT (tag-0 OR tag-1)",
+    "tag-100 AND tag-3",
+    "NOT tag-0",
+]
+
+
+def make_catalog(items: int, tags: int, tags_per_item: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, tags + 1)
+    tag_ids = rng.choice(tags, size=items * tags_per_item, p=weights / weights.sum()).astype(np.uint32)
+    item_ids = np.repeat(np.arange(items, dtype=np.uint32), tags_per_item)
+    pairs = np.unique(np.stack([item_ids, tag_ids], axis=1), axis=0)  # Drops the tags drawn twice for an item
+    return pairs[:, 0], pairs[:, 1]
+
+
+def set_bytes(tag_set: set[str]) -> int:
+    return sys.getsizeof(tag_set) + sum(sys.getsizeof(tag) for tag in tag_set)
+
+
+def evaluate(node: tuple, tags: set[str]) -> bool:
+    kind = node[0]
+    if kind == "tag":
+        return node[1] in tags
+    if kind == "not":
+        return not evaluate(node[1], tags)
+    if kind == "and":
+        return evaluate(node[1], tags) and evaluate(node[2], tags)
+    return evaluate(node[1], tags) or evaluate(node[2], tags)
+
+
+def timed(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the tag bitmap index with per-item tag sets")
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=5_000)
+    parser.add_argument("--tags-per-item", type=int, default=4)
+    parser.add_argument("--memory-sample", type=int, default=100_000)
+    parser.add_argument("--scan", type=int, default=200_000, help="items scanned by the set baseline (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    item_ids, tag_ids = make_catalog(args.items, args.tags, args.tags_per_item)
+    index = TagIndex()
+    for tag in range(args.tags):
+        index.interner.intern(f"tag-{tag}")
+    start = time.perf_counter()
+    index.bulk_load(item_ids, tag_ids)
+    print(f"built the index of {len(index):,} items and {len(item_ids):,} tags in {time.perf_counter() - start:.2f}s")
+
+    # Sets as FastAPI would give them: new string objects for every item
+    split = np.flatnonzero(np.diff(item_ids)) + 1
+    groups = np.split(tag_ids, split)[:max(args.memory_sample, args.scan)]
+    sets = [{f"tag-{tag}" for tag in group.tolist()} for group in groups]
+    sample = sets[:args.memory_sample]
+    sets_bytes = sum(set_bytes(tag_set) for tag_set in sample) / len(sample) * len(index)
+    # The index keeps a tuple of tag IDs per item
+    tuples_bytes = sum(sys.getsizeof((0,) * len(tag_set)) for tag_set in sample) / len(sample)
+    index_bytes = index.stats()["bitmap_bytes"] + tuples_bytes * len(index)
+    print(f"set[str] per item: {sets_bytes / 1e6:,.1f} MB   interned index: {index_bytes / 1e6:,.1f} MB "
+          f"(bitmaps {index.stats()['bitmap_bytes'] / 1e6:,.1f} MB)")
+
+    scanned = sets[:args.scan]
+    print(f"{'query':<45} {'matches':>10} {'bitmaps':>10} {'set scan':>12}")
+    for query in QUERIES:
+        matches = len(index.query(query))
+        bitmaps = timed(lambda: index.query(query), args.repeat)
+        tree = parse_tag_query(query)
+        if scanned:
+            scan = timed(lambda: [tags for tags in scanned if evaluate(tree, tags)], 1) * len(index) / len(scanned)
+            scan_text = f"{scan:>10.1f}ms"
+        else:
+            scan_text = f"{'-':>12}"
+        print(f"{query:<45} {matches:>10,} {bitmaps:>8.2f}ms {scan_text}")
+    if scanned and len(scanned) < len(index):
+        print(f"(the set scan is timed on {len(scanned):,} items and scaled)")
+
+
+if __name__ == "__main__":
+    main()
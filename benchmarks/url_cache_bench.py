@@ -0,0 +1,109 @@
+"""
+Validation time and memory of an Offer of app 6 with many images, its image URLs validated through the URL cache of
+app 6 against a plain HttpUrl, as the number of distinct URLs among the images goes down.
+
+For each ratio the Offer is validated with the plain models (same fields, `url: HttpUrl`), with the cache cleared
+before every run (cold, only the repeats within the Offer hit) and with the cache filled by a previous Offer (warm, as
+in a catalog whose URLs come back request after request). The memory is what the validated Offer keeps, traced.
+
+    python -m benchmarks.url_cache_bench --images 10000 --distinct 10000 2000 500 50
+"""
+import argparse
+import math
+import random
+import time
+import tracemalloc
+
+from pydantic import BaseModel, HttpUrl
+
+from common.apps import APP_DIRS, load_module
+
+
+class PlainImage(BaseModel):
+    url: HttpUrl
+    name: str
+
+
+class PlainItem(BaseModel):
+    name: str
+    description: str | None = None
+    price: float
+    tax: float | None = None
+    tags: set[str] = set()
+    images: list[PlainImage] | None = None
+
+
+class PlainOffer(BaseModel):
+    name: str
+    description: str | None = None
+    price: float
+    items: list[PlainItem]
+
+
+def make_offer(images: int, per_item: int, distinct: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    urls = [f"https://cdn.example.com/catalog/{index // 100:04d}/{index:06d}-large.jpg" for index in range(distinct)]
+    items = [
+        {"name": f"item {item}", "price": 9.99, "tags": ["catalog"], "images": [
+            {"url": rng.choice(urls), "name": f"image {item}-{image}"} for image in range(per_item)
+        ]}
+        for item in range(math.ceil(images / per_item))
+    ]
+    return {"name": "Offer", "price": 99.0, "items": items}
+
+
+def timed(function, repeat: int, before=None) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def retained(function) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    size = tracemalloc.get_traced_memory()[0] - before  # While the result is still alive
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare cached and plain HttpUrl validation of Offer images")
+    parser.add_argument("--images", type=int, default=10_000)
+    parser.add_argument("--per-item", type=int, default=10, help="images per item of the Offer")
+    parser.add_argument("--distinct", nargs="*", type=int, default=[10_000, 2_000, 500, 50],
+                        help="distinct URLs among the images")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    module = load_module(APP_DIRS[5])
+    cache = module.image_url_cache
+    print(f"{'distinct':>9} {'dup':>6} {'plain':>10} {'cold':>10} {'warm':>10} {'hit rate':>9} {'saved':>10} "
+          f"{'plain mem':>10} {'warm mem':>10}")
+    for distinct in args.distinct:
+        offer = make_offer(args.images, args.per_item, distinct)
+        plain = timed(lambda: PlainOffer.model_validate(offer), args.repeat)
+        cold = timed(lambda: module.Offer.model_validate(offer), args.repeat, before=cache.clear)
+
+        cache.clear()
+        module.Offer.model_validate(make_offer(args.images, args.per_item, distinct, seed=1))  # Fills the cache
+        hits, misses, saved = cache.hits, cache.misses, cache.bytes_saved
+        module.Offer.model_validate(offer)
+        hit_rate = (cache.hits - hits) / (cache.hits - hits + cache.misses - misses)
+        saved = cache.bytes_saved - saved
+        warm = timed(lambda: module.Offer.model_validate(offer), args.repeat)
+
+        plain_memory = retained(lambda: PlainOffer.model_validate(offer))
+        warm_memory = retained(lambda: module.Offer.model_validate(offer))
+        print(f"{distinct:>9,} {args.images / distinct:>5.0f}x {plain:>8.2f}ms {cold:>8.2f}ms {warm:>8.2f}ms "
+              f"{hit_rate:>8.1%} {saved / 1e6:>8.2f}MB {plain_memory / 1e6:>8.2f}MB {warm_memory / 1e6:>8.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
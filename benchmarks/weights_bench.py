@@ -0,0 +1,97 @@
+"""
+Weight vectors: the dict[int, float] that /index-weights/ receives against the array-backed WeightVector.
+
+For each size it reports the memory held per entry (traced with tracemalloc while the structure is built) and the time
+of each operation, implemented on plain dicts the way a handler would do it and with the vectorized WeightVector:
+    python -m benchmarks.weights_bench --sizes 1000 100000 1000000
+"""
+import argparse
+import heapq
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from common.weights import WeightVector
+
+
+def dict_normalize(weights: dict[int, float]) -> dict[int, float]:
+    norm = math.sqrt(sum(value * value for value in weights.values())) or 1.0
+    return {key: value / norm for key, value in weights.items()}
+
+
+def dict_top_k(weights: dict[int, float], k: int) -> list[tuple[int, float]]:
+    return heapq.nlargest(k, weights.items(), key=lambda entry: entry[1])
+
+
+def dict_dot(weights: dict[int, float], other: dict[int, float]) -> float:
+    if len(other) < len(weights):
+        weights, other = other, weights
+    return sum(value * other[key] for key, value in weights.items() if key in other)
+
+
+def dict_merge(weights: dict[int, float], other: dict[int, float]) -> dict[int, float]:
+    merged = dict(weights)
+    for key, value in other.items():
+        merged[key] = merged.get(key, 0.0) + value
+    return merged
+
+
+def traced(build):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def timed(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(size: int, repeat: int) -> None:
+    rng = random.Random(size)
+    keys = rng.sample(range(size * 10), size)
+    pairs = [(key, rng.random()) for key in keys]
+    other_pairs = [(key, rng.random()) for key in rng.sample(range(size * 10), size)]
+
+    # Built from a JSON body like the endpoint receives, so the boxed ints and floats are new objects owned by the dict
+    body = json.dumps({str(key): value for key, value in pairs})
+    weights, dict_bytes = traced(lambda: {int(key): value for key, value in json.loads(body).items()})
+    other = dict(other_pairs)
+    vector, vector_bytes = traced(lambda: WeightVector.from_mapping(weights))
+    other_vector = WeightVector.from_mapping(other)
+
+    print(f"\n{size:,} keys")
+    print(f"  memory      dict {dict_bytes / size:8.1f} B/entry   arrays {vector_bytes / size:8.1f} B/entry")
+    operations = [
+        ("build", lambda: dict(pairs), lambda: WeightVector.from_mapping(weights)),
+        ("normalize", lambda: dict_normalize(weights), lambda: vector.normalized("l2")),
+        ("top-100", lambda: dict_top_k(weights, 100), lambda: vector.top_k(100)),
+        ("dot", lambda: dict_dot(weights, other), lambda: vector.dot(other_vector)),
+        ("merge", lambda: dict_merge(weights, other), lambda: vector.merged(other_vector, "sum")),
+    ]
+    for name, with_dict, with_vector in operations:
+        dict_ms, vector_ms = timed(with_dict, repeat), timed(with_vector, repeat)
+        print(f"  {name:<10}  dict {dict_ms:8.2f} ms        arrays {vector_ms:8.2f} ms   x{dict_ms / vector_ms:6.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare dict-backed and array-backed weight vectors")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
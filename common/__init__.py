@@ -0,0 +1,4 @@
+"""
+Code shared by the exercise apps: the apps themselves stay small tutorial files, and anything that more than one of
+them needs (stores, middlewares, helpers to load them) lives here.
+"""
@@ -0,0 +1,230 @@
+"""
+Admission control: rejecting requests early, with 503 and Retry-After, when the process is overloaded.
+
+Every handler runs on the event loop, so a few heavy requests (validating a big nested Offer, a long list of images)
+delay all the others: queueing more of them only makes every request slower. The middleware watches two signals:
+    - the event loop lag, how late a task that sleeps `interval` seconds wakes up. It is measured continuously by a
+      background task, and a loop that is late right now (the monitor is overdue) counts as lagging already
+    - the requests in flight, per lane and per route
+and rejects a request before reading its body when its lane is over its thresholds.
+
+Routes are put in lanes by AdmissionRules, the first matching rule wins. Each lane has its own limits, so cheap reads
+can be given a priority lane with loose limits while bulk writes get a strict one: under load, the bulk requests are
+turned away first and the cheap ones keep their latency. The counters are served by `stats()`.
+
+`lanes_from_env()` gives the lanes the apps use, "priority" for reads, "default", and "bulk" for heavy writes. A bulk
+request blocks the loop for as long as its validation takes, so the bulk lane runs one at a time and only while the
+loop keeps up (10ms of lag): that time is all the reads can wait for. Even a client sending bulk requests one after
+the other is paced, it is told to retry once the loop caught up. The thresholds come from the environment
+(ADMISSION_PRIORITY_MAX_LAG_MS, ADMISSION_MAX_LAG_MS, ADMISSION_BULK_MAX_LAG_MS and ADMISSION_BULK_MAX_IN_FLIGHT).
+
+Those limits are meant for a server under load, where shedding the bulk writes keeps the reads fast: a benchmark or a
+client sending its writes back to back would mostly get 503s. So the middleware is opt-in, ADMISSION_CONTROL=1 turns
+it on.
+"""
+import asyncio
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+
+from starlette.routing import compile_path, get_route_path
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+@dataclass
+class Lane:
+    """
+    :param max_lag: event loop lag (seconds) above which the requests of the lane are rejected, None for no limit
+    :param max_in_flight: requests of the lane handled at once, None for no limit
+    :param retry_after: seconds the rejected clients are told to wait
+    """
+    name: str
+    max_lag: float | None = None
+    max_in_flight: int | None = None
+    retry_after: int = 1
+
+
+@dataclass
+class AdmissionRule:
+    """
+    :param path: route path, with the same {param} syntax as the routes ('{path:path}' matches anything)
+    :param methods: the methods the rule applies to, all of them when None
+    :param max_in_flight: requests of this route handled at once, on top of the limit of the lane
+    """
+    path: str
+    lane: str
+    methods: frozenset[str] | None = None
+    max_in_flight: int | None = None
+
+    def __post_init__(self):
+        self.regex = compile_path(self.path)[0]
+        if self.methods is not None:
+            self.methods = frozenset(method.upper() for method in self.methods)
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.methods is None or method in self.methods) and self.regex.match(path) is not None
+
+
+class LagMonitor:
+    """
+    Measures how late the event loop runs a task that sleeps `interval` seconds. `lag` is a decaying maximum of the
+    recent measures, so that a single long block is still seen for a little while
+    """
+
+    def __init__(self, interval: float = 0.02, decay: float = 0.8):
+        self.interval = interval
+        self.decay = decay
+        self.last_lag = 0.0
+        self._lag = 0.0
+        self._expected: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def lag(self) -> float:
+        overdue = 0.0
+        if self._expected is not None:
+            overdue = asyncio.get_running_loop().time() - self._expected
+        return max(self._lag, overdue)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - self._expected)
+            self._lag = max(self.last_lag, self._lag * self.decay)
+
+
+def lanes_from_env() -> list[Lane]:
+    env = os.environ.get
+    return [
+        Lane("priority", max_lag=float(env("ADMISSION_PRIORITY_MAX_LAG_MS", "1000")) / 1000),
+        Lane("default", max_lag=float(env("ADMISSION_MAX_LAG_MS", "200")) / 1000),
+        Lane("bulk", max_lag=float(env("ADMISSION_BULK_MAX_LAG_MS", "10")) / 1000,
+             max_in_flight=int(env("ADMISSION_BULK_MAX_IN_FLIGHT", "1")), retry_after=2),
+    ]
+
+
+def admission_enabled() -> bool:
+    return os.environ.get("ADMISSION_CONTROL", "0") == "1"
+
+
+@dataclass
+class _Counters:
+    in_flight: int = 0
+    outcomes: Counter = field(default_factory=Counter)
+
+
+class AdmissionController:
+    """
+    :param lanes: the lanes the rules refer to
+    :param rules: route -> lane, the first matching rule wins
+    :param default_lane: the lane of the routes no rule matches
+    """
+
+    def __init__(self, lanes: list[Lane], rules: list[AdmissionRule], default_lane: str = "default",
+                 monitor: LagMonitor | None = None):
+        self.lanes = {lane.name: lane for lane in lanes}
+        unknown = {rule.lane for rule in rules} - set(self.lanes) | ({default_lane} - set(self.lanes))
+        if unknown:
+            raise ValueError(f"Unknown lanes {', '.join(sorted(unknown))}")
+        self.rules = rules
+        self.default_lane = default_lane
+        self.monitor = monitor or LagMonitor()
+        self.in_flight = 0
+        self._lanes = {name: _Counters() for name in self.lanes}
+        self._routes: dict[str, _Counters] = {}
+
+    def match(self, method: str, path: str) -> AdmissionRule | None:
+        return next((rule for rule in self.rules if rule.matches(method, path)), None)
+
+    def rejection(self, lane: Lane, rule: AdmissionRule | None) -> str | None:
+        """
+        Why a request of `lane` (and `rule`) can't be admitted right now, None when it can
+        """
+        if lane.max_in_flight is not None and self._lanes[lane.name].in_flight >= lane.max_in_flight:
+            return f"too many requests in flight in the {lane.name} lane"
+        if (rule is not None and rule.max_in_flight is not None
+                and self._routes[rule.path].in_flight >= rule.max_in_flight):
+            return "too many requests in flight for this route"
+        if lane.max_lag is not None and self.monitor.lag > lane.max_lag:
+            return "the server is overloaded"
+        return None
+
+    def stats(self) -> dict:
+        lag = self.monitor.lag if self.monitor._task is not None else 0.0
+        return {
+            "lag_ms": lag * 1000,
+            "in_flight": self.in_flight,
+            "lanes": {name: {"in_flight": counters.in_flight, **counters.outcomes}
+                      for name, counters in self._lanes.items()},
+            "routes": {path: {"in_flight": counters.in_flight, **counters.outcomes}
+                       for path, counters in self._routes.items()},
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Add it last (outermost) with `app.add_middleware(AdmissionMiddleware, controller=controller)`, so that rejected
+    requests cost as little as possible
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        controller = self.controller
+        controller.monitor.ensure_started()
+        rule = controller.match(scope["method"], get_route_path(scope))
+        lane = controller.lanes[rule.lane if rule is not None else controller.default_lane]
+        lane_counters = controller._lanes[lane.name]
+        route_counters = None
+        if rule is not None:
+            route_counters = controller._routes.get(rule.path)
+            if route_counters is None:
+                route_counters = controller._routes[rule.path] = _Counters()
+
+        reason = controller.rejection(lane, rule)
+        if reason is not None:
+            lane_counters.outcomes["rejected"] += 1
+            if route_counters is not None:
+                route_counters.outcomes["rejected"] += 1
+            await self._reject(scope, send, reason, lane.retry_after)
+            return
+
+        controller.in_flight += 1
+        lane_counters.outcomes["admitted"] += 1
+        lane_counters.in_flight += 1
+        if route_counters is not None:
+            route_counters.outcomes["admitted"] += 1
+            route_counters.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
+            lane_counters.in_flight -= 1
+            if route_counters is not None:
+                route_counters.in_flight -= 1
+
+    @staticmethod
+    async def _reject(scope: Scope, send: Send, reason: str, retry_after: int) -> None:
+        body = json.dumps({"detail": f"Service unavailable: {reason}, retry later"}).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ]
+        # The request body is not read: closing the connection spares the server from receiving it
+        if any(name in (b"content-length", b"transfer-encoding") and value != b"0" for name, value in scope["headers"]):
+            headers.append((b"connection", b"close"))
+        await send({"type": "http.response.start", "status": 503, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
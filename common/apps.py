@@ -0,0 +1,70 @@
+"""
+Helpers to find and import the exercise apps.
+
+Every exercise lives in its own numbered directory with a `main.py` that defines `app`. Those directories are not
+Python packages (their names start with a digit), so they are imported by file path, each one under its own module
+name, which also lets several of them live in the same process.
+"""
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+from fastapi import FastAPI
+
+ROOT = Path(__file__).resolve().parent.parent
+
+APP_DIRS: list[str] = sorted(
+    (path.name for path in ROOT.iterdir() if path.is_dir() and path.name[:1].isdigit() and (path / "main.py").exists()),
+    key=lambda name: int(name.split("_", 1)[0]),
+)
+
+
+def app_number(dirname: str) -> int:
+    return int(dirname.split("_", 1)[0])
+
+
+def app_slug(dirname: str) -> str:
+    """
+    The directory name without its number, e.g. '6_body_nested_models' -> 'body-nested-models'
+    """
+    return dirname.split("_", 1)[1].replace("_", "-")
+
+
+def resolve_app_dir(name: str) -> str:
+    """
+    Accepts any of the usual ways of naming an exercise app: its number ('6'), its directory ('6_body_nested_models'),
+    its slug ('body-nested-models') or a path/import string ('6_body_nested_models/main.py', '6_body_nested_models.main:app')
+    :param name:
+    :return: the directory name of the app
+    """
+    candidate = name.split(":", 1)[0].removesuffix(".main").removesuffix("/main.py").strip("/")
+    for dirname in APP_DIRS:
+        if candidate in (dirname, str(app_number(dirname)), app_slug(dirname)):
+            return dirname
+    raise ValueError(f"Unknown exercise app {name!r}, expected one of {', '.join(APP_DIRS)}")
+
+
+def load_module(dirname: str) -> ModuleType:
+    """
+    Imports `<dirname>/main.py` as `exercise_<number>_main`. The module is cached in `sys.modules`, so loading the same
+    app twice returns the same module (and the same `app`).
+    """
+    module_name = f"exercise_{app_number(dirname)}_main"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    spec = importlib.util.spec_from_file_location(module_name, ROOT / dirname / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def load_app(name: str) -> FastAPI:
+    return load_module(resolve_app_dir(name)).app
@@ -0,0 +1,220 @@
+"""
+MessagePack and CBOR bodies and responses, next to JSON, for the same models.
+
+For service-to-service calls, decoding big JSON bodies is a large share of the cost of a request, the binary formats
+are more compact and cheaper to decode. A route using BinaryFormatRoute accepts a body sent with
+`Content-Type: application/msgpack` (or `application/cbor`) and answers in that format when the client's Accept header
+prefers it. The JSON stays the default, and the formats are only offered when their package (`msgpack`, `cbor2`) is
+installed.
+
+The body is decoded, then checked to hold nothing but the values `json.loads` could give (dicts with string keys, lists,
+strings, numbers, booleans and None): the byte strings, CBOR tags, dates, MessagePack extension types... the formats can
+carry besides are rejected with a 422 naming where they are. The body is then handed to FastAPI as if it had been
+decoded from JSON, so it goes through exactly the same validation: an HttpUrl is still checked, tags still become a
+set[str], Body(gt=0) still rejects 0. Responses are encoded from what FastAPI would have encoded as JSON. An endpoint
+that builds its own JSON response (e.g. with FAST_JSON_RESPONSES) has its response transcoded. Errors (422, 404...)
+stay in JSON.
+
+Install it after `instrument`, for the routes that should accept the formats:
+    enable_binary_formats(app, paths={"/offers/"})
+"""
+import json
+from collections.abc import Callable, Collection
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import FastAPI, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+from common.compression import negotiate
+from common.routing import extend_route_class
+
+
+@dataclass(frozen=True)
+class BinaryFormat:
+    name: str
+    media_type: str
+    aliases: tuple[str, ...]
+    module: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+
+
+def _msgpack_encode(content: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def _msgpack_decode(body: bytes) -> Any:
+    import msgpack
+
+    # Map keys as strings only, like JSON objects
+    return msgpack.unpackb(body, raw=False, strict_map_key=True)
+
+
+def _cbor_encode(content: Any) -> bytes:
+    import cbor2
+
+    return cbor2.dumps(content)
+
+
+def _cbor_decode(body: bytes) -> Any:
+    import cbor2
+
+    return cbor2.loads(body)
+
+
+JSON_SCALARS = (str, bool, int, float, type(None))
+
+
+def _non_json_value(decoded: Any) -> tuple[tuple[str | int, ...], Any] | None:
+    """
+    The location and the value of the first value (or object key) in `decoded` that `json.loads` couldn't give, None
+    when there is none. Walks the values without recursion, the nesting depth being up to the client.
+    """
+    pending = [((), decoded)]
+    while pending:
+        loc, value = pending.pop()
+        if type(value) in JSON_SCALARS:
+            continue
+        if type(value) is list:
+            pending.extend(((*loc, index), item) for index, item in enumerate(value))
+        elif type(value) is dict:
+            for key, item in value.items():
+                if type(key) is not str:
+                    return loc, key
+                pending.append(((*loc, key), item))
+        else:
+            return loc, value
+    return None
+
+
+FORMATS = [
+    BinaryFormat("msgpack", "application/msgpack", ("application/x-msgpack", "application/vnd.msgpack"), "msgpack",
+                 _msgpack_encode, _msgpack_decode),
+    BinaryFormat("cbor", "application/cbor", (), "cbor2", _cbor_encode, _cbor_decode),
+]
+BINARY_MEDIA_TYPES = frozenset(media_type for binary_format in FORMATS
+                               for media_type in (binary_format.media_type, *binary_format.aliases))
+
+
+def available_formats() -> list[BinaryFormat]:
+    formats = []
+    for binary_format in FORMATS:
+        try:
+            __import__(binary_format.module)
+        except ImportError:
+            continue
+        formats.append(binary_format)
+    return formats
+
+
+def binary_response_class(binary_format: BinaryFormat) -> type[Response]:
+    class BinaryResponse(Response):
+        media_type = binary_format.media_type
+
+        def render(self, content: Any) -> bytes:
+            return binary_format.encode(content)
+
+    BinaryResponse.__name__ = f"{binary_format.name.title()}Response"
+    return BinaryResponse
+
+
+class BinaryFormatRoute(APIRoute):
+    """
+    Route class adding the binary formats to the routes of `paths` (all the routes when it is None), install it with
+    `enable_binary_formats`
+    """
+    paths: frozenset[str] | None = None
+    formats: list[BinaryFormat] = []
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if self.paths is not None and self.path not in self.paths:
+            return handler
+        by_media_type = {media_type: binary_format for binary_format in self.formats
+                         for media_type in (binary_format.media_type, *binary_format.aliases)}
+        # One more FastAPI handler per format, identical except for the class its responses are rendered with
+        default_response_class = self.response_class
+        handlers = {}
+        try:
+            for binary_format in self.formats:
+                self.response_class = binary_response_class(binary_format)
+                handlers[binary_format.name] = super().get_route_handler()
+        finally:
+            self.response_class = default_response_class
+        offered = [*by_media_type, "application/json"]
+        has_body = self.body_field is not None
+
+        async def binary_format_handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+            body_format = by_media_type.get(content_type)
+            if body_format is not None and has_body:
+                request = await self._decoded_request(request, body_format)
+            elif content_type in BINARY_MEDIA_TYPES and has_body:
+                return Response(status_code=415, content=json.dumps({"detail": f"{content_type} is not supported"}),
+                                media_type="application/json")
+            accepted = negotiate(request.headers.get("accept", ""), offered)
+            response_format = by_media_type.get(accepted)
+            if response_format is None:
+                return await handler(request)
+            response = await handlers[response_format.name](request)
+            if response.headers.get("content-type", "").startswith("application/json"):
+                response = self._transcoded(response, response_format)
+            response.headers.append("Vary", "Accept")
+            return response
+
+        return binary_format_handler
+
+    @staticmethod
+    async def _decoded_request(request: Request, body_format: BinaryFormat) -> Request:
+        """
+        A copy of the request presented as JSON, with the decoded body cached where Starlette keeps the decoded JSON
+        """
+        body = await request.body()
+        try:
+            decoded = body_format.decode(body) if body else None
+        except Exception as exc:
+            raise RequestValidationError([{
+                "type": f"{body_format.name}_invalid",
+                "loc": ("body",),
+                "msg": f"{body_format.name} decode error",
+                "input": {},
+                "ctx": {"error": str(exc)},
+            }])
+        location = _non_json_value(decoded)
+        if location is not None:
+            loc, value = location
+            raise RequestValidationError([{
+                "type": f"{body_format.name}_type",
+                "loc": ("body", *loc),
+                "msg": f"{type(value).__name__} values have no JSON equivalent",
+                "input": {},  # Not the value itself, the error response is encoded as JSON
+            }])
+        headers = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"]
+        scope = {**request.scope, "headers": [*headers, (b"content-type", b"application/json")]}
+        decoded_request = Request(scope, request.receive)
+        decoded_request._body = body
+        if body:
+            decoded_request._json = decoded
+        return decoded_request
+
+    @staticmethod
+    def _transcoded(response: Response, response_format: BinaryFormat) -> Response:
+        content = response_format.encode(json.loads(response.body))
+        headers = {name: value for name, value in response.headers.items()
+                   if name not in ("content-length", "content-type")}
+        return Response(content=content, status_code=response.status_code, headers=headers,
+                        media_type=response_format.media_type, background=response.background)
+
+
+def enable_binary_formats(app: FastAPI, paths: Collection[str] | None = None) -> list[BinaryFormat]:
+    """
+    Adds the installed binary formats to the routes of `paths` declared after this call (every route when None)
+    :return: the formats offered
+    """
+    formats = available_formats()
+    extend_route_class(app, BinaryFormatRoute, paths=frozenset(paths) if paths is not None else None, formats=formats)
+    return formats
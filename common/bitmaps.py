@@ -0,0 +1,212 @@
+"""
+Compressed bitmaps of 32-bit IDs, in the layout of Roaring bitmaps.
+
+The IDs are split by their 16 high bits into chunks of 65536 possible values, each one kept in the container that suits
+its density:
+    - an array container, the sorted 16 low bits of the IDs (uint16), while the chunk has at most 4096 IDs
+    - a bitmap container, 65536 bits (1024 uint64 words, 8 KiB), beyond that
+so a sparse set costs 2 bytes per ID and a dense one at most 1 bit per possible ID. Intersections, unions and
+differences work chunk by chunk, skipping the chunks only one side has, with vectorized NumPy operations on the
+containers: merging sorted arrays, testing the bits of an array against a bitmap, or combining bitmaps word by word.
+"""
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+ARRAY_MAX = 4096
+WORDS = 1024
+
+_ONE = np.uint64(1)
+
+
+def _popcount(words: np.ndarray) -> int:
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def _to_bitmap(low: np.ndarray) -> np.ndarray:
+    words = np.zeros(WORDS, dtype=np.uint64)
+    np.bitwise_or.at(words, low >> 6, _ONE << (low & 63).astype(np.uint64))
+    return words
+
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    bits = np.unpackbits(words.astype("<u8").view(np.uint8), bitorder="little")
+    return np.flatnonzero(bits).astype(np.uint16)
+
+
+def _bits_of(words: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """
+    Whether each of the `low` values is set in the bitmap container `words`
+    """
+    return ((words[low >> 6] >> (low & 63).astype(np.uint64)) & _ONE).astype(bool)
+
+
+def _is_bitmap(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+def _normalized(container: np.ndarray) -> np.ndarray | None:
+    """
+    The container in its best form, None when it is empty
+    """
+    if _is_bitmap(container):
+        count = _popcount(container)
+        if count == 0:
+            return None
+        return _to_array(container) if count <= ARRAY_MAX else container
+    if len(container) == 0:
+        return None
+    return _to_bitmap(container) if len(container) > ARRAY_MAX else container
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    if _is_bitmap(a) and _is_bitmap(b):
+        return _normalized(a & b)
+    if _is_bitmap(a):
+        a, b = b, a
+    if _is_bitmap(b):
+        return _normalized(a[_bits_of(b, a)])
+    return _normalized(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    if _is_bitmap(a) and _is_bitmap(b):
+        return a | b
+    if _is_bitmap(a):
+        a, b = b, a
+    if _is_bitmap(b):
+        words = b.copy()
+        np.bitwise_or.at(words, a >> 6, _ONE << (a & 63).astype(np.uint64))
+        return words
+    return _normalized(np.union1d(a, b))
+
+
+def _and_not(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    if _is_bitmap(a) and _is_bitmap(b):
+        return _normalized(a & ~b)
+    if _is_bitmap(b):
+        return _normalized(a[~_bits_of(b, a)])
+    if _is_bitmap(a):
+        words = a.copy()
+        np.bitwise_and.at(words, b >> 6, ~(_ONE << (b & 63).astype(np.uint64)))
+        return _normalized(words)
+    return _normalized(np.setdiff1d(a, b, assume_unique=True))
+
+
+class RoaringBitmap:
+    __slots__ = ("_containers",)
+
+    def __init__(self, containers: dict[int, np.ndarray] | None = None):
+        self._containers: dict[int, np.ndarray] = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int] | np.ndarray) -> "RoaringBitmap":
+        ids = np.unique(np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=np.uint32))
+        highs = ids >> 16
+        containers = {}
+        boundaries = np.flatnonzero(np.diff(highs)) + 1
+        for chunk in np.split(ids, boundaries) if len(ids) else ():
+            containers[int(chunk[0]) >> 16] = _normalized((chunk & 0xFFFF).astype(np.uint16))
+        return cls(containers)
+
+    def __len__(self) -> int:
+        return sum(_popcount(container) if _is_bitmap(container) else len(container)
+                   for container in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if _is_bitmap(container):
+            return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+        index = np.searchsorted(container, low)
+        return index < len(container) and container[index] == low
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.to_array().tolist())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(container.nbytes for container in self._containers.values())
+
+    def add(self, value: int) -> None:
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"{value} is not a 32-bit unsigned ID")
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = np.array([low], dtype=np.uint16)
+        elif _is_bitmap(container):
+            container[low >> 6] |= _ONE << np.uint64(low & 63)
+        else:
+            index = int(np.searchsorted(container, low))
+            if index < len(container) and container[index] == low:
+                return
+            container = np.insert(container, index, low)
+            self._containers[high] = _to_bitmap(container) if len(container) > ARRAY_MAX else container
+
+    def discard(self, value: int) -> None:
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if _is_bitmap(container):
+            container[low >> 6] &= ~(_ONE << np.uint64(low & 63))
+            container = _normalized(container)
+        else:
+            index = int(np.searchsorted(container, low))
+            if index == len(container) or container[index] != low:
+                return
+            container = _normalized(np.delete(container, index))
+        if container is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = container
+
+    def to_array(self, limit: int | None = None) -> np.ndarray:
+        """
+        The IDs, sorted, as uint32; only the first `limit` of them when given
+        """
+        parts, count = [], 0
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            low = _to_array(container) if _is_bitmap(container) else container
+            parts.append((np.uint32(high) << np.uint32(16)) | low.astype(np.uint32))
+            count += len(low)
+            if limit is not None and count >= limit:
+                break
+        ids = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+        return ids[:limit] if limit is not None else ids
+
+    def _combine(self, other: "RoaringBitmap", operation, keep_left: bool, keep_right: bool) -> "RoaringBitmap":
+        containers = {}
+        for high, container in self._containers.items():
+            other_container = other._containers.get(high)
+            if other_container is not None:
+                combined = operation(container, other_container)
+                if combined is not None:
+                    containers[high] = combined
+            elif keep_left:
+                containers[high] = container
+        if keep_right:
+            for high, container in other._containers.items():
+                if high not in self._containers:
+                    containers[high] = container
+        return RoaringBitmap(containers)
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        if len(other._containers) < len(self._containers):
+            return other._combine(self, _and, keep_left=False, keep_right=False)
+        return self._combine(other, _and, keep_left=False, keep_right=False)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, _or, keep_left=True, keep_right=True)
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, _and_not, keep_left=True, keep_right=False)
@@ -0,0 +1,248 @@
+"""
+In-memory catalog of items keyed by external IDs such as 'isbn-9781529046137' or 'imdb-tt0371724'.
+
+The catalog keeps three views of the same entries so that every kind of read is cheap, even with millions of IDs:
+    - a dict from ID to slot, for O(1) point lookups
+    - parallel `_ids`/`_names` lists indexed by slot, so a random entry is one `randrange` away (nothing is copied)
+    - a sorted list of IDs, searched with bisect, for prefix queries ('isbn-978...') and ranges of IDs
+Removing an entry moves the last slot into the hole, so the slot lists never have gaps.
+
+A catalog saved in a snapshot (see common/snapshot.py) is opened as a MappedCatalog: its IDs are a sorted string table
+in the mapped pages, with a hash table for the point lookups and searched with bisect for the others, so a process
+starts serving without hashing or sorting millions of IDs first.
+"""
+import heapq
+import random
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any
+
+import numpy as np
+
+from common.snapshot import Sections, Snapshot, string_table
+
+
+class Catalog:
+    """
+    :param prefixes: the ID prefixes the catalog accepts, e.g. ("isbn-", "imdb-")
+    :param entries: initial (id, name) pairs
+    """
+
+    def __init__(self, prefixes: tuple[str, ...], entries: Iterable[tuple[str, str]] = ()):
+        self.prefixes = prefixes
+        self._slots: dict[str, int] = {}
+        self._ids: list[str] = []
+        self._names: list[str] = []
+        for id, name in entries:
+            self.check_id(id)
+            if id in self._slots:
+                self._names[self._slots[id]] = name
+            else:
+                self._slots[id] = len(self._ids)
+                self._ids.append(id)
+                self._names.append(name)
+        # Sorting once is much cheaper than inserting the initial entries one by one
+        self._sorted_ids: list[str] = sorted(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._slots
+
+    def check_id(self, id: str) -> str:
+        if not id.startswith(self.prefixes):
+            expected = " or ".join(f'"{prefix}"' for prefix in self.prefixes)
+            raise ValueError(f"Invalid ID format, it must start with {expected}")
+        return id
+
+    def get(self, id: str) -> str | None:
+        slot = self._slots.get(id)
+        return None if slot is None else self._names[slot]
+
+    def add(self, id: str, name: str) -> None:
+        slot = self._slots.get(id)
+        if slot is not None:
+            self._names[slot] = name
+            return
+        self.check_id(id)
+        self._slots[id] = len(self._ids)
+        self._ids.append(id)
+        self._names.append(name)
+        insort(self._sorted_ids, id)
+
+    def remove(self, id: str) -> None:
+        slot = self._slots.pop(id)
+        last_id, last_name = self._ids.pop(), self._names.pop()
+        if last_id != id:
+            self._ids[slot], self._names[slot] = last_id, last_name
+            self._slots[last_id] = slot
+        del self._sorted_ids[bisect_left(self._sorted_ids, id)]
+
+    def sample(self) -> tuple[str, str]:
+        """
+        A uniformly random (id, name) entry, raises IndexError when the catalog is empty
+        """
+        slot = random.randrange(len(self._ids))
+        return self._ids[slot], self._names[slot]
+
+    def _scan(self, start: int, stop: int, limit: int) -> Iterator[tuple[str, str]]:
+        for id in self._sorted_ids[start:min(stop, start + limit)]:
+            yield id, self._names[self._slots[id]]
+
+    def search_prefix(self, prefix: str, limit: int, after: str | None = None) -> list[tuple[str, str]]:
+        """
+        Entries whose ID starts with `prefix`, in ID order. To get the next page, pass the last ID returned as `after`.
+        """
+        start = bisect_left(self._sorted_ids, prefix)
+        if after is not None:
+            start = max(start, bisect_right(self._sorted_ids, after))
+        # Every ID starting with the prefix sorts before the prefix followed by the highest code point
+        stop = bisect_left(self._sorted_ids, prefix + "\U0010ffff")
+        return list(self._scan(start, stop, limit))
+
+    def search_range(self, start: str, end: str | None, limit: int) -> list[tuple[str, str]]:
+        """
+        Entries with `start <= ID < end` (no upper bound when `end` is None), in ID order
+        """
+        first = bisect_left(self._sorted_ids, start)
+        last = len(self._sorted_ids) if end is None else bisect_left(self._sorted_ids, end)
+        return list(self._scan(first, last, limit))
+
+    def snapshot_state(self) -> list[tuple[str, str]]:
+        return list(self._scan(0, len(self), len(self)))
+
+    def snapshot_sections(self, name: str, state: list[tuple[str, str]]) -> tuple[Sections, dict[str, Any]]:
+        return catalog_sections(name, self.prefixes, state)
+
+
+def catalog_sections(name: str, prefixes: tuple[str, ...],
+                     entries: Iterable[tuple[str, str]]) -> tuple[Sections, dict[str, Any]]:
+    """
+    The snapshot sections of catalog entries given in ID order: the sorted IDs, the distinct names, and one record per
+    ID with the index of its name
+    """
+    ids: list[str] = []
+    names: dict[str, int] = {}
+    records: list[int] = []
+    for id, entry_name in entries:
+        ids.append(id)
+        records.append(names.setdefault(entry_name, len(names)))
+    sections = string_table(f"{name}.ids", ids, index=True) | string_table(f"{name}.names", names)
+    sections[f"{name}.records"] = np.array(records, dtype=np.uint32)
+    return sections, {"prefixes": list(prefixes), "entries": len(ids), "names": len(names)}
+
+
+MappedCatalogState = tuple[dict[str, str], set[str], list[tuple[str, str]]]  # Renamed, removed and added entries
+
+
+class MappedCatalog:
+    """
+    The catalog saved in a snapshot, with the same operations as Catalog. The entries added, renamed or removed since
+    the snapshot are kept in memory on top of the mapped ones.
+    :param snapshot: the snapshot
+    :param name: the name of the catalog in the snapshot
+    """
+
+    def __init__(self, snapshot: Snapshot, name: str):
+        self.prefixes: tuple[str, ...] = tuple(snapshot.meta[name]["prefixes"])
+        self._ids = snapshot.strings(f"{name}.ids")
+        self._names = snapshot.strings(f"{name}.names")
+        self._records = snapshot.section(f"{name}.records").cast("I")
+        self._added = Catalog(self.prefixes)  # IDs that are not in the snapshot
+        self._renamed: dict[str, str] = {}
+        self._removed: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._removed) + len(self._added)
+
+    def __contains__(self, id: str) -> bool:
+        return self.get(id) is not None
+
+    def check_id(self, id: str) -> str:
+        return self._added.check_id(id)
+
+    def _find(self, id: str) -> int | None:
+        """
+        The index of the ID in the snapshot, None when it isn't in it
+        """
+        return self._ids.find(id)
+
+    def _mapped_name(self, index: int, id: str) -> str:
+        return self._renamed[id] if id in self._renamed else self._names[self._records[index]]
+
+    def get(self, id: str) -> str | None:
+        index = self._find(id)
+        if index is None:
+            return self._added.get(id)
+        return None if id in self._removed else self._mapped_name(index, id)
+
+    def add(self, id: str, name: str) -> None:
+        if self._find(id) is None:
+            self._added.add(id, name)
+            return
+        self._removed.discard(id)
+        self._renamed[id] = name
+
+    def remove(self, id: str) -> None:
+        if self._find(id) is None or id in self._removed:
+            self._added.remove(id)
+            return
+        self._removed.add(id)
+        self._renamed.pop(id, None)
+
+    def sample(self) -> tuple[str, str]:
+        """
+        A uniformly random (id, name) entry, raises IndexError when the catalog is empty
+        """
+        if not len(self):
+            raise IndexError("The catalog is empty")
+        while True:
+            index = random.randrange(len(self._ids) + len(self._added))
+            if index >= len(self._ids):
+                return self._added.sample()
+            id = self._ids[index]
+            if id not in self._removed:  # Drawing again keeps the removed IDs out and the draw uniform
+                return id, self._mapped_name(index, id)
+
+    def _scan(self, start: int, stop: int) -> Iterator[tuple[str, str]]:
+        for index in range(start, stop):
+            id = self._ids[index]
+            if id not in self._removed:
+                yield id, self._mapped_name(index, id)
+
+    def _merge(self, start: int, stop: int, added: list[tuple[str, str]], limit: int) -> list[tuple[str, str]]:
+        return list(islice(heapq.merge(self._scan(start, stop), added), limit))
+
+    def search_prefix(self, prefix: str, limit: int, after: str | None = None) -> list[tuple[str, str]]:
+        """
+        Entries whose ID starts with `prefix`, in ID order. To get the next page, pass the last ID returned as `after`.
+        """
+        start = bisect_left(self._ids, prefix)
+        if after is not None:
+            start = max(start, bisect_right(self._ids, after))
+        stop = bisect_left(self._ids, prefix + "\U0010ffff")
+        return self._merge(start, stop, self._added.search_prefix(prefix, limit, after), limit)
+
+    def search_range(self, start: str, end: str | None, limit: int) -> list[tuple[str, str]]:
+        """
+        Entries with `start <= ID < end` (no upper bound when `end` is None), in ID order
+        """
+        first = bisect_left(self._ids, start)
+        last = len(self._ids) if end is None else bisect_left(self._ids, end)
+        return self._merge(first, last, self._added.search_range(start, end, limit), limit)
+
+    def snapshot_state(self) -> MappedCatalogState:
+        """
+        Only the changes are copied, the mapped entries don't change
+        """
+        return dict(self._renamed), set(self._removed), self._added.snapshot_state()
+
+    def snapshot_sections(self, name: str, state: MappedCatalogState) -> tuple[Sections, dict[str, Any]]:
+        renamed, removed, added = state
+        mapped = (
+            (id, renamed[id] if id in renamed else self._names[self._records[index]])
+            for index, id in enumerate(self._ids) if id not in removed
+        )
+        return catalog_sections(name, self.prefixes, heapq.merge(mapped, added))
@@ -0,0 +1,189 @@
+"""
+Change feed of the items: every successful update is published to an in-process log, with a sequence number, and
+streamed to the subscribers as Server-Sent Events instead of them polling GET /items/... to find out.
+
+The log keeps the last `max_entries` changes, each one encoded once, as the SSE event every subscriber gets. A
+subscriber doesn't get a copy of them: it is a cursor in the log (the sequence number of the last change it was sent),
+so publishing costs the same for 10 or 10k subscribers, and a subscriber costs the same memory however far behind it
+is. Its buffer is how far behind it may fall: when a slow consumer is more than `buffer` changes behind, either
+    - it is disconnected ("disconnect"), it can reconnect with the Last-Event-ID it got and resume from the log, or
+    - it is sent a snapshot ("snapshot"), the latest change of each item it missed in one event, and continues from the
+      end of the log.
+A subscriber resuming from a sequence number the log doesn't reach back to anymore, or one the log hasn't reached yet
+(sent before the process restarted), is sent a "reset" event first: it can't know what it missed and has to read the
+items again.
+
+Events:
+    id: 42
+    event: change
+    data: {"seq": 42, "item_id": 5, "data": {...}}
+
+    id: 42
+    event: snapshot
+    data: {"seq": 42, "changes": [{"seq": 40, "item_id": 5, "data": {...}}, ...]}
+
+    id: 42
+    event: reset
+    data: {"seq": 42}
+and a comment line every `keep_alive` seconds while nothing changes.
+"""
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any, Literal
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+Overflow = Literal["snapshot", "disconnect"]
+
+KEEP_ALIVE_EVENT = b": keep-alive\n\n"
+
+
+class Change:
+    __slots__ = ("seq", "item_id", "event", "data_start")
+
+    def __init__(self, seq: int, item_id: int, event: bytes, data_start: int):
+        self.seq = seq
+        self.item_id = item_id
+        self.event = event
+        self.data_start = data_start
+
+    @property
+    def json(self) -> bytes:
+        return self.event[self.data_start:-2]
+
+
+class ChangeFeed:
+    """
+    :param max_entries: changes kept in the log, to resume from
+    :param buffer: how many changes a subscriber may be behind before its overflow policy applies
+    :param keep_alive: seconds between two keep-alive comments of an idle stream
+    """
+
+    def __init__(self, max_entries: int = 10_000, buffer: int = 1_000, keep_alive: float = 15.0):
+        self.max_entries = max_entries
+        self.buffer = buffer
+        self.keep_alive = keep_alive
+        self.seq = 0
+        self._log: list[Change] = []  # Contiguous sequence numbers, trimmed to max_entries now and then
+        self._changed: asyncio.Event | None = None  # Created by the first subscriber waiting, set by the next change
+        self._keep_alive_task: asyncio.Task | None = None
+        self.subscribers = 0
+        self.counters = {"published": 0, "snapshots": 0, "disconnects": 0, "resets": 0}
+
+    def publish(self, item_id: int, data: Any) -> int:
+        """
+        Adds a change to the log and wakes the subscribers up, `data` being anything pydantic can serialize
+        """
+        self.seq += 1
+        head = b"id: %d\nevent: change\ndata: " % self.seq
+        body = to_json({"seq": self.seq, "item_id": item_id, "data": data})
+        self._log.append(Change(self.seq, item_id, head + body + b"\n\n", len(head)))
+        if len(self._log) > 2 * self.max_entries:
+            del self._log[:len(self._log) - self.max_entries]
+        self.counters["published"] += 1
+        self._wake()
+        return self.seq
+
+    def _wake(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    @property
+    def first_seq(self) -> int:
+        """
+        The oldest change the log can replay, the next one when it is empty
+        """
+        return max(self._log[0].seq, self.seq - self.max_entries + 1) if self._log else self.seq + 1
+
+    def changes_after(self, seq: int, limit: int | None = None) -> list[Change] | None:
+        """
+        The changes following `seq`, None when the log doesn't reach back to it anymore
+        """
+        if seq + 1 < self.first_seq:
+            return None
+        start = len(self._log) - (self.seq - seq)
+        return self._log[start:start + limit if limit is not None else None]
+
+    def snapshot_after(self, seq: int) -> bytes | None:
+        """
+        The snapshot event of the latest change of each item changed after `seq`, None when the log doesn't reach back
+        """
+        changes = self.changes_after(seq)
+        if changes is None:
+            return None
+        latest = {change.item_id: change for change in changes}
+        return b"".join((b'id: %d\nevent: snapshot\ndata: {"seq":%d,"changes":[' % (self.seq, self.seq),
+                         b",".join(change.json for change in sorted(latest.values(), key=lambda change: change.seq)),
+                         b"]}\n\n"))
+
+    def reset_event(self) -> bytes:
+        return b'id: %d\nevent: reset\ndata: {"seq":%d}\n\n' % (self.seq, self.seq)
+
+    async def wait(self, seq: int) -> None:
+        """
+        Returns once there are changes after `seq`, or at the next keep-alive
+        """
+        if self.seq > seq:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._keep_alive_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._keep_alive_task = loop.create_task(self._keep_alive())
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        await self._changed.wait()
+
+    async def _keep_alive(self) -> None:
+        while self.subscribers:
+            await asyncio.sleep(self.keep_alive)
+            self._wake()
+
+    async def events(self, after: int | None = None, overflow: Overflow = "snapshot",
+                     batch: int = 100) -> AsyncIterator[bytes]:
+        """
+        The events of a subscriber, from the change following `after` (from the next change when None)
+        :param batch: most changes sent at once
+        """
+        self.subscribers += 1
+        try:
+            cursor = self.seq if after is None else after
+            # Ahead of the log: an ID from before a restart of the process, which numbers the changes from 0 again
+            if cursor > self.seq or self.changes_after(cursor, limit=0) is None:
+                self.counters["resets"] += 1
+                cursor = self.seq
+                yield self.reset_event()
+            while True:
+                if self.seq == cursor:
+                    await self.wait(cursor)
+                    if self.seq == cursor:
+                        yield KEEP_ALIVE_EVENT
+                        continue
+                if self.seq - cursor > self.buffer:
+                    if overflow == "disconnect":
+                        self.counters["disconnects"] += 1
+                        return
+                    snapshot = self.snapshot_after(cursor)
+                    self.counters["snapshots" if snapshot is not None else "resets"] += 1
+                    cursor = self.seq
+                    yield snapshot if snapshot is not None else self.reset_event()
+                    continue
+                changes = self.changes_after(cursor, limit=batch)
+                cursor = changes[-1].seq
+                yield b"".join(change.event for change in changes)
+        finally:
+            self.subscribers -= 1
+
+    def stream(self, request: Request, after: int | None = None, overflow: Overflow = "snapshot") -> StreamingResponse:
+        """
+        The SSE response of a subscriber, resuming after `after` or else after the Last-Event-ID header
+        """
+        if after is None and request.headers.get("last-event-id", "").isdigit():
+            after = int(request.headers["last-event-id"])
+        return StreamingResponse(self.events(after, overflow), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    def stats(self) -> dict:
+        return {"seq": self.seq, "first_seq": self.first_seq, "subscribers": self.subscribers, **self.counters}
@@ -0,0 +1,112 @@
+"""
+All the exercise apps in one process, each one mounted under its own prefix.
+
+The apps declare conflicting paths (`/items/{item_id}` is in most of them), so each is mounted under the slug of its
+directory: app 6 answers at /body-nested-models/items/{item_id}, its docs at /body-nested-models/docs. Importing every
+app (and through it FastAPI's models and Pydantic's validators) is most of the startup time, so nothing is imported
+upfront: each app is a LazyApp, which imports it and runs its lifespan on the first request to its prefix. Its OpenAPI
+schema is then built in a thread, off the event loop, so that the first request doesn't wait for it.
+
+The time each step took is kept per app and served at /_apps, to follow the cold-start cost of every app.
+
+Mounted, an app still gets the full path in `scope["path"]`, with its prefix in `root_path`: the middlewares of the
+apps match their routes on `get_route_path(scope)`, the path relative to the mount (see tests/test_composer.py).
+
+Sharing one process, the apps share one event loop: a flood of bulk POSTs to one of them delays the cheap reads of all
+the others. With an AdmissionController, requests are admitted by lane across all the apps (see common/admission.py),
+and its counters are served at /_admission.
+"""
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.admission import AdmissionController, AdmissionMiddleware
+from common.apps import APP_DIRS, app_slug, load_module
+
+
+class LazyApp:
+    """
+    ASGI app standing for an exercise app until the first request to it
+    :param exit_stack: the lifespan of the app is entered in it, and left when the stack is closed
+    """
+
+    def __init__(self, dirname: str, exit_stack: AsyncExitStack):
+        self.dirname = dirname
+        self.prefix = f"/{app_slug(dirname)}"
+        self.exit_stack = exit_stack
+        self.app: ASGIApp | None = None
+        self.timings: dict[str, float | None] = {"import_ms": None, "lifespan_ms": None, "schema_ms": None}
+        self.loaded_at: float | None = None
+        self.error: str | None = None
+        self._lock = asyncio.Lock()
+        self._schema_task: asyncio.Task | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        app = self.app or await self.load()
+        await app(scope, receive, send)
+
+    async def load(self) -> ASGIApp:
+        async with self._lock:
+            if self.app is not None:
+                return self.app
+            start = time.perf_counter()
+            try:
+                app = load_module(self.dirname).app
+            except Exception as exc:
+                self.error = f"{type(exc).__name__}: {exc}"
+                raise
+            imported = time.perf_counter()
+            await self.exit_stack.enter_async_context(app.router.lifespan_context(app))
+            self.timings["import_ms"] = (imported - start) * 1000
+            self.timings["lifespan_ms"] = (time.perf_counter() - imported) * 1000
+            self.loaded_at = time.time()
+            self._schema_task = asyncio.create_task(self._build_schema(app))
+            self.app = app
+            return app
+
+    async def _build_schema(self, app: FastAPI) -> None:
+        start = time.perf_counter()
+        await asyncio.to_thread(app.openapi)
+        self.timings["schema_ms"] = (time.perf_counter() - start) * 1000
+
+    def describe(self) -> dict[str, Any]:
+        return {"dir": self.dirname, "prefix": self.prefix, "loaded": self.app is not None, "loaded_at": self.loaded_at,
+                **self.timings, "error": self.error}
+
+
+def compose(dirnames: list[str] | None = None, admission: AdmissionController | None = None) -> FastAPI:
+    """
+    One app mounting every exercise app (or those of `dirnames`) under its prefix, with the /_apps report
+    :param admission: the requests to every app go through its AdmissionMiddleware when given
+    """
+    exit_stack = AsyncExitStack()
+    apps = [LazyApp(dirname, exit_stack) for dirname in (dirnames or APP_DIRS)]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with exit_stack:  # Runs the shutdown of the apps that were loaded, the last loaded first
+            yield
+
+    composed = FastAPI(lifespan=lifespan, title="FastAPI exercises")
+
+    @composed.get("/_apps")
+    async def read_apps():
+        """
+        Per app: whether it is loaded yet, and how long its import, its lifespan startup and its schema took
+        """
+        return [lazy_app.describe() for lazy_app in apps]
+
+    if admission is not None:
+        composed.add_middleware(AdmissionMiddleware, controller=admission)
+
+        @composed.get("/_admission")
+        async def read_admission():
+            return admission.stats()
+
+    for lazy_app in apps:
+        composed.mount(lazy_app.prefix, lazy_app, name=app_slug(lazy_app.dirname))
+    return composed
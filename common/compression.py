@@ -0,0 +1,274 @@
+"""
+Compressed responses, negotiated with Accept-Encoding and compressed as a stream.
+
+Large JSON responses (thousands of images or items, the same keys repeated in every element) shrink several times when
+compressed. The middleware picks the encoding with the client's Accept-Encoding among gzip, brotli ("br") and zstd
+("zstd"), brotli and zstd only being offered when their package (`brotli`, `zstandard`) is installed. The body is fed to
+the compressor in chunks of `chunk_size` bytes and every compressed chunk is sent as soon as it is produced, so neither
+the whole compressed body nor a second copy of the response is ever held in memory, and the client starts receiving
+before the end is compressed. Bodies streamed by the app are flushed at the end of each message, so that each part
+reaches the client when the app sends it.
+
+Compression is configured per route with a CompressionRule: the minimum size worth compressing (small bodies cost
+more CPU than the bytes they save) and the level of each encoding, to trade CPU for bytes. Routes without a rule are
+sent as they are.
+"""
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from starlette.datastructures import MutableHeaders
+from starlette.routing import compile_path, get_route_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+class Compressor(ABC):
+    """
+    Common interface of the encoders: `compress` returns what is ready, `flush` everything fed so far, and `finish`
+    the end of the stream
+    """
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes: ...
+
+    @abstractmethod
+    def flush(self) -> bytes: ...
+
+    @abstractmethod
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip header and trailer
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, level: int):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int):
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+COMPRESSORS: dict[str, type[Compressor]] = {"zstd": ZstdCompressor, "br": BrotliCompressor, "gzip": GzipCompressor}
+_MODULES = {"zstd": "zstandard", "br": "brotli", "gzip": "zlib"}
+
+
+def available_encodings() -> list[str]:
+    """
+    The encodings that can be used here, in the order of preference of the server
+    """
+    encodings = []
+    for encoding, module in _MODULES.items():
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        encodings.append(encoding)
+    return encodings
+
+
+def negotiate(accept_encoding: str, offered: list[str]) -> str | None:
+    """
+    The encoding of `offered` the client prefers (highest q-value, then the order of `offered`), None for identity
+    """
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in offered:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+@dataclass
+class CompressionRule:
+    """
+    :param path: route path, with the same {param} syntax as the route
+    :param minimum_size: smaller bodies are sent uncompressed
+    :param levels: encoding -> compression level, missing encodings use DEFAULT_LEVELS
+    :param encodings: encodings offered for the route, by default every available one
+    """
+    path: str
+    minimum_size: int = 1024
+    levels: dict[str, int] = field(default_factory=dict)
+    encodings: list[str] | None = None
+
+    def __post_init__(self):
+        self.regex = compile_path(self.path)[0]
+        self.levels = {**DEFAULT_LEVELS, **self.levels}
+
+    def compressor(self, encoding: str) -> Compressor:
+        return COMPRESSORS[encoding](self.levels[encoding])
+
+
+def _is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES) or media_type.endswith("+json")
+
+
+class CompressionMiddleware:
+    """
+    Add it with `app.add_middleware(CompressionMiddleware, rules=[...])`
+    :param chunk_size: bytes fed to the compressor at a time, and so the most sent before compressed output goes out
+    """
+
+    def __init__(self, app: ASGIApp, rules: list[CompressionRule], chunk_size: int = 64 << 10):
+        self.app = app
+        self.rules = rules
+        self.chunk_size = chunk_size
+        available = available_encodings()
+        self.offered = {
+            rule.path: [encoding for encoding in available if rule.encodings is None or encoding in rule.encodings]
+            for rule in rules
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        rule = next((rule for rule in self.rules if rule.regex.match(get_route_path(scope))), None)
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), "")
+        encoding = negotiate(accept_encoding, self.offered[rule.path]) if rule is not None else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingSender(send, rule, encoding, self.chunk_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingSender:
+    """
+    Wraps `send` for one response: holds the start message until enough of the body has been seen to know whether it
+    is worth compressing, then either compresses the rest as it comes or passes it through
+    """
+
+    def __init__(self, send: Send, rule: CompressionRule, encoding: str, chunk_size: int):
+        self._send = send
+        self.rule = rule
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.start: Message | None = None
+        self.pending: list[bytes] = []
+        self.pending_size = 0
+        self.compressor: Compressor | None = None
+        self.forward: Callable | None = None  # Set once decided: passthrough or compress
+
+    async def send(self, message: Message) -> None:
+        if self.forward is not None:
+            await self.forward(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = MutableHeaders(raw=message["headers"])
+            length = headers.get("content-length")
+            if (
+                message["status"] < 200 or message["status"] in (204, 206, 304)
+                or "content-encoding" in headers
+                or not _is_compressible(headers.get("content-type", ""))
+                or (length is not None and int(length) < self.rule.minimum_size)
+            ):
+                await self._passthrough()
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.pending_size + len(body) < self.rule.minimum_size and more_body:
+            self.pending.append(body)
+            self.pending_size += len(body)
+            return
+        body = b"".join([*self.pending, body])
+        self.pending, self.pending_size = [], 0
+        if len(body) < self.rule.minimum_size:
+            await self._passthrough()
+        else:
+            await self._start_compressing()
+        await self.forward({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _passthrough(self) -> None:
+        self.forward = self._send
+        await self._send(self.start)
+
+    async def _start_compressing(self) -> None:
+        # A copy: the headers list can be shared, e.g. with an entry of the response cache
+        self.start = {**self.start, "headers": list(self.start["headers"])}
+        headers = MutableHeaders(raw=self.start["headers"])
+        del headers["content-length"]
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            # The compressed bytes differ from those the ETag was computed on, but they are semantically equivalent
+            headers["etag"] = f"W/{etag}"
+        self.compressor = self.rule.compressor(self.encoding)
+        self.forward = self._compress
+        await self._send(self.start)
+
+    async def _compress(self, message: Message) -> None:
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        view = memoryview(body)
+        for offset in range(0, len(view), self.chunk_size):
+            compressed = self.compressor.compress(view[offset:offset + self.chunk_size])
+            if compressed:
+                await self._send({"type": "http.response.body", "body": compressed, "more_body": True})
+        tail = self.compressor.flush() if more_body else self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": tail, "more_body": more_body})
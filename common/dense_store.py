@@ -0,0 +1,62 @@
+"""
+Store for small, bounded ID spaces (e.g. item IDs validated with `ge=0, le=1000`).
+
+Instead of a dict, the values live in a list with one slot per possible ID, allocated once, so an ID is turned into its
+slot with a subtraction and nothing is ever hashed or resized. Next to each value, its JSON rendering is kept and only
+refreshed when the value is written: reading an item means handing out the pre-rendered bytes, not encoding it again.
+"""
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import pydantic_core
+
+
+class DenseStore:
+    """
+    :param low: the lowest valid ID
+    :param high: the highest valid ID (inclusive)
+    :param render: turns a value into the bytes served for it, pydantic-core's JSON serializer by default
+    """
+
+    def __init__(self, low: int, high: int, render: Callable[[Any], bytes] = pydantic_core.to_json):
+        if high < low:
+            raise ValueError("high must be greater than or equal to low")
+        self.low = low
+        self.high = high
+        self.render = render
+        self._values: list[Any] = [None] * (high - low + 1)
+        self._rendered: list[bytes | None] = [None] * (high - low + 1)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def covers(self, item_id: int) -> bool:
+        return self.low <= item_id <= self.high
+
+    def _slot(self, item_id: int) -> int:
+        if not self.low <= item_id <= self.high:
+            raise IndexError(f"ID {item_id} is out of the range [{self.low}, {self.high}]")
+        return item_id - self.low
+
+    def put(self, item_id: int, value: Any) -> None:
+        slot = self._slot(item_id)
+        if self._rendered[slot] is None:
+            self._count += 1
+        self._rendered[slot] = self.render(value)
+        self._values[slot] = value
+
+    def get(self, item_id: int) -> Any:
+        return self._values[self._slot(item_id)]
+
+    def get_rendered(self, item_id: int) -> bytes | None:
+        return self._rendered[self._slot(item_id)]
+
+    def delete(self, item_id: int) -> None:
+        slot = self._slot(item_id)
+        if self._rendered[slot] is not None:
+            self._count -= 1
+        self._values[slot] = self._rendered[slot] = None
+
+    def ids(self) -> Iterator[int]:
+        return (self.low + slot for slot, rendered in enumerate(self._rendered) if rendered is not None)
@@ -0,0 +1,237 @@
+"""
+Idempotency for retried writes.
+
+Clients retrying a PUT send the exact same request again, and each retry would pay again for parsing, validating and
+handling the body. For the routes listed in the cache, the middleware computes a key for the request:
+    - from the `Idempotency-Key` header when the client sends one (scoped to the method and path)
+    - otherwise from a hash of the method, path, query string and raw body bytes
+and when a response is stored under that key, it is sent back as it is, marked with `Idempotent-Replayed: true`,
+without running validation nor the handler. Duplicates arriving while the first request is still running wait for it
+and get its response. Responses are kept in a bounded LRU, server errors are never stored.
+
+Both keys also cover the Accept and Content-Type headers: on the routes taking MessagePack or CBOR
+(common/binary_formats.py) they pick the format of the response, a retry gets its response back in the format it asked
+for, never the one stored for a JSON client. A retry sends the same headers anyway.
+
+A hash only tells that two requests are identical, not that the second one is a retry: PUT A, PUT B, PUT A on the same
+item must leave it at A, whichever routes B went through (another idempotent route, a plain PUT, a bulk update). So
+hashes are only used when the cache knows which resource a route writes (`resource`, from its path parameters), and the
+app reports every write of a resource with `written`: a response stored under a hash is only replayed while its
+resource hasn't been written since. With an Idempotency-Key, the client says which requests are retries, their response
+is replayed whatever was written in between.
+
+Reusing an Idempotency-Key with a different body is an error of the client, answered with 422.
+"""
+import asyncio
+import hashlib
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+
+from starlette.routing import compile_path, get_route_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+KEY_HEADERS = {b"idempotency-key", b"accept", b"content-type"}
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    body_digest: bytes
+    expires: float
+    resource: Hashable | None = None  # For the responses stored under a hash: replayed while the resource is at
+    version: int = 0                  # this version, the number of writes it went through
+
+
+class IdempotencyCache:
+    """
+    :param routes: (method, path) of the idempotent routes, with the same {param} syntax as the routes
+    :param resource: the resource a request writes, from the path parameters of its route (raising ValueError when
+        they don't name one). Without it, only the requests with an Idempotency-Key are deduplicated
+    :param max_entries: responses kept, the least recently used are dropped beyond it
+    :param ttl: seconds a response is replayed for
+    :param max_entry_bytes: bigger responses are not stored
+    """
+
+    def __init__(self, routes: list[tuple[str, str]], resource: Callable[[dict[str, str]], Hashable] | None = None,
+                 max_entries: int = 10_000, ttl: float = 300.0, max_entry_bytes: int = 256 << 10):
+        self.routes = [(method.upper(), compile_path(path)[0]) for method, path in routes]
+        self.resource = resource
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[bytes, StoredResponse] = OrderedDict()
+        self._versions: Counter = Counter()  # Resource -> writes reported with `written`
+        self.in_flight: dict[bytes, asyncio.Future] = {}
+        self.counters = Counter()
+
+    def match(self, method: str, path: str) -> dict[str, str] | None:
+        """
+        The path parameters of the idempotent route matching the request, None when there is none
+        """
+        for route_method, regex in self.routes:
+            match = regex.match(path) if method == route_method else None
+            if match is not None:
+                return match.groupdict()
+        return None
+
+    def resource_of(self, params: dict[str, str]) -> Hashable | None:
+        if self.resource is None:
+            return None
+        try:
+            return self.resource(params)
+        except ValueError:
+            return None
+
+    def version(self, resource: Hashable) -> int:
+        return self._versions[resource]
+
+    def written(self, resource: Hashable) -> None:
+        """
+        To call on every write of a resource, by any route: the responses stored under a hash for it are not replayed
+        anymore
+        """
+        self._versions[resource] += 1
+
+    def get(self, key: bytes) -> StoredResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            del self._entries[key]
+            return None
+        if entry.resource is not None and self._versions[entry.resource] != entry.version:
+            del self._entries[key]
+            self.counters["invalidated"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: bytes, entry: StoredResponse) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "in_flight": len(self.in_flight), **self.counters}
+
+
+class IdempotencyMiddleware:
+    """
+    Add it with `app.add_middleware(IdempotencyMiddleware, cache=cache)`
+    """
+
+    def __init__(self, app: ASGIApp, cache: IdempotencyCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = get_route_path(scope)  # Without the prefix the app is mounted under
+        params = self.cache.match(scope["method"], path)
+        if params is None:
+            await self.app(scope, receive, send)
+            return
+        headers = {name: value for name, value in scope["headers"] if name in KEY_HEADERS}
+        client_key = headers.get(b"idempotency-key")
+        resource = self.cache.resource_of(params) if client_key is None else None
+        if client_key is None and resource is None:
+            await self.app(scope, receive, send)  # A hash can't tell whether the request is a retry
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        body_digest = hashlib.sha256(body).digest()
+
+        digest = hashlib.sha256(f"{scope['method']} {path}\n".encode())
+        # A response is only replayed in the representation it was negotiated for: JSON, MessagePack or CBOR
+        digest.update(headers.get(b"accept", b"") + b"\n" + headers.get(b"content-type", b"") + b"\n")
+        if client_key is not None:
+            digest.update(b"key:" + client_key)
+        else:
+            digest.update(scope["query_string"] + b"\n" + body_digest)
+        key = digest.digest()
+
+        cache = self.cache
+        while True:
+            entry = cache.get(key)
+            if entry is not None:
+                if entry.body_digest != body_digest:
+                    cache.counters["conflicts"] += 1
+                    await self._send(send, 422, [(b"content-type", b"application/json")],
+                                     b'{"detail":"Idempotency-Key reused with a different body"}')
+                    return
+                cache.counters["replayed"] += 1
+                await self._send(send, entry.status, [*entry.headers, (b"idempotent-replayed", b"true")], entry.body)
+                return
+            in_flight = cache.in_flight.get(key)
+            if in_flight is None:
+                break
+            cache.counters["waited"] += 1
+            await asyncio.shield(in_flight)
+            # The first request is done: its response is stored, unless it failed, then run this one
+
+        cache.counters["executed"] += 1
+        version = cache.version(resource) if resource is not None else 0
+        done = asyncio.get_running_loop().create_future()
+        cache.in_flight[key] = done
+        start: Message | None = None
+        response_chunks: list[bytes] = []
+        body_sent = False
+
+        async def replay_body() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+            response_body = b"".join(response_chunks)
+            storable = start is not None and start["status"] < 500 and len(response_body) <= cache.max_entry_bytes
+            if resource is not None:
+                # The request wrote its resource at most once: another write ran meanwhile otherwise, and the response
+                # can't be replayed as the last write of the resource
+                written = cache.version(resource) - version
+                storable = storable and written <= 1
+                version += written
+            if storable:
+                cache.put(key, StoredResponse(
+                    status=start["status"],
+                    headers=list(start.get("headers", [])),
+                    body=response_body,
+                    body_digest=body_digest,
+                    expires=time.monotonic() + cache.ttl,
+                    resource=resource,
+                    version=version,
+                ))
+        finally:
+            del cache.in_flight[key]
+            done.set_result(None)
+
+    @staticmethod
+    async def _send(send: Send, status: int, headers: list[tuple[bytes, bytes]], body: bytes) -> None:
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
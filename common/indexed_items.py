@@ -0,0 +1,128 @@
+"""
+In-memory item store with the indexes needed to answer FilterParams queries without scanning every item:
+    - one sorted list of (timestamp, item_id) per orderable field ('created_at', 'updated_at')
+    - an inverted index from each tag to the set of item IDs carrying it, so a tag filter is an intersection of posting
+      lists, starting from the shortest one
+
+Pages can be requested with `offset`, or with a cursor. A cursor is the (timestamp, item_id) of the last item of the
+previous page, encoded as an opaque string, and the next page starts right after it with a bisect, so deep pages cost
+the same as the first one.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+ORDER_FIELDS = ("created_at", "updated_at")
+
+
+@dataclass
+class StoredItem:
+    id: int
+    name: str
+    tags: frozenset[str]
+    created_at: float
+    updated_at: float
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "tags": sorted(self.tags),
+            "created_at": datetime.fromtimestamp(self.created_at, timezone.utc).isoformat(),
+            "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat(),
+        }
+
+
+def encode_cursor(order_by: str, key: tuple[float, int]) -> str:
+    raw = json.dumps([order_by, key[0], key[1]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple[float, int]:
+    """
+    Raises ValueError when the cursor is malformed or was issued for another ordering
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        field, timestamp, item_id = json.loads(raw)
+        key = (float(timestamp), int(item_id))
+    except (ValueError, TypeError, OverflowError) as exc:  # OverflowError: int(inf), float of a huge integer
+        raise ValueError("Invalid cursor") from exc
+    if field != order_by:
+        raise ValueError(f"The cursor was issued for order_by={field}")
+    return key
+
+
+class IndexedItemStore:
+    def __init__(self):
+        self._items: dict[int, StoredItem] = {}
+        self._order: dict[str, list[tuple[float, int]]] = {field: [] for field in ORDER_FIELDS}
+        self._tags: dict[str, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, item_id: int) -> StoredItem | None:
+        return self._items.get(item_id)
+
+    def put(self, item: StoredItem) -> None:
+        old = self._items.get(item.id)
+        if old is not None:
+            for field in ORDER_FIELDS:
+                index = self._order[field]
+                del index[bisect_left(index, (getattr(old, field), old.id))]
+            for tag in old.tags:
+                self._tags[tag].discard(old.id)
+        self._items[item.id] = item
+        for field in ORDER_FIELDS:
+            insort(self._order[field], (getattr(item, field), item.id))
+        for tag in item.tags:
+            self._tags.setdefault(tag, set()).add(item.id)
+
+    def _matching(self, tags: Sequence[str]) -> set[int] | None:
+        """
+        IDs of the items that carry every tag, or None when there is no tag filter
+        """
+        if not tags:
+            return None
+        postings = sorted((self._tags.get(tag, set()) for tag in set(tags)), key=len)
+        return postings[0].intersection(*postings[1:])
+
+    def query(self, order_by: str, limit: int, offset: int = 0, tags: Sequence[str] = (),
+              cursor: str | None = None) -> tuple[list[StoredItem], str | None]:
+        """
+        Returns one page of items ordered by `order_by` (oldest first) and the cursor of the next page, which is None
+        when this is the last page
+        """
+        index = self._order[order_by]
+        after = decode_cursor(cursor, order_by) if cursor else None
+        start = bisect_right(index, after) if after else 0
+        matching = self._matching(tags)
+
+        if matching is None:
+            keys = index[start + offset:start + offset + limit]
+            more = start + offset + limit < len(index)
+        elif len(matching) * 8 < len(index) - start:
+            # Few matches: sorting them is cheaper than walking the index looking for them
+            candidates = sorted((getattr(self._items[item_id], order_by), item_id) for item_id in matching)
+            first = bisect_right(candidates, after) if after else 0
+            keys = candidates[first + offset:first + offset + limit]
+            more = first + offset + limit < len(candidates)
+        else:
+            keys, skipped, more = [], 0, False
+            for key in (index[position] for position in range(start, len(index))):
+                if key[1] not in matching:
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                elif len(keys) < limit:
+                    keys.append(key)
+                else:
+                    more = True
+                    break
+
+        next_cursor = encode_cursor(order_by, keys[-1]) if keys and more else None
+        return [self._items[item_id] for _, item_id in keys], next_cursor
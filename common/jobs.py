@@ -0,0 +1,186 @@
+"""
+Background jobs for requests too heavy to be handled before answering.
+
+The endpoint validates the request, `submit`s it and answers 202 Accepted with the ID of the job right away. The job
+waits in a bounded asyncio queue until one of the `workers` tasks picks it up and runs the processing function on it,
+and its status (queued, running, done or failed), progress and result can be read back with `get`.
+
+The queue is bounded on purpose: when it is full, `submit` raises QueueFull instead of queueing more work, with an
+estimate of when to retry (the jobs waiting times the average duration of a job, divided among the workers). The
+endpoint turns it into a 429 with Retry-After, so that under overload the clients are told to come back later instead of
+waiting behind a queue that keeps growing.
+
+The workers are tasks of the event loop, so a processing function that is pure Python computation still blocks it. Such
+steps can be handed to `run`, which runs them in the executor of the queue, a ProcessPoolExecutor when `processes` is
+set (the function and its arguments are then pickled, so they must be plain data and module-level functions), and
+otherwise runs them inline.
+"""
+import asyncio
+import itertools
+import math
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"The job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Any
+    total: int
+    status: JobStatus = "queued"
+    done: int = 0
+    result: Any = None
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+
+    def advance(self, steps: int = 1) -> None:
+        self.done = min(self.done + steps, self.total)
+
+    def to_dict(self) -> dict[str, Any]:
+        description = {
+            "id": self.id,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.status == "done":
+            description["result"] = self.result
+        elif self.status == "failed":
+            description["error"] = self.error
+        return description
+
+
+class JobQueue:
+    """
+    :param process: coroutine function run on each job, what it returns becomes the result of the job
+    :param workers: jobs processed concurrently
+    :param max_queued: jobs waiting to be processed, submitting more raises QueueFull
+    :param processes: size of the process pool used by `run`, 0 runs the steps inline
+    :param max_finished: finished jobs kept for `get`, the oldest are forgotten beyond it
+    """
+
+    def __init__(self, process: Callable[["JobQueue", Job], Awaitable[Any]], workers: int = 4, max_queued: int = 100,
+                 processes: int = 0, max_finished: int = 10_000):
+        if workers < 1 or max_queued < 1:
+            raise ValueError("workers and max_queued must be at least 1")
+        self.process = process
+        self.workers = workers
+        self.max_queued = max_queued
+        self.processes = processes
+        self.max_finished = max_finished
+        self._queue: asyncio.Queue[Job] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._executor: ProcessPoolExecutor | None = None
+        self._jobs: dict[str, Job] = {}
+        self._finished: OrderedDict[str, None] = OrderedDict()
+        self._durations: list[float] = []
+        self._duration_slot = itertools.cycle(range(100))
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        if self.processes > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def submit(self, payload: Any, total: int = 1) -> Job:
+        """
+        Queues a job and returns it at once
+        :param total: steps of the job, the processing function reports its progress with `job.advance()`
+        """
+        if self._queue is None:
+            raise RuntimeError("The job queue is not started")
+        job = Job(id=uuid.uuid4().hex, payload=payload, total=total)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(self.retry_after()) from None
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self._jobs[job_id]
+
+    def retry_after(self) -> int:
+        average = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return max(1, math.ceil(queued * average / self.workers))
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a CPU-heavy step of a job in the process pool, or inline when there is none
+        """
+        if self._executor is None:
+            result = function(*args)
+            await asyncio.sleep(0)  # Let the other requests in between two steps
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def stats(self) -> dict[str, Any]:
+        statuses = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        for job in self._jobs.values():
+            statuses[job.status] += 1
+        return {**statuses, "rejected": self.rejected, "workers": self.workers, "max_queued": self.max_queued,
+                "processes": self.processes}
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status, job.started = "running", time.time()
+            try:
+                job.result = await self.process(self, job)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "The server stopped before the job was done"
+                raise
+            except Exception as exc:
+                job.status, job.error = "failed", f"{type(exc).__name__}: {exc}"
+            finally:
+                job.payload = None  # A finished job is kept for `get`, its request body doesn't need to be
+                job.finished = time.time()
+                self._record_duration(job.finished - job.started)
+                self._forget_old(job.id)
+                self._queue.task_done()
+
+    def _record_duration(self, duration: float) -> None:
+        slot = next(self._duration_slot)
+        if slot < len(self._durations):
+            self._durations[slot] = duration
+        else:
+            self._durations.append(duration)
+
+    def _forget_old(self, job_id: str) -> None:
+        self._finished[job_id] = None
+        while len(self._finished) > self.max_finished:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
@@ -0,0 +1,115 @@
+"""
+Incremental parsing of request bodies that hold many JSON values: a top-level JSON array or NDJSON (one value per line).
+
+The body is consumed chunk by chunk, and every element is yielded as soon as it is complete, so only the element being
+parsed is held in memory, never the whole body. `max_element_bytes` bounds the size of a single element.
+"""
+import codecs
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class StreamFormatError(ValueError):
+    """
+    The body is not a well formed JSON array; `index` is the position of the element that could not be read
+    """
+
+    def __init__(self, message: str, index: int):
+        super().__init__(message)
+        self.index = index
+
+
+def is_ndjson(content_type: str | None) -> bool:
+    return (content_type or "").split(";", 1)[0].strip().lower() in NDJSON_MEDIA_TYPES
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], max_element_bytes: int = 1 << 20) -> AsyncIterator[Any]:
+    """
+    Yields the elements of a top-level JSON array one at a time, raises StreamFormatError when the body is malformed
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    index = 0
+    state = "start"  # start -> element <-> separator -> end
+    done = False
+
+    while not done:
+        try:
+            chunk = await anext(chunks)
+            buffer = buffer[position:] + utf8.decode(chunk)
+        except StopAsyncIteration:
+            buffer = buffer[position:] + utf8.decode(b"", final=True)
+            done = True
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if state == "start":
+                if char != "[":
+                    raise StreamFormatError("The body must be a JSON array", index)
+                position += 1
+                state = "first"
+            elif state in ("first", "element"):
+                if state == "first" and char == "]":
+                    position += 1
+                    state = "end"
+                    continue
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as exc:
+                    if done:
+                        raise StreamFormatError(f"Invalid JSON: {exc.msg}", index) from None
+                    if len(buffer) - position > max_element_bytes:
+                        raise StreamFormatError(f"Element larger than {max_element_bytes} bytes", index) from None
+                    break  # Incomplete element, wait for the next chunk
+                if not done and (end == len(buffer) or (char not in '{["' and buffer[end] in _NUMBER_CHARS)):
+                    break  # A number at the end of the chunk may continue in the next one
+                position = end
+                state = "separator"
+                index += 1
+                yield value
+            elif state == "separator":
+                position += 1
+                if char == ",":
+                    state = "element"
+                elif char == "]":
+                    state = "end"
+                else:
+                    raise StreamFormatError(f"Expected ',' or ']' after element {index - 1}", index)
+            else:
+                raise StreamFormatError("Unexpected data after the end of the array", index)
+
+    if state != "end":
+        raise StreamFormatError("The JSON array is not closed", index)
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_element_bytes: int = 1 << 20) -> AsyncIterator[bytes]:
+    """
+    Yields every non blank line of an NDJSON body as raw bytes, so each one can be parsed (and fail) on its own
+    """
+    buffer = b""
+    index = 0
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                index += 1
+                yield line
+        if len(buffer) > max_element_bytes:
+            raise StreamFormatError(f"Line longer than {max_element_bytes} bytes", index)
+    if buffer.strip():
+        yield buffer
@@ -0,0 +1,298 @@
+"""
+Runs an app on several worker processes sharing one port, to use every core.
+
+    python -m common.launcher 6 --workers 4 --port 8000 --pin
+    python -m common.launcher compose:app --workers 4
+
+The app is named like in common/apps.py (number, directory, slug or '6_body_nested_models.main:app'), or with any
+'module:attribute' import string, e.g. 'compose:app' for all the apps at once. Each worker is a separate process that
+imports the app itself and opens its own listening socket with SO_REUSEPORT, so they share nothing (state, caches, event
+loop) and the kernel spreads the incoming connections among them. With --pin, worker i is pinned to the i-th core.
+
+The launcher restarts a worker that dies. On SIGHUP it restarts them all, one at a time (rolling restart): the new
+worker is started and serving before the old one is sent SIGTERM, on which uvicorn stops accepting connections and
+waits up to --drain-timeout seconds for the open ones to finish. The port is never left without a worker.
+Note that the connections already queued in the old worker's accept backlog when it closes its socket are reset by
+the kernel, that is a limit of SO_REUSEPORT.
+
+With --load-test the launcher measures instead how the throughput scales: it starts 1, 2, ... up to --workers workers
+and, for each count, loads --path for --duration seconds from --clients client processes keeping --connections
+keep-alive connections busy, then reports the requests per second, the latency percentiles and the speedup. The
+clients run on the same machine, so leave them some cores.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import sys
+import time
+from multiprocessing.context import SpawnProcess
+from typing import Any
+
+_context = multiprocessing.get_context("spawn")
+
+
+def load_target(name: str) -> Any:
+    from common.apps import load_module, resolve_app_dir
+
+    try:
+        return load_module(resolve_app_dir(name)).app
+    except ValueError:
+        pass
+    import uvicorn.importer
+
+    return uvicorn.importer.import_from_string(name)
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    # IPPROTO_TCP explicitly: asyncio only sets TCP_NODELAY on the accepted sockets when their protocol says TCP, and
+    # without it the headers and the body of a response are held back by Nagle's algorithm (~40 ms per request)
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def run_worker(target: str, host: str, port: int, core: int | None, ready: Any, drain_timeout: int,
+               log_level: str) -> None:
+    """
+    Body of a worker process: sets `ready` once the app is started and accepting connections
+    """
+    import uvicorn
+
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    sock = listen(host, port)
+    config = uvicorn.Config(load_target(target), log_level=log_level, timeout_graceful_shutdown=drain_timeout)
+    server = uvicorn.Server(config)
+
+    async def serve():
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            ready.set()
+        await serving
+
+    asyncio.run(serve())
+
+
+class Launcher:
+    """
+    :param pin: pin each worker to one core, in the order of the cores this process may run on
+    :param drain_timeout: seconds a stopping worker waits for its open connections before closing them
+    """
+
+    def __init__(self, target: str, host: str = "127.0.0.1", port: int = 8000, workers: int = 1, pin: bool = False,
+                 drain_timeout: int = 30, log_level: str = "info", start_timeout: float = 60.0):
+        self.target = target
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.pin = pin
+        self.drain_timeout = drain_timeout
+        self.log_level = log_level
+        self.start_timeout = start_timeout
+        self.processes: list[SpawnProcess | None] = [None] * workers
+        self._cores = sorted(os.sched_getaffinity(0)) if pin else []
+        self._signal: int | None = None
+
+    def spawn(self, slot: int) -> SpawnProcess:
+        """
+        Starts the worker of `slot` and waits until it serves
+        """
+        core = self._cores[slot % len(self._cores)] if self._cores else None
+        ready = _context.Event()
+        process = _context.Process(
+            target=run_worker, name=f"worker-{slot}",
+            args=(self.target, self.host, self.port, core, ready, self.drain_timeout, self.log_level),
+        )
+        process.start()
+        deadline = time.monotonic() + self.start_timeout
+        while not ready.wait(0.1):
+            if not process.is_alive() or time.monotonic() > deadline:
+                self.stop_process(process)
+                raise RuntimeError(f"Worker {slot} failed to start (exit code {process.exitcode})")
+        return process
+
+    def stop_process(self, process: SpawnProcess) -> None:
+        if process.is_alive():
+            process.terminate()  # SIGTERM: uvicorn stops accepting and drains the open connections
+            process.join(self.drain_timeout + 5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def start(self) -> None:
+        for slot in range(self.workers):
+            self.processes[slot] = self.spawn(slot)
+        print(f"[launcher] {self.workers} workers serving {self.target} on http://{self.host}:{self.port}")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                self.stop_process(process)
+        self.processes = [None] * self.workers
+
+    def rolling_restart(self) -> None:
+        for slot, old in enumerate(self.processes):
+            self.processes[slot] = self.spawn(slot)
+            if old is not None:
+                self.stop_process(old)
+            print(f"[launcher] worker {slot} restarted (pid {self.processes[slot].pid})")
+
+    def run(self) -> None:
+        """
+        Starts the workers and supervises them until SIGINT or SIGTERM, restarting them all on SIGHUP
+        """
+
+        def on_signal(signum, frame):
+            self._signal = signum
+
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, on_signal)
+        self.start()
+        try:
+            while True:
+                time.sleep(0.5)
+                received, self._signal = self._signal, None
+                if received in (signal.SIGINT, signal.SIGTERM):
+                    break
+                if received == signal.SIGHUP:
+                    print("[launcher] rolling restart")
+                    self.rolling_restart()
+                    continue
+                for slot, process in enumerate(self.processes):
+                    if process is not None and not process.is_alive():
+                        print(f"[launcher] worker {slot} died (exit code {process.exitcode}), restarting it")
+                        self.processes[slot] = self.spawn(slot)
+        finally:
+            print("[launcher] stopping the workers")
+            self.stop()
+
+
+async def _load_connection(host: str, port: int, request: bytes, deadline: float, latencies: list[float]) -> int:
+    """
+    Sends `request` back to back on a keep-alive connection, and opens a new one when the server closes it (a worker
+    draining in a rolling restart closes its idle connections). Answers other than 200, responses cut short and refused
+    connections are counted as errors
+    """
+    errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except ConnectionError:
+            errors += 1
+            await asyncio.sleep(0.01)
+            continue
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                writer.write(request)
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError as exc:
+                    errors += bool(exc.partial)
+                    break  # Closed between two requests
+                length, keep_alive = 0, True
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        length = int(value)
+                    elif name == b"connection" and value.strip().lower() == b"close":
+                        keep_alive = False
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - start)
+                if head[9:12] != b"200":
+                    errors += 1
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            errors += 1
+        finally:
+            writer.close()
+    return errors
+
+
+def run_load_client(host: str, port: int, path: str, duration: float, connections: int, method: str = "GET",
+                    body: bytes = b"", content_type: str = "application/json") -> tuple[list[float], int]:
+    """
+    One client process: `connections` keep-alive connections sending `method` `path` back to back for `duration`
+    seconds, with `body` when given
+    """
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+    if body:
+        head += f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+    request = f"{head}\r\n".encode() + body
+
+    async def load():
+        latencies: list[float] = []
+        deadline = time.perf_counter() + duration
+        errors = await asyncio.gather(
+            *(_load_connection(host, port, request, deadline, latencies) for _ in range(connections))
+        )
+        return latencies, sum(errors)
+
+    return asyncio.run(load())
+
+
+def load_test(target: str, host: str, port: int, max_workers: int, pin: bool, path: str, duration: float,
+              connections: int, clients: int) -> None:
+    print(f"{'workers':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8} {'efficiency':>10}")
+    single = None
+    per_client = max(1, connections // clients)
+    for workers in range(1, max_workers + 1):
+        launcher = Launcher(target, host, port, workers=workers, pin=pin, drain_timeout=1, log_level="warning")
+        launcher.start()
+        try:
+            run_load_client(host, port, path, 1.0, per_client)  # Warm-up: imports, caches, first requests
+            with _context.Pool(clients) as pool:
+                results = pool.starmap(run_load_client, [(host, port, path, duration, per_client)] * clients)
+        finally:
+            launcher.stop()
+        latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+        errors = sum(client_errors for _, client_errors in results)
+        rps = len(latencies) / duration
+        single = single or rps
+        p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan")
+        print(f"{workers:>7} {rps:>10,.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7} {rps / single:>7.2f}x "
+              f"{rps / single / workers:>9.0%}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run an app on several workers sharing a port with SO_REUSEPORT")
+    parser.add_argument("app", help="exercise app (number, directory or slug) or module:attribute, e.g. compose:app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its own core")
+    parser.add_argument("--drain-timeout", type=int, default=30,
+                        help="seconds a stopping worker waits for its open connections")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--load-test", action="store_true", help="measure the throughput from 1 to --workers workers")
+    parser.add_argument("--path", default="/openapi.json", help="load test: the path requested")
+    parser.add_argument("--duration", type=float, default=10.0, help="load test: seconds per worker count")
+    parser.add_argument("--connections", type=int, default=64, help="load test: keep-alive connections in total")
+    parser.add_argument("--clients", type=int, default=2, help="load test: client processes")
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        load_test(args.app, args.host, args.port, args.workers, args.pin, args.path, args.duration, args.connections,
+                  args.clients)
+        return
+    Launcher(args.app, args.host, args.port, workers=args.workers, pin=args.pin, drain_timeout=args.drain_timeout,
+             log_level=args.log_level).run()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,272 @@
+"""
+Per-phase request timings, exposed in the Prometheus text format at /metrics.
+
+Each request of an instrumented route is split into four phases, every one with its own histogram per route:
+    - parse: reading the body and decoding its JSON
+    - validate: solving the parameters and dependencies, that is, the Pydantic validation
+    - handler: the endpoint function itself
+    - encode: turning what the endpoint returned into the response (jsonable_encoder and rendering)
+The sizes of the request and response bodies are recorded as histograms too, and requests are counted by status.
+
+The phases are measured by a route class: it reads and decodes the body before FastAPI does (Starlette caches both, so
+nothing is done twice) and wraps the endpoint function to know when it starts and ends. Everything else is a few
+perf_counter calls and histogram increments, cheap enough to stay on under load.
+
+With `profile_sample_rate` (or the METRICS_PROFILE_SAMPLE_RATE environment variable), that fraction of the requests is
+also run under cProfile, and the profiles of the slowest of them are kept and served at /metrics/slowest. Note that
+while a request is being profiled, any other request interleaved on the event loop shows up in its profile too.
+"""
+import asyncio
+import cProfile
+import heapq
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+
+from common.routing import extend_route_class
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_endpoint_timings: ContextVar[dict[str, float]] = ContextVar("endpoint_timings")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class SlowRequestProfiler:
+    """
+    Profiles a random sample of the requests and keeps the profiles of the `keep` slowest ones
+    """
+
+    def __init__(self, sample_rate: float, keep: int = 10, top_functions: int = 25):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.top_functions = top_functions
+        self._slowest: list[tuple[float, int, dict[str, Any]]] = []
+        self._sequence = itertools.count()
+        self._active = False
+
+    def should_profile(self) -> bool:
+        return not self._active and random.random() < self.sample_rate
+
+    async def run(self, route: str, method: str, call: Callable[[], Any]) -> Any:
+        self._active = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return await call()
+        finally:
+            profiler.disable()
+            self._active = False
+            self._record(route, method, time.perf_counter() - start, profiler)
+
+    def _record(self, route: str, method: str, duration: float, profiler: cProfile.Profile) -> None:
+        if len(self._slowest) >= self.keep and duration <= self._slowest[0][0]:
+            return
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(self.top_functions)
+        entry = {"route": route, "method": method, "duration_ms": duration * 1000, "profile": output.getvalue()}
+        if len(self._slowest) >= self.keep:
+            heapq.heapreplace(self._slowest, (duration, next(self._sequence), entry))
+        else:
+            heapq.heappush(self._slowest, (duration, next(self._sequence), entry))
+
+    def slowest(self) -> list[dict[str, Any]]:
+        return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+
+class Metrics:
+    def __init__(self, profiler: SlowRequestProfiler | None = None):
+        self.profiler = profiler
+        self.phases: dict[tuple[str, str, str], Histogram] = {}
+        self.request_bytes: dict[tuple[str, str], Histogram] = {}
+        self.response_bytes: dict[tuple[str, str], Histogram] = {}
+        self.requests: Counter[tuple[str, str, str]] = Counter()
+
+    def observe_phase(self, route: str, method: str, phase: str, seconds: float) -> None:
+        key = (route, method, phase)
+        histogram = self.phases.get(key)
+        if histogram is None:
+            histogram = self.phases[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+    def observe_size(self, sizes: dict[tuple[str, str], Histogram], route: str, method: str, size: int) -> None:
+        histogram = sizes.get((route, method))
+        if histogram is None:
+            histogram = sizes[route, method] = Histogram(SIZE_BUCKETS)
+        histogram.observe(size)
+
+    def render(self) -> str:
+        lines = []
+        families = [
+            ("http_request_phase_seconds", "Time spent in each phase of a request", self.phases,
+             lambda key: _labels(route=key[0], method=key[1], phase=key[2])),
+            ("http_request_body_bytes", "Size of the request bodies", self.request_bytes,
+             lambda key: _labels(route=key[0], method=key[1])),
+            ("http_response_body_bytes", "Size of the response bodies", self.response_bytes,
+             lambda key: _labels(route=key[0], method=key[1])),
+        ]
+        for name, help, histograms, labels in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for key, histogram in sorted(histograms.items()):
+                base = labels(key)
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{base}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{base}}} {histogram.count}")
+        lines += ["# HELP http_requests_total Requests by route, method and status", "# TYPE http_requests_total counter"]
+        for (route, method, status), count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _is_json(content_type: str | None) -> bool:
+    # The same check FastAPI does before decoding a body as JSON
+    if not content_type:
+        return True
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or (media_type.startswith("application/") and media_type.endswith("+json"))
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class recording the phases of every request in `metrics`, install it with `instrument`
+    """
+    metrics: Metrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            async def timed_call(*call_args, **call_kwargs):
+                timings = _endpoint_timings.get(None)
+                if timings is not None:
+                    timings["start"] = time.perf_counter()
+                try:
+                    return await call(*call_args, **call_kwargs)
+                finally:
+                    if timings is not None:
+                        timings["end"] = time.perf_counter()
+        else:
+            # FastAPI runs sync endpoints in a thread, the context (and so the timings dict) is copied there
+            def timed_call(*call_args, **call_kwargs):
+                timings = _endpoint_timings.get(None)
+                if timings is not None:
+                    timings["start"] = time.perf_counter()
+                try:
+                    return call(*call_args, **call_kwargs)
+                finally:
+                    if timings is not None:
+                        timings["end"] = time.perf_counter()
+        self.dependant.call = timed_call
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route, has_body = self.path, self.body_field is not None
+
+        async def timed_handler(request: Request) -> Response:
+            metrics = self.metrics
+            method = request.method
+            timings: dict[str, float] = {}
+            token = _endpoint_timings.set(timings)
+            start = time.perf_counter()
+            parsed: float | None = None
+            status = "500"
+            try:
+                if has_body:
+                    body = await request.body()
+                    metrics.observe_size(metrics.request_bytes, route, method, len(body))
+                    if body and _is_json(request.headers.get("content-type")):
+                        try:
+                            await request.json()
+                        except ValueError:
+                            pass  # FastAPI decodes it again and reports the error
+                parsed = time.perf_counter()
+                profiler = metrics.profiler
+                if profiler is not None and profiler.should_profile():
+                    response = await profiler.run(route, method, lambda: handler(request))
+                else:
+                    response = await handler(request)
+                status = str(response.status_code)
+                if "content-length" in response.headers:
+                    metrics.observe_size(metrics.response_bytes, route, method, int(response.headers["content-length"]))
+                return response
+            except RequestValidationError:
+                status = "422"
+                raise
+            except HTTPException as exc:
+                status = str(exc.status_code)
+                raise
+            finally:
+                end = time.perf_counter()
+                _endpoint_timings.reset(token)
+                metrics.requests[route, method, status] += 1
+                if parsed is not None:
+                    metrics.observe_phase(route, method, "parse", parsed - start)
+                    if "start" in timings:
+                        metrics.observe_phase(route, method, "validate", timings["start"] - parsed)
+                        metrics.observe_phase(route, method, "handler", timings.get("end", end) - timings["start"])
+                        metrics.observe_phase(route, method, "encode", end - timings.get("end", end))
+                    else:
+                        metrics.observe_phase(route, method, "validate", end - parsed)
+
+        return timed_handler
+
+
+def instrument(app: FastAPI, profile_sample_rate: float | None = None, path: str = "/metrics") -> Metrics:
+    """
+    Times every route declared after this call and adds the /metrics and /metrics/slowest endpoints
+    :param profile_sample_rate: fraction of the requests profiled, by default METRICS_PROFILE_SAMPLE_RATE or 0
+    """
+    if profile_sample_rate is None:
+        profile_sample_rate = float(os.environ.get("METRICS_PROFILE_SAMPLE_RATE", "0"))
+    metrics = Metrics(SlowRequestProfiler(profile_sample_rate) if profile_sample_rate > 0 else None)
+    extend_route_class(app, TimedRoute, metrics=metrics)
+
+    async def render_metrics(request: Request) -> Response:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    async def render_slowest(request: Request) -> Response:
+        slowest = metrics.profiler.slowest() if metrics.profiler else []
+        return Response(json.dumps(slowest), media_type="application/json")
+
+    app.add_route(path, render_metrics, include_in_schema=False)
+    app.add_route(f"{path}/slowest", render_slowest, include_in_schema=False)
+    return metrics
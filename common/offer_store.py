@@ -0,0 +1,225 @@
+"""
+Offers held server-side, with aggregates of their items kept up to date on every change instead of recomputed.
+
+The aggregates of an offer (item and image counts, total price and tax, price sums per tag, min and max price) are
+updated by each item added, replaced or removed, in time proportional to the item's tags, so reading them doesn't
+depend on the size of the offer. Min and max price survive removals thanks to a multiset of the prices and two heaps
+whose removed entries are dropped once they reach the top.
+
+The first build of a big offer is vectorized: the prices, taxes and tags of its items are gathered into NumPy arrays
+once, and the sums, bounds, price counts and per-tag sums (np.bincount) are computed on them. The items are plain dicts
+(what `model_dump` returns). The sums are floats: after many updates they may drift by rounding errors, they are reset
+when the offer becomes empty.
+
+The offers summarized in the background (`?mode=async`) go through the same aggregates: each chunk of their items is
+aggregated with `from_items`, possibly in another process (the aggregates are plain data, they pickle), and the chunks
+are merged with `merge`. A job and a stored offer report the same summary.
+"""
+import heapq
+import uuid
+from collections import Counter
+from itertools import chain
+from operator import itemgetter, methodcaller
+from typing import Any
+
+import numpy as np
+
+VECTORIZED_BUILD_MIN = 1_000
+
+
+class OfferAggregates:
+    def __init__(self):
+        self._clear()
+
+    def _clear(self) -> None:
+        self.items = 0
+        self.images = 0
+        self.price = 0.0
+        self.tax = 0.0
+        self.tag_prices: dict[str, float] = {}
+        self._tag_items: Counter[str] = Counter()
+        self._prices: Counter[float] = Counter()
+        self._min_heap: list[float] = []
+        self._max_heap: list[float] = []  # Negated prices
+
+    @classmethod
+    def from_items(cls, items: list[dict[str, Any]]) -> "OfferAggregates":
+        aggregates = cls()
+        if len(items) < VECTORIZED_BUILD_MIN:
+            for item in items:
+                aggregates.add(item)
+            return aggregates
+
+        # Gathering the fields out of the dicts is most of the time, map and chain keep it out of Python bytecode
+        count = len(items)
+        prices = np.fromiter(map(itemgetter("price"), items), dtype=np.float64, count=count)
+        taxes = np.nan_to_num(np.array(list(map(methodcaller("get", "tax"), items)), dtype=np.float64))  # None is NaN
+        images = np.fromiter(map(len, (item.get("images") or () for item in items)), dtype=np.int64, count=count)
+        tag_sets = [item.get("tags") or () for item in items]
+        tag_counts = np.fromiter(map(len, tag_sets), dtype=np.int64, count=count)
+        tag_ids: dict[str, int] = {}
+        flat_tags = np.fromiter((tag_ids.setdefault(tag, len(tag_ids)) for tag in chain.from_iterable(tag_sets)),
+                                dtype=np.int64, count=int(tag_counts.sum()))
+
+        aggregates.items = count
+        aggregates.images = int(images.sum())
+        aggregates.price = float(prices.sum())
+        aggregates.tax = float(taxes.sum())
+        tag_sums = np.bincount(flat_tags, weights=np.repeat(prices, tag_counts), minlength=len(tag_ids))
+        tag_items = np.bincount(flat_tags, minlength=len(tag_ids))
+        aggregates.tag_prices = dict(zip(tag_ids, tag_sums.tolist()))
+        aggregates._tag_items = Counter(dict(zip(tag_ids, tag_items.tolist())))
+        values, value_counts = np.unique(prices, return_counts=True)
+        aggregates._prices = Counter(dict(zip(values.tolist(), value_counts.tolist())))
+        aggregates._min_heap = values.tolist()  # Sorted, so already heaps
+        aggregates._max_heap = (-values[::-1]).tolist()
+        return aggregates
+
+    def add(self, item: dict[str, Any]) -> None:
+        price = item["price"]
+        self.items += 1
+        self.images += len(item.get("images") or ())
+        self.price += price
+        self.tax += item.get("tax") or 0.0
+        for tag in item.get("tags") or ():
+            self.tag_prices[tag] = self.tag_prices.get(tag, 0.0) + price
+            self._tag_items[tag] += 1
+        if not self._prices[price]:
+            heapq.heappush(self._min_heap, price)
+            heapq.heappush(self._max_heap, -price)
+        self._prices[price] += 1
+
+    def merge(self, other: "OfferAggregates") -> None:
+        """
+        Adds the items aggregated in `other`, those of another chunk of the offer
+        """
+        self.items += other.items
+        self.images += other.images
+        self.price += other.price
+        self.tax += other.tax
+        for tag, price in other.tag_prices.items():
+            self.tag_prices[tag] = self.tag_prices.get(tag, 0.0) + price
+        self._tag_items.update(other._tag_items)
+        for price, count in other._prices.items():
+            if not self._prices[price]:
+                heapq.heappush(self._min_heap, price)
+                heapq.heappush(self._max_heap, -price)
+            self._prices[price] += count
+
+    def remove(self, item: dict[str, Any]) -> None:
+        """
+        Takes back an item that was added, with the same content
+        """
+        price = item["price"]
+        self.items -= 1
+        if not self.items:
+            self._clear()
+            return
+        self.images -= len(item.get("images") or ())
+        self.price -= price
+        self.tax -= item.get("tax") or 0.0
+        for tag in item.get("tags") or ():
+            self._tag_items[tag] -= 1
+            if self._tag_items[tag]:
+                self.tag_prices[tag] -= price
+            else:
+                del self._tag_items[tag], self.tag_prices[tag]
+        self._prices[price] -= 1
+        if not self._prices[price]:
+            del self._prices[price]
+            self._prune()
+
+    def _prune(self) -> None:
+        """
+        Drops the removed prices from the top of the heaps, and rebuilds them once they hold mostly removed ones
+        """
+        if len(self._min_heap) > 2 * len(self._prices) + 16:
+            self._min_heap = sorted(self._prices)
+            self._max_heap = [-price for price in reversed(self._min_heap)]
+            return
+        while self._min_heap and self._min_heap[0] not in self._prices:
+            heapq.heappop(self._min_heap)
+        while self._max_heap and -self._max_heap[0] not in self._prices:
+            heapq.heappop(self._max_heap)
+
+    @property
+    def min_price(self) -> float | None:
+        return self._min_heap[0] if self.items else None
+
+    @property
+    def max_price(self) -> float | None:
+        return -self._max_heap[0] if self.items else None
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "images": self.images,
+            "price": self.price,
+            "tax": self.tax,
+            "total": self.price + self.tax,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "mean_price": self.price / self.items if self.items else None,
+            "tag_prices": dict(self.tag_prices),
+        }
+
+
+class StoredOffer:
+    def __init__(self, offer: dict[str, Any]):
+        self.name = offer["name"]
+        self.description = offer.get("description")
+        self.price = offer["price"]
+        self.items: dict[int, dict[str, Any]] = dict(enumerate(offer["items"]))
+        self.next_item_id = len(self.items)
+        self.aggregates = OfferAggregates.from_items(offer["items"])
+
+    def add_item(self, item: dict[str, Any]) -> int:
+        item_id = self.next_item_id
+        self.next_item_id += 1
+        self.items[item_id] = item
+        self.aggregates.add(item)
+        return item_id
+
+    def replace_item(self, item_id: int, item: dict[str, Any]) -> None:
+        """
+        Raises KeyError when the offer has no item with that ID
+        """
+        self.aggregates.remove(self.items[item_id])
+        self.items[item_id] = item
+        self.aggregates.add(item)
+
+    def remove_item(self, item_id: int) -> None:
+        """
+        Raises KeyError when the offer has no item with that ID
+        """
+        self.aggregates.remove(self.items.pop(item_id))
+
+    def summary(self) -> dict[str, Any]:
+        return {"name": self.name, "description": self.description, "price": self.price,
+                "summary": self.aggregates.summary()}
+
+
+class OfferStore:
+    """
+    Offers held server-side under a generated ID
+    """
+
+    def __init__(self):
+        self._offers: dict[str, StoredOffer] = {}
+
+    def __len__(self) -> int:
+        return len(self._offers)
+
+    def add(self, offer: dict[str, Any]) -> str:
+        offer_id = uuid.uuid4().hex
+        self._offers[offer_id] = StoredOffer(offer)
+        return offer_id
+
+    def get(self, offer_id: str) -> StoredOffer:
+        """
+        Raises KeyError when there is no offer with that ID
+        """
+        return self._offers[offer_id]
+
+    def remove(self, offer_id: str) -> None:
+        del self._offers[offer_id]
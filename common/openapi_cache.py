@@ -0,0 +1,185 @@
+"""
+Precomputed OpenAPI schema, cached on disk and served with an ETag.
+
+FastAPI builds the schema the first time /openapi.json is requested, and for apps with many examples (json_schema_extra,
+Field(examples=...), Body(examples=...), openapi_examples) that first request stalls the worker. Here the schema is
+rendered once and written to `<cache_dir>/openapi-<key>.json`, where the key is a hash of the route and model
+definitions (the source of every endpoint and of every model they use, plus the FastAPI and Pydantic versions), so
+editing any of them produces a new file instead of serving a stale schema.
+
+The file can be written ahead of time as a build step:
+    python -m common.openapi_cache 7
+At startup, `warm()` only checks that the file exists, and when it doesn't, builds it in a thread in the background.
+The schema is read when /openapi.json is first requested, which happens when /docs is actually opened. Clients that
+send back the ETag get a 304 without a body.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import sys
+from pathlib import Path
+from typing import get_args
+
+import fastapi
+import pydantic
+from fastapi import FastAPI, Request
+from fastapi.dependencies.models import Dependant
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return repr(obj)
+
+
+def _collect_models(annotation, found: set[type[BaseModel]]) -> None:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if annotation not in found:
+            found.add(annotation)
+            for field in annotation.model_fields.values():
+                _collect_models(field.annotation, found)
+        return
+    for arg in get_args(annotation):
+        _collect_models(arg, found)
+
+
+def _dependant_params(dependant: Dependant):
+    yield from dependant.path_params + dependant.query_params + dependant.header_params
+    yield from dependant.cookie_params + dependant.body_params
+    for sub_dependant in dependant.dependencies:
+        yield from _dependant_params(sub_dependant)
+
+
+def schema_key(app: FastAPI) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{fastapi.__version__} {pydantic.VERSION} {app.title} {app.version} {app.openapi_version}".encode())
+    models: set[type[BaseModel]] = set()
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not route.include_in_schema:
+            continue
+        digest.update(f"{route.path} {sorted(route.methods)} {route.name}\n".encode())
+        digest.update(_source(route.endpoint).encode())
+        for param in _dependant_params(route.dependant):
+            _collect_models(param.field_info.annotation, models)
+        _collect_models(route.response_model, models)
+    for model in sorted(models, key=lambda model: f"{model.__module__}.{model.__qualname__}"):
+        digest.update(_source(model).encode())
+    return digest.hexdigest()[:16]
+
+
+class OpenAPICache:
+    def __init__(self, app: FastAPI, cache_dir: str | os.PathLike):
+        self.app = app
+        self.cache_dir = Path(cache_dir)
+        self._key: str | None = None
+        self._body: bytes | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def key(self) -> str:
+        if self._key is None:
+            self._key = schema_key(self.app)
+        return self._key
+
+    @property
+    def path(self) -> Path:
+        return self.cache_dir / f"openapi-{self.key}.json"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key}"'
+
+    def build(self) -> bytes:
+        body = json.dumps(self.app.openapi(), separators=(",", ":")).encode()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_bytes(body)
+        temporary.replace(self.path)
+        return body
+
+    def load_or_build(self) -> bytes:
+        try:
+            return self.path.read_bytes()
+        except FileNotFoundError:
+            return self.build()
+
+    def _ensure_task(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(asyncio.to_thread(self.load_or_build))
+        return self._task
+
+    async def warm(self) -> None:
+        """
+        Call it at startup: when the schema is not cached yet it starts building it, without waiting for it
+        """
+        if not self.path.exists():
+            self._ensure_task()
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            self._body = await self._ensure_task()
+        return self._body
+
+    def install(self, openapi_url: str = "/openapi.json", docs_url: str = "/docs",
+                redoc_url: str | None = "/redoc") -> None:
+        """
+        Adds the schema, Swagger UI (with its OAuth2 redirect page, at the `swagger_ui_oauth2_redirect_url` of the app)
+        and ReDoc routes, pointing at the cached schema. Create the app with `openapi_url=None, docs_url=None,
+        redoc_url=None` so that FastAPI doesn't add its own
+        """
+
+        async def openapi(request: Request) -> Response:
+            headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+            if self.etag in request.headers.get("if-none-match", ""):
+                return Response(status_code=304, headers=headers)
+            return Response(await self.body(), media_type="application/json", headers=headers)
+
+        oauth2_redirect_url = self.app.swagger_ui_oauth2_redirect_url
+
+        async def docs(request: Request) -> Response:
+            root_path = request.scope.get("root_path", "").rstrip("/")
+            return get_swagger_ui_html(
+                openapi_url=root_path + openapi_url,
+                title=f"{self.app.title} - Swagger UI",
+                oauth2_redirect_url=root_path + oauth2_redirect_url if oauth2_redirect_url else None,
+                init_oauth=self.app.swagger_ui_init_oauth,
+                swagger_ui_parameters=self.app.swagger_ui_parameters,
+            )
+
+        async def oauth2_redirect(request: Request) -> Response:
+            return get_swagger_ui_oauth2_redirect_html()
+
+        async def redoc(request: Request) -> Response:
+            root_path = request.scope.get("root_path", "").rstrip("/")
+            return get_redoc_html(openapi_url=root_path + openapi_url, title=f"{self.app.title} - ReDoc")
+
+        self.app.add_route(openapi_url, openapi, include_in_schema=False)
+        self.app.add_route(docs_url, docs, include_in_schema=False)
+        if oauth2_redirect_url:
+            self.app.add_route(oauth2_redirect_url, oauth2_redirect, include_in_schema=False)
+        if redoc_url:
+            self.app.add_route(redoc_url, redoc, include_in_schema=False)
+
+
+def main(argv: list[str]) -> None:
+    from common.apps import load_module, resolve_app_dir
+
+    for name in argv or ["7"]:
+        module = load_module(resolve_app_dir(name))
+        cache = getattr(module, "openapi_cache", None)
+        if cache is None:
+            print(f"{name}: the app has no openapi_cache")
+            continue
+        cache.build()
+        print(f"{name}: wrote {cache.path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+"""
+Response cache for GET endpoints that are pure functions of their query string.
+
+Each cached route is described by a CacheRule, which turns the query string into a canonical key:
+    - the names the route accepts (aliases included, e.g. 'item-query') are resolved to one canonical name, and the
+      parameters the route doesn't read are dropped, since they can't change the response (unless the route forbids
+      extra parameters, then they stay in the key)
+    - the values of the parameters listed in `unordered` (e.g. 'tags', when the route treats them as a set) are sorted
+    - missing parameters get their default value, so '?limit=100' and '' share an entry when 100 is the default
+The rendered bytes of successful responses are stored in a size-bounded LRU with a TTL, together with an ETag, and a
+request whose If-None-Match matches the ETag gets a 304 without a body. Hits and misses are counted per route.
+"""
+import hashlib
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+from urllib.parse import parse_qsl, urlencode
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from starlette.routing import compile_path, get_route_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+@dataclass
+class CacheRule:
+    """
+    :param path: route path, with the same {param} syntax as the route
+    :param params: accepted query names (aliases included) -> canonical name, None keeps every parameter as it is
+    :param unordered: canonical names of the multi-value parameters whose order doesn't change the response
+    :param defaults: canonical name -> default values, used when the parameter is missing
+    :param forbid_extra: keep unknown parameters in the key, for routes that reject them
+    """
+    path: str
+    params: dict[str, str] | None = None
+    unordered: frozenset[str] = frozenset()
+    defaults: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    forbid_extra: bool = False
+
+    def __post_init__(self):
+        self.regex = compile_path(self.path)[0]
+
+    @classmethod
+    def from_model(cls, path: str, model: type[BaseModel], unordered: tuple[str, ...] = ()) -> "CacheRule":
+        """
+        Rule for a route declaring its query parameters with a Pydantic model (see app 3)
+        """
+        params, defaults = {}, {}
+        for name, info in model.model_fields.items():
+            params[info.alias or name] = name
+            default = info.default
+            if default is PydanticUndefined or default is None:
+                continue
+            values = default if isinstance(default, (list, tuple, set, frozenset)) else [default]
+            defaults[name] = tuple(str(value) for value in values)
+        return cls(
+            path=path,
+            params=params,
+            unordered=frozenset(unordered),
+            defaults=defaults,
+            forbid_extra=model.model_config.get("extra") == "forbid",
+        )
+
+    def key(self, query_string: bytes) -> str:
+        values: dict[str, list[str]] = {}
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+            canonical = name if self.params is None else self.params.get(name)
+            if canonical is None:
+                if not self.forbid_extra:
+                    continue
+                canonical = name
+            values.setdefault(canonical, []).append(value)
+        for name, default in self.defaults.items():
+            values.setdefault(name, list(default))
+        return urlencode([
+            (name, value)
+            for name in sorted(values)
+            for value in (sorted(values[name]) if name in self.unordered else values[name])
+        ])
+
+
+@dataclass
+class CachedResponse:
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    etag: str
+    expires: float
+
+
+class ResponseCache:
+    """
+    :param rules: the cached routes
+    :param max_bytes: total size of the cached bodies, the least recently used entries are evicted beyond it
+    :param ttl: seconds an entry is served for
+    :param max_entry_bytes: bigger responses are not cached
+    """
+
+    def __init__(self, rules: list[CacheRule], max_bytes: int = 16 << 20, ttl: float = 30.0,
+                 max_entry_bytes: int = 1 << 20):
+        self.rules = rules
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._size = 0
+        self.counters: dict[str, Counter] = {rule.path: Counter() for rule in rules}
+        self.evictions = 0
+
+    def match(self, path: str) -> CacheRule | None:
+        for rule in self.rules:
+            if rule.regex.match(path):
+                return rule
+        return None
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._size += len(entry.body)
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._size -= len(self._entries.pop(key).body)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "routes": {path: dict(counter) for path, counter in self.counters.items()},
+        }
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+class ResponseCacheMiddleware:
+    """
+    Add it with `app.add_middleware(ResponseCacheMiddleware, cache=cache)`, keeping `cache` around to expose its stats
+    """
+
+    def __init__(self, app: ASGIApp, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        path = get_route_path(scope)  # Without the prefix the app is mounted under
+        rule = self.cache.match(path)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        counter = self.cache.counters[rule.path]
+        key = f"{path}?{rule.key(scope['query_string'])}"
+        if_none_match = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"if-none-match"), "")
+        entry = self.cache.get(key)
+        if entry is not None:
+            counter["hits"] += 1
+            await self._send_entry(send, entry, if_none_match, counter)
+            return
+        counter["misses"] += 1
+
+        start: Message | None = None
+        chunks: list[bytes] = []
+        size = 0
+        passthrough = False
+
+        async def capture(message: Message) -> None:
+            nonlocal start, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                if start["status"] != 200:
+                    passthrough = True
+                    await send(start)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if more_body and size > self.cache.max_entry_bytes:
+                # Too big to be cached, send what was buffered and stop buffering
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+            elif not more_body:
+                body = b"".join(chunks)
+                etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+                headers = [*start["headers"], (b"etag", etag.encode())]
+                entry = CachedResponse(headers=headers, body=body, etag=etag, expires=time.monotonic() + self.cache.ttl)
+                if size <= self.cache.max_entry_bytes:
+                    self.cache.put(key, entry)
+                    counter["stores"] += 1
+                await self._send_entry(send, entry, if_none_match, counter)
+
+        await self.app(scope, receive, capture)
+
+    @staticmethod
+    async def _send_entry(send: Send, entry: CachedResponse, if_none_match: str, counter: Counter) -> None:
+        if if_none_match and etag_matches(if_none_match, entry.etag):
+            counter["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", entry.etag.encode())]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": entry.headers})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -0,0 +1,70 @@
+"""
+Fast JSON responses for endpoints that return Pydantic models.
+
+When an endpoint has no `response_model`, FastAPI passes whatever it returns through `jsonable_encoder`, which walks the
+whole tree in Python and builds a copy made of dicts and lists, and only then renders it with `json.dumps`. For big
+nested models (an Offer with thousands of items, each with its images) that walk is most of the cost of the request.
+
+Endpoints decorated with `fast_json_response` return a Response that is rendered straight from the models, either with
+pydantic-core's serializer (written in Rust, it knows the schema of every model) or with orjson. FastAPI sends
+Response objects as they are, so the generic encoder is skipped. The mode is opt-in, set in the environment:
+    FAST_JSON_RESPONSES=pydantic fastapi dev main.py
+    FAST_JSON_RESPONSES=orjson fastapi dev main.py
+and with the variable unset the decorator leaves the endpoints untouched.
+"""
+import functools
+import os
+from typing import Any
+
+import pydantic_core
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+
+class PydanticJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+class ORJSONModelResponse(JSONResponse):
+    """
+    orjson doesn't know Pydantic models nor sets, those are handed to pydantic-core through `default`
+    """
+
+    def render(self, content: Any) -> bytes:
+        import orjson
+
+        return orjson.dumps(content, default=pydantic_core.to_jsonable_python, option=orjson.OPT_NON_STR_KEYS)
+
+
+RESPONSE_CLASSES: dict[str, type[JSONResponse]] = {
+    "pydantic": PydanticJSONResponse,
+    "orjson": ORJSONModelResponse,
+}
+
+
+def fast_json_response(endpoint=None, *, mode: str | None = None):
+    """
+    Decorator for async endpoints, place it under the route decorator:
+        @app.post("/offers/")
+        @fast_json_response
+        async def create_offer(offer: Offer):
+    :param mode: 'pydantic' or 'orjson', by default the FAST_JSON_RESPONSES environment variable; no mode disables it
+    """
+    if endpoint is None:
+        return functools.partial(fast_json_response, mode=mode)
+    mode = mode if mode is not None else os.environ.get("FAST_JSON_RESPONSES", "")
+    if not mode:
+        return endpoint
+    if mode not in RESPONSE_CLASSES:
+        raise ValueError(f"Unknown FAST_JSON_RESPONSES mode {mode!r}, expected one of {', '.join(RESPONSE_CLASSES)}")
+    response_class = RESPONSE_CLASSES[mode]
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        content = await endpoint(*args, **kwargs)
+        if isinstance(content, Response):
+            return content  # The endpoint built its own response, e.g. for another status code
+        return response_class(content)
+
+    return wrapper
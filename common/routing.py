@@ -0,0 +1,19 @@
+"""
+Helpers to extend the APIRoute class used by an app.
+
+Several features of the shared code (per-phase timings, binary body formats) need to hook into FastAPI's request
+handling, which is done by subclassing APIRoute. Each of them is written as a subclass that calls super(), so they can be
+stacked: `extend_route_class` mixes one more into the route class the app already uses. Like any route class, it only
+applies to the routes declared afterwards, so call it right after creating the app.
+"""
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+
+def extend_route_class(app: FastAPI, route_class: type[APIRoute], **attributes) -> None:
+    """
+    :param route_class: an APIRoute subclass that cooperates through super()
+    :param attributes: class attributes of the combined class, e.g. the object the routes report to
+    """
+    current = app.router.route_class
+    app.router.route_class = type(route_class.__name__, (route_class, current), attributes)
@@ -0,0 +1,316 @@
+"""
+Snapshot files of the state the apps hold server-side, opened with mmap: a restarted process serves its reads straight
+from the mapped pages instead of rebuilding its state from JSON first.
+
+A snapshot is one file of named sections:
+    - a header: magic, version and number of sections, then the name, offset and size of each section
+    - the sections, each one aligned on 8 bytes: fixed-width records and arrays (wrapped as NumPy arrays), string tables
+      (the UTF-8 strings back to back in a "<name>.data" section, and a "<name>.offsets" section of uint64 offsets:
+      string i is data[offsets[i]:offsets[i + 1]], plus an optional "<name>.index" section: a hash table of the strings,
+      CRC-32 and linear probing, for lookups by value) and a JSON "meta" section, with what each store needs to read
+      its sections back
+Opening a snapshot only parses the header, nothing is copied: the sections are views on the mapping and their pages are
+read from disk when first touched. Mapped read-only, those pages are the page cache of the file, so every worker opening
+the same snapshot shares one physical copy of it, that the kernel can drop and read again when memory is tight.
+
+A snapshot is never modified: a new one is written next to it and renamed over it, the processes that mapped the old
+one keep reading it until they restart. The stores keep their changes since the snapshot in memory, on top of the mapped
+data, until the next snapshot. Commands, from the repository root:
+    python -m common.snapshot snapshot 1 4 6    writes the snapshot of each app from its current state (the previous
+                                                snapshot, plus the item log of app 4)
+    python -m common.snapshot compact 4         the same, then starts a new, empty item log (stop the writers first)
+    python -m common.snapshot info 4            the sections of the snapshot of an app
+The snapshot of an app is `state.snapshot` in its directory, or `<app directory>.snapshot` in `SNAPSHOT_DIR` when set.
+`SNAPSHOT_LOAD=0` starts the apps without it.
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections.abc import Iterable, Mapping, Sequence
+from pathlib import Path
+from typing import Any, Protocol
+
+import numpy as np
+
+MAGIC = b"FXSNAP\r\n"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+SECTION = struct.Struct("<48sQQ")  # Name, offset, size
+ALIGNMENT = 8
+EMPTY_SLOT = 0xFFFFFFFF
+
+Sections = dict[str, bytes | memoryview | np.ndarray]
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class Snapshottable(Protocol):
+    def snapshot_state(self) -> Any:
+        """
+        A copy of what the snapshot of the store holds, taken on the event loop: the sections are built from it in a
+        thread while the store keeps changing
+        """
+
+    def snapshot_sections(self, name: str, state: Any) -> tuple[Sections, dict[str, Any]]:
+        """
+        The sections of the state, their names starting with `name` + ".", and its entry of the meta section
+        """
+
+
+def string_table(name: str, strings: Iterable[str | bytes], index: bool = False) -> Sections:
+    """
+    :param index: also write the hash table of the strings, which must then be distinct
+    """
+    encoded = [string.encode() if isinstance(string, str) else string for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded)), out=offsets[1:])
+    sections: Sections = {f"{name}.offsets": offsets, f"{name}.data": b"".join(encoded)}
+    if index:
+        table = [EMPTY_SLOT] * (1 << (2 * len(encoded)).bit_length())  # At most half full
+        mask = len(table) - 1
+        for position, string in enumerate(encoded):
+            slot = zlib.crc32(string) & mask
+            while table[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & mask
+            table[slot] = position
+        sections[f"{name}.index"] = np.array(table, dtype=np.uint32)
+    return sections
+
+
+class StringTable(Sequence[str]):
+    """
+    The strings of a string table, decoded one at a time from the mapped pages. Sorted, it can be searched with bisect.
+    """
+
+    def __init__(self, offsets: memoryview, data: memoryview, index: memoryview | None = None):
+        self._offsets = offsets
+        self._data = data
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, index: int) -> memoryview:
+        if index < 0:
+            index += len(self)
+        return self._data[self._offsets[index]:self._offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.raw(index), "utf-8")
+
+    def find(self, string: str) -> int | None:
+        """
+        The position of the string, None when it isn't in the table. Needs the hash table, see `string_table`.
+        """
+        key = string.encode()
+        mask = len(self._index) - 1
+        slot = zlib.crc32(key) & mask
+        while (position := self._index[slot]) != EMPTY_SLOT:
+            if self.raw(position) == key:
+                return position
+            slot = (slot + 1) & mask
+        return None
+
+
+def _as_bytes(value: bytes | memoryview | np.ndarray) -> memoryview:
+    if isinstance(value, np.ndarray):
+        return memoryview(np.ascontiguousarray(value)).cast("B")
+    return memoryview(value).cast("B")
+
+
+def write_snapshot(path: str | os.PathLike, sections: Mapping[str, bytes | memoryview | np.ndarray],
+                   meta: dict[str, Any]) -> int:
+    """
+    Writes the snapshot next to `path`, fsyncs it and renames it over `path`
+    :return: the size of the file
+    """
+    path = Path(path)
+    views = {"meta": memoryview(json.dumps(meta).encode())}
+    views.update((name, _as_bytes(value)) for name, value in sections.items())
+    offset = HEADER.size + SECTION.size * len(views)
+    table = []
+    for name, view in views.items():
+        if len(name.encode()) > SECTION.size - 16:
+            raise SnapshotError(f"Section name {name!r} is too long")
+        offset += -offset % ALIGNMENT
+        table.append(SECTION.pack(name.encode(), offset, view.nbytes))
+        offset += view.nbytes
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+    temporary = Path(temporary)
+    try:
+        with open(descriptor, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(views)))
+            file.write(b"".join(table))
+            for view in views.values():
+                file.write(b"\0" * (-file.tell() % ALIGNMENT))
+                file.write(view)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+    return offset
+
+
+class Snapshot:
+    """
+    A snapshot file mapped read-only. The mapping lives as long as the Snapshot and the arrays and views taken from it.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap.size() < HEADER.size:
+            raise SnapshotError(f"{self.path} is not a snapshot")
+        magic, version, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"{self.path} is not a snapshot of version {VERSION}")
+        self._sections: dict[str, tuple[int, int]] = {}
+        for name, offset, size in SECTION.iter_unpack(self._mmap[HEADER.size:HEADER.size + SECTION.size * count]):
+            if offset + size > self._mmap.size():
+                raise SnapshotError(f"{self.path} is truncated")
+            self._sections[name.rstrip(b"\0").decode()] = (offset, size)
+        self.meta: dict[str, Any] = json.loads(bytes(self.section("meta")))
+
+    @property
+    def size(self) -> int:
+        return self._mmap.size()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def sections(self) -> dict[str, int]:
+        """
+        The size of each section
+        """
+        return {name: size for name, (_, size) in self._sections.items()}
+
+    def section(self, name: str) -> memoryview:
+        """
+        Raises KeyError when the snapshot has no section with that name
+        """
+        offset, size = self._sections[name]
+        return memoryview(self._mmap)[offset:offset + size]
+
+    def array(self, name: str, dtype: np.dtype | type) -> np.ndarray:
+        """
+        The section as a read-only NumPy array of `dtype`, without copying it
+        """
+        offset, size = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mmap, dtype=dtype, count=size // dtype.itemsize, offset=offset)
+
+    def strings(self, name: str) -> StringTable:
+        index = self.section(f"{name}.index").cast("I") if f"{name}.index" in self else None
+        return StringTable(self.section(f"{name}.offsets").cast("Q"), self.section(f"{name}.data"), index)
+
+
+def snapshot_path(main_file: str | os.PathLike) -> Path:
+    """
+    Where the snapshot of the app whose main.py is `main_file` lives
+    """
+    app_dir = Path(main_file).resolve().parent
+    directory = os.environ.get("SNAPSHOT_DIR")
+    return Path(directory) / f"{app_dir.name}.snapshot" if directory else app_dir / "state.snapshot"
+
+
+class AppSnapshot:
+    """
+    The snapshot of an app and the stores saved in it, each one under its name. The snapshot is opened when it exists,
+    the app then opens its stores on it (see `has`).
+    """
+
+    def __init__(self, main_file: str | os.PathLike):
+        self.path = snapshot_path(main_file)
+        self.snapshot: Snapshot | None = None
+        if self.path.exists() and os.environ.get("SNAPSHOT_LOAD", "1") != "0":
+            self.snapshot = Snapshot(self.path)
+        self.stores: dict[str, Snapshottable] = {}
+
+    def has(self, name: str) -> bool:
+        return self.snapshot is not None and name in self.snapshot.meta
+
+    def register(self, name: str, store: Snapshottable) -> Snapshottable:
+        self.stores[name] = store
+        return store
+
+    def write(self) -> int:
+        """
+        Writes a new snapshot of the registered stores, blocking: from a running app, use `write_async`
+        :return: the size of the file
+        """
+        return self._write({name: store.snapshot_state() for name, store in self.stores.items()})
+
+    async def write_async(self) -> int:
+        """
+        Copies the state of the stores on the event loop, then builds and writes the snapshot in a thread
+        """
+        states = {name: store.snapshot_state() for name, store in self.stores.items()}
+        return await asyncio.to_thread(self._write, states)
+
+    def _write(self, states: dict[str, Any]) -> int:
+        sections: Sections = {}
+        meta: dict[str, Any] = {}
+        for name, state in states.items():
+            store_sections, meta[name] = self.stores[name].snapshot_sections(name, state)
+            sections.update(store_sections)
+        return write_snapshot(self.path, sections, meta)
+
+
+async def snapshot_app(dirname: str, compact: bool = False) -> AppSnapshot | None:
+    """
+    Runs the startup of the app (its lifespan) so that its stores load their persisted state, and writes their snapshot
+    """
+    from common.apps import load_module
+
+    module = load_module(dirname)
+    app_snapshot = getattr(module, "app_snapshot", None)
+    if app_snapshot is None:
+        return None
+    async with module.app.router.lifespan_context(module.app):
+        await app_snapshot.write_async()
+        if compact:
+            for store in app_snapshot.stores.values():
+                if hasattr(store, "rotate_log"):
+                    await store.rotate_log()
+    return app_snapshot
+
+
+def main(argv: list[str] | None = None) -> None:
+    from common.apps import APP_DIRS, resolve_app_dir
+
+    parser = argparse.ArgumentParser(description="Write, compact or describe the snapshots of the apps")
+    parser.add_argument("command", choices=("snapshot", "compact", "info"))
+    parser.add_argument("apps", nargs="*", help="the apps, by number, directory or slug (all of them by default)")
+    args = parser.parse_args(argv)
+
+    for dirname in map(resolve_app_dir, args.apps) if args.apps else APP_DIRS:
+        if args.command == "info":
+            path = snapshot_path(Path(__file__).resolve().parent.parent / dirname / "main.py")
+            if not path.exists():
+                print(f"{dirname}: no snapshot at {path}")
+                continue
+            snapshot = Snapshot(path)
+            print(f"{dirname}: {path} ({snapshot.size:,} bytes), stores: {', '.join(snapshot.meta) or 'none'}")
+            for name, size in snapshot.sections().items():
+                print(f"    {name:<48} {size:>14,}")
+            continue
+        app_snapshot = asyncio.run(snapshot_app(dirname, compact=args.command == "compact"))
+        if app_snapshot is None:
+            print(f"{dirname}: the app has no app_snapshot")
+        else:
+            print(f"{dirname}: wrote {app_snapshot.path} ({', '.join(app_snapshot.stores)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Inverted index of item tags, with interned tags and boolean queries.
+
+Every tag is interned once: the interner keeps one string object per distinct tag and gives it a small integer ID.
+Validated items hold the interned strings (see `TagIndex.canonical`, used as a validator of the `tags` fields) and the
+index holds, per item, only the tuple of its tag IDs, so a tag found on a million items is stored once instead of a
+million times. Each tag ID maps to a RoaringBitmap of the IDs of its items. Tags are only interned when an item carrying
+them is indexed: validating a body never grows the interner, whatever tags the clients send.
+
+Queries are boolean expressions of tags, with AND, OR, NOT and parentheses (NOT binds tighter than AND, which binds
+tighter than OR), e.g. `rock AND (metal OR punk) AND NOT pop`. Tags with spaces or named like an operator are written
+in double quotes. They are evaluated on the bitmaps, NOT being the difference with the bitmap of every indexed item.
+"""
+import re
+from collections.abc import Iterable
+
+import numpy as np
+
+from common.bitmaps import RoaringBitmap
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+class TagInterner:
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._tags: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def intern(self, tag: str) -> int:
+        tag_id = self._ids.get(tag)
+        if tag_id is None:
+            tag_id = self._ids[tag] = len(self._tags)
+            self._tags.append(tag)
+        return tag_id
+
+    def lookup(self, tag: str) -> int | None:
+        """
+        The ID of a tag already seen, without interning it
+        """
+        return self._ids.get(tag)
+
+    def tag(self, tag_id: int) -> str:
+        return self._tags[tag_id]
+
+
+_TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<word>[^\s()"]+))')
+_OPERATORS = ("AND", "OR", "NOT")
+MAX_DEPTH = 50  # Nested parentheses and NOTs: the parser and the evaluation recurse once per level
+
+
+def _tokenize(expression: str) -> list[tuple[str, str]]:
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise TagQueryError(f"Unexpected character at {position}: {expression[position:position + 10]!r}")
+        position = match.end()
+        if match["paren"]:
+            tokens.append((match["paren"], match["paren"]))
+        elif match["quoted"] is not None:
+            tokens.append(("tag", re.sub(r"\\(.)", r"\1", match["quoted"])))
+        elif match["word"].upper() in _OPERATORS:
+            tokens.append((match["word"].upper(), match["word"]))
+        else:
+            tokens.append(("tag", match["word"]))
+    return tokens
+
+
+def parse_tag_query(expression: str) -> tuple:
+    """
+    Parses an expression into a tree of ("tag", name), ("not", node), ("and", left, right) and ("or", left, right),
+    raises TagQueryError when it is invalid or nests deeper than MAX_DEPTH
+    """
+    tokens = _tokenize(expression)
+    if not tokens:
+        raise TagQueryError("Empty query")
+    position = depth = 0
+
+    def peek() -> str | None:
+        return tokens[position][0] if position < len(tokens) else None
+
+    def take(kind: str) -> str:
+        nonlocal position
+        if peek() != kind:
+            found = repr(tokens[position][1]) if position < len(tokens) else "the end of the query"
+            raise TagQueryError(f"Expected {'a tag' if kind == 'tag' else repr(kind)} but found {found}")
+        position += 1
+        return tokens[position - 1][1]
+
+    def disjunction() -> tuple:
+        node = conjunction()
+        while peek() == "OR":
+            take("OR")
+            node = ("or", node, conjunction())
+        return node
+
+    def conjunction() -> tuple:
+        node = negation()
+        while peek() == "AND":
+            take("AND")
+            node = ("and", node, negation())
+        return node
+
+    def negation() -> tuple:
+        nonlocal depth
+        if peek() not in ("NOT", "("):
+            return ("tag", take("tag"))
+        depth += 1
+        if depth > MAX_DEPTH:
+            raise TagQueryError(f"The query nests more than {MAX_DEPTH} parentheses and NOTs")
+        if take(peek()) == "NOT":
+            node = ("not", negation())
+        else:
+            node = disjunction()
+            take(")")
+        depth -= 1
+        return node
+
+    tree = disjunction()
+    if position != len(tokens):
+        raise TagQueryError(f"Unexpected {tokens[position][1]!r}")
+    return tree
+
+
+class TagIndex:
+    """
+    Tags of the items, by item ID (32-bit unsigned), and the bitmap of the items of each tag
+    """
+
+    def __init__(self):
+        self.interner = TagInterner()
+        self._item_tags: dict[int, tuple[int, ...]] = {}
+        self._bitmaps: dict[int, RoaringBitmap] = {}
+        self._all = RoaringBitmap()
+
+    def __len__(self) -> int:
+        return len(self._item_tags)
+
+    @staticmethod
+    def indexable(item_id: int) -> bool:
+        return 0 <= item_id <= 0xFFFFFFFF
+
+    def canonical(self, tags: set[str]) -> set[str]:
+        """
+        Validator of the tags fields: the same tags, as the interned strings for those already interned. The others are
+        kept as they are, and interned by `put` if the item gets indexed.
+        """
+        interner = self.interner
+        return {tag if (tag_id := interner.lookup(tag)) is None else interner.tag(tag_id) for tag in tags}
+
+    def put(self, item_id: int, tags: Iterable[str]) -> None:
+        """
+        Sets the tags of an item, replacing those it had
+        """
+        if not self.indexable(item_id):
+            raise ValueError(f"Item ID {item_id} can't be indexed, IDs go from 0 to {0xFFFFFFFF}")
+        tag_ids = tuple(sorted({self.interner.intern(tag) for tag in tags}))
+        previous = self._item_tags.get(item_id, ())
+        for tag_id in set(previous) - set(tag_ids):
+            self._bitmaps[tag_id].discard(item_id)
+        for tag_id in set(tag_ids) - set(previous):
+            bitmap = self._bitmaps.get(tag_id)
+            if bitmap is None:
+                bitmap = self._bitmaps[tag_id] = RoaringBitmap()
+            bitmap.add(item_id)
+        self._item_tags[item_id] = tag_ids
+        self._all.add(item_id)
+
+    def bulk_load(self, item_ids: np.ndarray, tag_ids: np.ndarray) -> None:
+        """
+        Builds the index at once from (item ID, tag ID) pairs, the tags being IDs of `interner`; replaces its content
+        """
+        order = np.lexsort((item_ids, tag_ids))
+        item_ids, tag_ids = item_ids[order], tag_ids[order]
+        boundaries = np.flatnonzero(np.diff(tag_ids)) + 1
+        self._bitmaps = {int(tags[0]): RoaringBitmap.from_ids(items) for tags, items
+                         in zip(np.split(tag_ids, boundaries), np.split(item_ids, boundaries)) if len(tags)}
+        self._item_tags = {}
+        by_item = np.lexsort((tag_ids, item_ids))
+        for item_id, tags in zip(*self._group(item_ids[by_item], tag_ids[by_item])):
+            self._item_tags[item_id] = tags
+        self._all = RoaringBitmap.from_ids(np.fromiter(self._item_tags, dtype=np.uint32, count=len(self._item_tags)))
+
+    @staticmethod
+    def _group(item_ids: np.ndarray, tag_ids: np.ndarray) -> tuple[list[int], list[tuple[int, ...]]]:
+        boundaries = np.flatnonzero(np.diff(item_ids)) + 1
+        starts = np.concatenate(([0], boundaries)) if len(item_ids) else np.empty(0, dtype=np.int64)
+        tags = np.split(tag_ids, boundaries) if len(item_ids) else []
+        return item_ids[starts].tolist(), [tuple(group.tolist()) for group in tags]
+
+    def remove(self, item_id: int) -> None:
+        for tag_id in self._item_tags.pop(item_id, ()):
+            self._bitmaps[tag_id].discard(item_id)
+        self._all.discard(item_id)
+
+    def tags_of(self, item_id: int) -> list[str]:
+        return [self.interner.tag(tag_id) for tag_id in self._item_tags.get(item_id, ())]
+
+    def items_with(self, tag: str) -> RoaringBitmap:
+        tag_id = self.interner.lookup(tag)
+        if tag_id is None:
+            return RoaringBitmap()
+        return self._bitmaps.get(tag_id) or RoaringBitmap()
+
+    def query(self, expression: str) -> RoaringBitmap:
+        """
+        The items matching the expression, raises TagQueryError when it can't be parsed
+        """
+        return self._evaluate(parse_tag_query(expression))
+
+    def _evaluate(self, node: tuple) -> RoaringBitmap:
+        kind = node[0]
+        if kind == "tag":
+            return self.items_with(node[1])
+        if kind == "not":
+            return self._all - self._evaluate(node[1])
+        # A AND NOT B is computed as a difference, not as an intersection with the complement of B
+        left, right = node[1], node[2]
+        if kind == "and" and right[0] == "not":
+            return self._evaluate(left) - self._evaluate(right[1])
+        if kind == "and" and left[0] == "not":
+            return self._evaluate(right) - self._evaluate(left[1])
+        if kind == "and":
+            return self._evaluate(left) & self._evaluate(right)
+        return self._evaluate(left) | self._evaluate(right)
+
+    def stats(self) -> dict:
+        return {
+            "items": len(self._item_tags),
+            "tags": len(self.interner),
+            "bitmap_bytes": sum(bitmap.nbytes for bitmap in self._bitmaps.values()) + self._all.nbytes,
+        }
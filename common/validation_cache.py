@@ -0,0 +1,81 @@
+"""
+Cache of validated values by input string, to use as a WrapValidator.
+
+Validating an HttpUrl parses the string from scratch and builds a new URL object, even when the same string was
+validated a moment before: a catalog that reuses a few thousand CDN URLs across a million images parses them a million
+times, and keeps a million equal URL objects. With
+    url: Annotated[HttpUrl, WrapValidator(url_cache)]
+a string already validated gets the very object validated the first time, interned, instead of being parsed again.
+Only valid strings are cached: an invalid one goes through the validator, and gets its error, every time.
+
+The cache keeps up to `max_entries` strings, the oldest one is evicted to make room for a new one (first in, first
+out: a hit doesn't reorder anything, so that it costs a single dict lookup). It is shared by the requests and can be
+used from several threads (a thread pool validating bodies): a lookup is one atomic dict read, and the writes hold a
+lock. The hit counters aren't locked, with threads they may miss a few hits. Validated values must be immutable, as the
+same object ends up in many models.
+"""
+import sys
+import threading
+from typing import Any
+
+from pydantic import ValidatorFunctionWrapHandler
+
+
+class ValidationCache:
+    """
+    :param max_entries: strings kept, the oldest ones are evicted first
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[Any, int]] = {}  # string -> (value, its size in bytes), oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __call__(self, value: Any, handler: ValidatorFunctionWrapHandler) -> Any:
+        if type(value) is not str:
+            return handler(value)
+        entry = self._entries.get(value)
+        if entry is not None:
+            self.hits += 1
+            self.bytes_saved += entry[1]
+            return entry[0]
+        validated = handler(value)  # Raises ValidationError for invalid strings
+        size = self._size(validated)
+        with self._lock:
+            self.misses += 1
+            if value not in self._entries:
+                while len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                    self.evictions += 1
+                self._entries[value] = (validated, size)
+        return validated
+
+    @staticmethod
+    def _size(value: Any) -> int:
+        """
+        What a new copy of the value would take, roughly: the object and, for URLs and the like, the string it keeps
+        """
+        return sys.getsizeof(value) + sys.getsizeof(str(value))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,246 @@
+"""
+Item store with a write-behind buffer in front of an append-only log file.
+
+Writes update the in-memory state right away and mark the item as dirty. A background task flushes the dirty items
+every `flush_interval` seconds (or sooner, when `max_batch` items are waiting), writing one JSON line per item. Because
+the buffer is keyed by item ID, repeated writes to the same item inside a flush window are merged and reach the file as
+a single line. On start, the log is replayed to rebuild the state (the last line of an item wins). When a flush fails
+(disk full, permissions), its batch goes back to the buffer and the flusher retries it at the next interval. A line
+cut short by a crash is skipped by the replay, and the next flush ends it before writing its own lines.
+
+With a snapshot (see common/snapshot.py), the items it holds are read from its mapped pages, decoded when asked for, and
+only the end of the log is replayed: the snapshot records which log file it covers (its inode) and up to which offset.
+Once a snapshot holds the whole log, `rotate_log` starts a new, empty one.
+
+Durability modes:
+    - "none": nothing is written, the state only lives in memory
+    - "async": batches are written but not fsynced, a crash of the machine can lose the last batches
+    - "fsync": every batch is fsynced
+    - "sync": like "fsync", and writers wait until their batch is on disk before returning. Writers arriving while a
+      batch is being written share the next one (group commit), so it costs one fsync per batch, not per write
+"""
+import asyncio
+import json
+import logging
+import os
+from bisect import bisect_left
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+
+from common.snapshot import Sections, Snapshot, StringTable, string_table
+
+logger = logging.getLogger(__name__)
+
+Durability = Literal["none", "async", "fsync", "sync"]
+
+
+class WriteBehindStore:
+    def __init__(self, path: str | os.PathLike, durability: Durability = "async", flush_interval: float = 0.05,
+                 max_batch: int = 1000):
+        if durability not in ("none", "async", "fsync", "sync"):
+            raise ValueError(f"Unknown durability mode {durability!r}")
+        self.path = Path(path)
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._state: dict[int, dict[str, Any]] = {}
+        self._dirty: dict[int, dict[str, Any]] = {}
+        self._wake = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._next_batch: asyncio.Future | None = None
+        self._flusher: asyncio.Task | None = None
+        self._mapped_ids: memoryview | tuple = ()  # Sorted
+        self._mapped_json: StringTable | None = None
+        self._shadowed = 0  # Mapped items written since the snapshot
+        self._log_position = (0, 0)  # Inode of the log and offset of the first line not in the state yet
+        self.writes = 0
+        self.lines_written = 0
+        self.flush_errors = 0
+
+    def load_snapshot(self, snapshot: Snapshot, name: str) -> None:
+        """
+        Call it before `start`, the log is then replayed from where the snapshot stopped
+        """
+        self._mapped_ids = snapshot.section(f"{name}.ids").cast("q")
+        self._mapped_json = snapshot.strings(f"{name}.json")
+        log = snapshot.meta[name]["log"]
+        self._log_position = (log["inode"], log["offset"])
+
+    def _mapped_index(self, item_id: int) -> int | None:
+        index = bisect_left(self._mapped_ids, item_id)
+        return index if index < len(self._mapped_ids) and self._mapped_ids[index] == item_id else None
+
+    def __len__(self) -> int:
+        return len(self._state) + len(self._mapped_ids) - self._shadowed
+
+    def get(self, item_id: int) -> dict[str, Any] | None:
+        record = self._state.get(item_id)
+        if record is None and (index := self._mapped_index(item_id)) is not None:
+            return json.loads(bytes(self._mapped_json.raw(index)))
+        return record
+
+    def get_json(self, item_id: int) -> bytes | None:
+        """
+        The JSON of an item not written since the snapshot, copied from the mapped pages, None for any other item
+        """
+        if item_id in self._state or (index := self._mapped_index(item_id)) is None:
+            return None
+        return bytes(self._mapped_json.raw(index))
+
+    def items(self) -> Iterator[tuple[int, dict[str, Any]]]:
+        yield from self._state.items()
+        for index, item_id in enumerate(self._mapped_ids):
+            if item_id not in self._state:
+                yield item_id, json.loads(bytes(self._mapped_json.raw(index)))
+
+    def items_since_snapshot(self) -> Iterator[tuple[int, dict[str, Any]]]:
+        return iter(self._state.items())
+
+    def _set(self, item_id: int, record: dict[str, Any]) -> None:
+        if item_id not in self._state and self._mapped_index(item_id) is not None:
+            self._shadowed += 1
+        self._state[item_id] = record
+
+    async def start(self) -> None:
+        if self.durability != "none":
+            await asyncio.to_thread(self._replay)
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def put(self, item_id: int, record: dict[str, Any]) -> None:
+        """
+        Merges `record` into the stored item: the keys it has replace the stored ones, the others are kept
+        """
+        await self.put_many({item_id: record})
+
+    async def put_many(self, records: dict[int, dict[str, Any]]) -> None:
+        for item_id, record in records.items():
+            merged = {**(self.get(item_id) or {}), **record}
+            self._set(item_id, merged)
+            self._dirty[item_id] = merged
+        self.writes += len(records)
+        if self.durability == "none":
+            self._dirty.clear()
+            return
+        if len(self._dirty) >= self.max_batch:
+            self._wake.set()
+        if self.durability == "sync":
+            if self._flusher is None:
+                await self.flush()
+                return
+            if self._next_batch is None:
+                self._next_batch = asyncio.get_running_loop().create_future()
+            batch = self._next_batch
+            self._wake.set()
+            await asyncio.shield(batch)
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            batch, self._dirty = self._dirty, {}
+            waiters, self._next_batch = self._next_batch, None
+            try:
+                if batch:
+                    await asyncio.to_thread(self._append, batch)
+            except BaseException as exc:
+                # The batch goes back to the buffer for the next flush, the writes made since then win
+                self._dirty = batch | self._dirty
+                if waiters is not None and not waiters.done():
+                    waiters.set_exception(exc)
+                raise
+            if waiters is not None and not waiters.done():
+                waiters.set_result(None)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Disk full, permissions... the flusher keeps going, the batch is retried at the next interval
+                self.flush_errors += 1
+                logger.exception("Writing %d items to %s failed", len(self._dirty), self.path)
+                await asyncio.sleep(self.flush_interval)  # Writers may keep waking it up, don't retry in a loop
+
+    def _append(self, batch: dict[int, dict[str, Any]]) -> None:
+        lines = "".join(json.dumps({"id": item_id, "data": record}, separators=(",", ":")) + "\n"
+                        for item_id, record in batch.items()).encode()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a+b") as log:
+            inode, start = os.fstat(log.fileno()).st_ino, log.tell()
+            if start and os.pread(log.fileno(), 1, start - 1) != b"\n":
+                # The last line was cut short by a crash: ended here, the replay skips it instead of reading it together
+                # with the first line of the batch
+                lines = b"\n" + lines
+            log.write(lines)
+            if self.durability in ("fsync", "sync"):
+                log.flush()
+                os.fsync(log.fileno())
+        self.lines_written += len(batch)
+        if start == 0 or self._log_position == (inode, start):
+            # Every line up to the end of the batch is in the state. When other processes appended lines in between,
+            # the position stays before them
+            self._log_position = (inode, start + len(lines))
+
+    def _replay(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as log:
+            inode, offset = self._log_position
+            stat = os.fstat(log.fileno())
+            if stat.st_ino != inode or stat.st_size < offset:
+                offset = 0  # Not the log the snapshot covers, the lines are full records so replaying them is harmless
+            log.seek(offset)
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break  # Still being written, it is replayed next time
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+                self._set(entry["id"], entry["data"])
+        self._log_position = (stat.st_ino, offset)
+
+    async def rotate_log(self) -> None:
+        """
+        Starts a new, empty log, call it once a snapshot holds the current one. The lines other processes write to the
+        current log meanwhile are lost: stop them first.
+        """
+        await self.flush()
+        async with self._write_lock:
+            temporary = self.path.with_name(f"{self.path.name}.new")
+            temporary.write_bytes(b"")
+            os.replace(temporary, self.path)
+            self._log_position = (os.stat(self.path).st_ino, 0)
+
+    def snapshot_state(self) -> tuple[dict[int, dict[str, Any]], tuple[int, int]]:
+        return dict(self._state), self._log_position  # A write replaces the record of an item, it never changes it
+
+    def snapshot_sections(self, name: str,
+                          state: tuple[dict[int, dict[str, Any]], tuple[int, int]]) -> tuple[Sections, dict[str, Any]]:
+        written, (inode, offset) = state
+        records: dict[int, bytes | memoryview] = {
+            item_id: self._mapped_json.raw(index) for index, item_id in enumerate(self._mapped_ids)
+        }
+        records.update((item_id, json.dumps(record, separators=(",", ":")).encode())
+                       for item_id, record in written.items())
+        ids = sorted(records)
+        sections = string_table(f"{name}.json", (records[item_id] for item_id in ids))
+        sections[f"{name}.ids"] = np.array(ids, dtype=np.int64)
+        return sections, {"items": len(ids), "log": {"inode": inode, "offset": offset}}
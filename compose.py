@@ -0,0 +1,24 @@
+"""
+Every exercise app in a single process, run from the repository root:
+    fastapi dev compose.py
+Each app is mounted under the slug of its directory (http://localhost:8000/body-nested-models/docs) and imported on the
+first request to it. http://localhost:8000/_apps lists the apps with their import, startup and schema build times.
+
+The requests of all the apps go through one admission controller: the bulk writes get a strict lane, the reads (like
+GET /path-parameters-and-numeric-validations/items/{item_id}) a priority one. http://localhost:8000/_admission shows
+the event loop lag and the requests admitted and rejected. It is off unless ADMISSION_CONTROL=1.
+"""
+from common.admission import AdmissionController, AdmissionRule, admission_enabled, lanes_from_env
+from common.composer import compose
+
+admission = AdmissionController(lanes_from_env(), rules=[
+    AdmissionRule("/body-fields/items/bulk/", "bulk", methods={"POST"}),
+    AdmissionRule("/body-multiple-parameters/items/", "bulk", methods={"PUT"}),
+    AdmissionRule("/body-nested-models/offers/", "bulk", methods={"POST"}),
+    AdmissionRule("/body-nested-models/images/multiple/", "bulk", methods={"POST"}),
+    AdmissionRule("/body-nested-models/images/multiple/stream/", "bulk", methods={"POST"}),
+    AdmissionRule("/body-nested-models/index-weights/{path:path}", "bulk", methods={"POST"}),
+    AdmissionRule("/{path:path}", "priority", methods={"GET", "HEAD"}),
+])
+
+app = compose(admission=admission if admission_enabled() else None)
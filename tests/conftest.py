@@ -0,0 +1,88 @@
+"""
+The apps are tested the way compose.py serves them: mounted under their prefix in one composed app, imported and
+started once per test session. Everything they persist (the item log of app 4, the snapshots, the OpenAPI cache of
+app 7) goes to a temporary directory instead of next to them, where their next start would load it.
+
+Admission control is on, so that app 6 is tested behind its AdmissionMiddleware, with lag thresholds no test run
+reaches: a slow machine gets no 503.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+STATE_DIR = Path(tempfile.mkdtemp(prefix="tests_state_"))
+os.environ["SNAPSHOT_DIR"] = str(STATE_DIR / "snapshots")
+os.environ["ITEM_STORE_PATH"] = str(STATE_DIR / "items.log")
+os.environ["OPENAPI_CACHE_DIR"] = str(STATE_DIR / "openapi_cache")
+os.environ["ADMISSION_CONTROL"] = "1"
+for lane in ("PRIORITY", "BULK"):
+    os.environ[f"ADMISSION_{lane}_MAX_LAG_MS"] = "60000"
+os.environ["ADMISSION_MAX_LAG_MS"] = "60000"
+
+from common.apps import app_slug, resolve_app_dir  # noqa: E402, the environment is read when the apps are imported
+from common.composer import compose  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(STATE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"  # The stores and queues of the apps use asyncio directly
+
+
+class MountedClient:
+    """
+    Requests to one of the composed apps, with the paths of its own routes: the prefix of its mount is added
+    """
+
+    def __init__(self, client: TestClient, prefix: str):
+        self.client = client
+        self.prefix = prefix
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        return self.client.request(method, self.prefix + path, **kwargs)
+
+    def get(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("DELETE", path, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def composed_client():
+    """
+    A TestClient of all the apps composed, each one loaded and started on the first request to it
+    """
+    with TestClient(compose()) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def app_client(composed_client):
+    """
+    `app_client("4")`: a MountedClient of the app
+    """
+
+    def get(name: str) -> MountedClient:
+        return MountedClient(composed_client, f"/{app_slug(resolve_app_dir(name))}")
+
+    return get
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+import cbor2
+import msgpack
+import pytest
+
+ITEM = {"item": {"name": "Foo", "price": 42.0}, "user": {"username": "dave"}, "importance": 5}
+PATH = "/items/140/body_and_query/"
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client("4")
+
+
+def put(client, content: bytes, media_type: str, accept: str = "application/json"):
+    return client.put(PATH, content=content, headers={"Content-Type": media_type, "Accept": accept})
+
+
+@pytest.mark.parametrize("encode, media_type", [
+    (lambda value: msgpack.packb(value, use_bin_type=True), "application/msgpack"),
+    (cbor2.dumps, "application/cbor"),
+], ids=["msgpack", "cbor"])
+def test_binary_body_and_response(client, encode, media_type):
+    response = put(client, encode(ITEM), media_type, accept=media_type)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    decode = msgpack.unpackb if media_type == "application/msgpack" else cbor2.loads
+    decoded = decode(response.content)
+    assert decoded["item"]["name"] == "Foo"
+
+
+@pytest.mark.parametrize("content, media_type, loc", [
+    # Well-formed, but with a byte string that isn't UTF-8 where validation expects a str
+    (msgpack.packb({**ITEM, "item": {"name": b"\xff\xfe", "price": 1.0}}, use_bin_type=True), "application/msgpack",
+     ["body", "item", "name"]),
+    (cbor2.dumps({**ITEM, "item": {"name": b"\xff\xfe", "price": 1.0}}), "application/cbor", ["body", "item", "name"]),
+    (cbor2.dumps({**ITEM, "importance": cbor2.CBORTag(4000, 5)}), "application/cbor", ["body", "importance"]),
+    (cbor2.dumps({**ITEM, "user": {"username": datetime(2024, 1, 1, tzinfo=timezone.utc)}}), "application/cbor",
+     ["body", "user", "username"]),
+    (cbor2.dumps({**ITEM, 5: "five"}), "application/cbor", ["body"]),
+    (msgpack.packb({**ITEM, "importance": msgpack.ExtType(1, b"x")}), "application/msgpack", ["body", "importance"]),
+], ids=["msgpack bytes", "cbor bytes", "cbor tag", "cbor datetime", "cbor int key", "msgpack ext"])
+def test_non_json_values_are_rejected(client, content, media_type, loc):
+    response = put(client, content, media_type)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == loc
+
+
+@pytest.mark.parametrize("media_type", ["application/msgpack", "application/cbor"])
+def test_malformed_body(client, media_type):
+    response = put(client, b"\xc1\xff\x00", media_type)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"].endswith("_invalid")
+
+
+def test_binary_body_still_validated(client):
+    response = put(client, cbor2.dumps({**ITEM, "importance": 0}), "application/cbor")
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "importance"]
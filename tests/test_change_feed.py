@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+from common.change_feed import KEEP_ALIVE_EVENT, ChangeFeed
+
+pytestmark = pytest.mark.anyio
+
+
+def parse(chunk: bytes) -> list[tuple[str, dict]]:
+    """
+    (event, data) of every event of an SSE chunk
+    """
+    events = []
+    for block in chunk.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def published(count: int, **kwargs) -> ChangeFeed:
+    feed = ChangeFeed(**kwargs)
+    for seq in range(1, count + 1):
+        feed.publish(seq % 3, {"version": seq})
+    return feed
+
+
+async def test_resume_after_a_sequence_number():
+    feed = published(5)
+    events = feed.events(after=2)
+    assert [data["seq"] for _, data in parse(await anext(events))] == [3, 4, 5]
+    await events.aclose()
+
+
+async def test_new_changes_wake_the_subscriber():
+    feed = published(2)
+    events = feed.events()
+    next_event = asyncio.ensure_future(anext(events))
+    await asyncio.sleep(0)
+    assert not next_event.done()
+    feed.publish(7, {"version": 3})
+    assert parse(await next_event) == [("change", {"seq": 3, "item_id": 7, "data": {"version": 3}})]
+    await events.aclose()
+    assert feed.subscribers == 0
+
+
+async def test_keep_alive_while_idle():
+    feed = ChangeFeed(keep_alive=0.01)
+    events = feed.events()
+    assert await asyncio.wait_for(anext(events), 1) == KEEP_ALIVE_EVENT
+    await events.aclose()
+
+
+@pytest.mark.parametrize("after", [1, 100], ids=["trimmed from the log", "ahead of the log"])
+async def test_reset_when_the_log_cannot_resume(after):
+    feed = published(10, max_entries=3)
+    events = feed.events(after=after)
+    assert parse(await anext(events)) == [("reset", {"seq": 10})]
+    feed.publish(1, {"version": 11})
+    assert [data["seq"] for _, data in parse(await anext(events))] == [11]
+    await events.aclose()
+    assert feed.counters["resets"] == 1
+
+
+async def test_slow_subscriber_gets_a_snapshot():
+    feed = published(6, buffer=3)
+    events = feed.events(after=0)
+    [(event, data)] = parse(await anext(events))
+    assert event == "snapshot"
+    assert data["seq"] == 6
+    # The latest change of each of the items 0, 1 and 2
+    assert [(change["seq"], change["item_id"]) for change in data["changes"]] == [(4, 1), (5, 2), (6, 0)]
+    feed.publish(1, {"version": 7})
+    assert [data["seq"] for _, data in parse(await anext(events))] == [7]
+    await events.aclose()
+
+
+async def test_slow_subscriber_snapshot_past_the_log_is_a_reset():
+    feed = published(10, max_entries=3, buffer=2)
+    events = feed.events(after=8)
+    feed.publish(1, {"version": 11})
+    feed.publish(1, {"version": 12})
+    feed.publish(1, {"version": 13})
+    feed.publish(1, {"version": 14})
+    feed.publish(1, {"version": 15})
+    feed.publish(1, {"version": 16})
+    assert parse(await anext(events)) == [("reset", {"seq": 16})]
+    await events.aclose()
+
+
+async def test_slow_subscriber_disconnected():
+    feed = published(6, buffer=3)
+    events = feed.events(after=0, overflow="disconnect")
+    with pytest.raises(StopAsyncIteration):
+        await anext(events)
+    assert feed.counters["disconnects"] == 1
+    assert feed.subscribers == 0
+
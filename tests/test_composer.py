@@ -0,0 +1,41 @@
+"""
+The middlewares of the apps match the paths of their own routes (/items/), while mounted they get the full path
+(/query-parameter-models/items/) in `scope["path"]`: each test checks that one of them still does its job behind the
+mount.
+"""
+from common.apps import resolve_app_dir
+
+
+def test_apps_report(composed_client, app_client):
+    app_client("2").get("/items/1")
+    apps = {app["dir"]: app for app in composed_client.get("/_apps").json()}
+    assert apps[resolve_app_dir("2")]["loaded"]
+    assert apps[resolve_app_dir("2")]["error"] is None
+
+
+def test_response_cache(app_client):
+    client = app_client("2")
+    for _ in range(2):
+        assert client.get("/items/42", params={"q": "compose"}).status_code == 200
+    stats = client.get("/cache/stats").json()
+    assert stats["routes"]["/items/{item_id}"]["hits"]
+
+
+def test_compression(app_client):
+    response = app_client("3").get("/items/", params={"limit": 100}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_idempotency(app_client):
+    client = app_client("4")
+    body = {"item": {"name": "Foo", "price": 42.0}, "user": {"username": "dave"}, "importance": 5}
+    responses = [client.put("/items/42/multiple_body/", json=body, headers={"Idempotency-Key": "compose"})
+                 for _ in range(2)]
+    assert responses[1].headers["idempotent-replayed"] == "true"
+
+
+def test_admission(app_client):
+    client = app_client("6")
+    client.post("/offers/", json={})
+    assert "/offers/" in client.get("/admission/stats").json()["routes"]
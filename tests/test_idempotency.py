@@ -0,0 +1,82 @@
+import pytest
+
+A = {"item": {"name": "A", "price": 1.0}, "user": {"username": "dave"}, "importance": 1}
+B = {"item": {"name": "B", "price": 2.0}, "user": {"username": "dave"}, "importance": 1}
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client("4")
+
+
+def stored_name(client, item_id: int) -> str:
+    return client.get(f"/items/{item_id}").json()["item"]["name"]
+
+
+def test_identical_request_is_replayed(client):
+    first = client.put("/items/100/multiple_body/", json=A)
+    retry = client.put("/items/100/multiple_body/", json=A)
+    assert first.status_code == retry.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.content == first.content
+
+
+def test_write_on_the_same_route_invalidates(client):
+    client.put("/items/101/multiple_body/", json=A)
+    client.put("/items/101/multiple_body/", json=B)
+    again = client.put("/items/101/multiple_body/", json=A)
+    assert "idempotent-replayed" not in again.headers
+    assert stored_name(client, 101) == "A"
+
+
+@pytest.mark.parametrize("item_id, write", [
+    (110, lambda client, item_id: client.put(f"/items/{item_id}/single_body_param/", json=B)),
+    (111, lambda client, item_id: client.put(f"/items/{item_id}", json=B["item"])),
+    (112, lambda client, item_id: client.put(f"/items/{item_id}/embedded", json={"item": B["item"]})),
+    (113, lambda client, item_id: client.put(f"/items/{item_id}/body_and_query/", json=B)),
+    (114, lambda client, item_id: client.put("/items/", json={str(item_id): B["item"], "999": B["item"]})),
+], ids=["single_body_param", "plain", "embedded", "body_and_query", "bulk"])
+def test_write_through_another_route_invalidates(client, item_id, write):
+    client.put(f"/items/{item_id}/multiple_body/", json=A)
+    assert write(client, item_id).status_code == 200
+    assert stored_name(client, item_id) == "B"
+    again = client.put(f"/items/{item_id}/multiple_body/", json=A)
+    assert "idempotent-replayed" not in again.headers
+    assert stored_name(client, item_id) == "A"
+
+
+def test_other_items_keep_their_responses(client):
+    client.put("/items/120/multiple_body/", json=A)
+    client.put("/items/121/single_body_param/", json=B)
+    retry = client.put("/items/120/multiple_body/", json=A)
+    assert retry.headers["idempotent-replayed"] == "true"
+
+
+def test_idempotency_key_is_replayed_whatever_was_written(client):
+    headers = {"Idempotency-Key": "test-key-130"}
+    first = client.put("/items/130/multiple_body/", json=A, headers=headers)
+    client.put("/items/130/single_body_param/", json=B)
+    retry = client.put("/items/130/multiple_body/", json=A, headers=headers)
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.content == first.content
+
+
+def test_idempotency_key_reused_with_another_body(client):
+    headers = {"Idempotency-Key": "test-key-131"}
+    client.put("/items/131/multiple_body/", json=A, headers=headers)
+    conflict = client.put("/items/131/multiple_body/", json=B, headers=headers)
+    assert conflict.status_code == 422
+
+
+def test_replayed_in_the_negotiated_format(client):
+    headers = {"Idempotency-Key": "test-key-150"}
+    json_response = client.put("/items/150/multiple_body/", json=A, headers=headers)
+    msgpack_headers = {**headers, "Accept": "application/msgpack"}
+    msgpack_response = client.put("/items/150/multiple_body/", json=A, headers=msgpack_headers)
+    assert "idempotent-replayed" not in msgpack_response.headers
+    assert msgpack_response.headers["content-type"] == "application/msgpack"
+    for request_headers, first in [(headers, json_response), (msgpack_headers, msgpack_response)]:
+        retry = client.put("/items/150/multiple_body/", json=A, headers=request_headers)
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert retry.content == first.content
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from common.json_stream import StreamFormatError, is_ndjson, iter_json_array, iter_ndjson_lines
+
+pytestmark = pytest.mark.anyio
+
+VALUES = [{"name": "Café ☕", "tags": ["a", "b"]}, 12345, -1.5e10, "ünïcode", True, None, [1, [2, 3]], 0.25]
+
+
+async def chunked(body: bytes, *cuts: int):
+    start = 0
+    for cut in (*cuts, len(body)):
+        yield body[start:cut]
+        start = cut
+
+
+async def parse(body: bytes, *cuts: int, **kwargs) -> list:
+    return [value async for value in iter_json_array(chunked(body, *cuts), **kwargs)]
+
+
+async def test_every_chunk_boundary():
+    body = json.dumps(VALUES, ensure_ascii=False).encode()
+    for cut in range(len(body) + 1):
+        assert await parse(body, cut) == VALUES, cut
+
+
+async def test_one_byte_chunks():
+    body = json.dumps(VALUES, ensure_ascii=False, indent=2).encode()
+    assert await parse(body, *range(1, len(body))) == VALUES
+
+
+async def test_number_split_across_chunks():
+    assert await parse(b"[12,345]", 2) == [12, 345]
+    assert await parse(b"[1.5e10]", 3, 5) == [1.5e10]
+
+
+@pytest.mark.parametrize("body, index", [
+    (b'{"a": 1}', 0),
+    (b"[1, 2", 2),
+    (b"[1 2]", 1),
+    (b"[1, {]", 1),
+    (b"[1] 2", 1),
+])
+async def test_malformed(body, index):
+    with pytest.raises(StreamFormatError) as error:
+        await parse(body, len(body) // 2)
+    assert error.value.index == index
+
+
+async def test_element_too_large():
+    body = json.dumps([{"name": "x" * 100}]).encode()
+    with pytest.raises(StreamFormatError):
+        await parse(body, 10, 20, 30, max_element_bytes=16)
+
+
+async def test_ndjson_lines_across_chunks():
+    body = b'{"a": 1}\n\n{"b": "\xc3\xa9"}\n{"c": 3}'
+    for cut in range(len(body) + 1):
+        lines = [line async for line in iter_ndjson_lines(chunked(body, cut))]
+        assert [json.loads(line) for line in lines] == [{"a": 1}, {"b": "é"}, {"c": 3}], cut
+
+
+def test_ndjson_media_types():
+    assert is_ndjson("application/x-ndjson; charset=utf-8")
+    assert not is_ndjson("application/json")
+    assert not is_ndjson(None)
@@ -0,0 +1,111 @@
+import random
+import time
+
+import pytest
+
+from common.offer_store import VECTORIZED_BUILD_MIN, OfferAggregates, StoredOffer
+
+ITEM = {"name": "Foo", "price": 10.0, "tax": 1.0, "tags": ["rock", "metal"],
+        "images": [{"url": "http://example.com/baz.jpg", "name": "The Foo live"}]}
+OFFER = {"name": "Offer", "description": "A bundle", "price": 100.0, "items": [
+    {**ITEM, "name": f"Foo {index}", "price": 10.0 + index, "tags": ["rock"] if index % 2 else ["rock", "metal"]}
+    for index in range(1200)
+]}
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client("6")
+
+
+def job_result(client, job_id: str) -> dict:
+    for _ in range(500):
+        job = client.get(f"/offers/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            assert job["status"] == "done", job
+            return job["result"]
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} not done: {job}")
+
+
+def test_job_and_stored_offer_report_the_same_summary(client):
+    stored = client.post("/offers/", params={"mode": "store"}, json=OFFER)
+    assert stored.status_code == 201
+    job = client.post("/offers/", params={"mode": "async"}, json=OFFER)
+    assert job.status_code == 202
+    result = job_result(client, job.json()["id"])
+    summary = client.get(f"/offers/{stored.json()['id']}/summary").json()
+    assert result["summary"] == summary["summary"]
+    assert result["summary"]["items"] == 1200
+    assert result["summary"]["min_price"] == 10.0
+    assert result["summary"]["max_price"] == 1209.0
+    assert set(result["summary"]["tag_prices"]) == {"rock", "metal"}
+
+
+def items(count: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [{"name": f"item {index}", "price": float(rng.randint(1, 50)), "tax": rng.choice((None, 1.0)),
+             "tags": rng.sample(["a", "b", "c", "d"], rng.randint(0, 2)), "images": [{}] * rng.randint(0, 2)}
+            for index in range(count)]
+
+
+def assert_same(aggregates: OfferAggregates, expected: OfferAggregates) -> None:
+    summary, other = aggregates.summary(), expected.summary()
+    assert summary.pop("tag_prices") == pytest.approx(other.pop("tag_prices"))
+    assert summary == pytest.approx(other)
+
+
+@pytest.mark.parametrize("count", [10, VECTORIZED_BUILD_MIN + 10], ids=["item by item", "vectorized"])
+def test_aggregates_follow_adds_replaces_and_removes(count):
+    offer = StoredOffer({"name": "Offer", "price": 1.0, "items": items(count)})
+    rng = random.Random(1)
+    for step, item in enumerate(items(300, seed=2)):
+        operation = rng.choice(("add", "replace", "remove")) if offer.items else "add"
+        if operation == "add":
+            offer.add_item(item)
+        elif operation == "replace":
+            offer.replace_item(rng.choice(list(offer.items)), item)
+        else:
+            offer.remove_item(rng.choice(list(offer.items)))
+        if step % 50 == 0:
+            assert_same(offer.aggregates, OfferAggregates.from_items(list(offer.items.values())))
+    assert_same(offer.aggregates, OfferAggregates.from_items(list(offer.items.values())))
+
+
+def test_bounds_survive_removing_the_extremes():
+    offer = StoredOffer({"name": "Offer", "price": 1.0, "items": [
+        {"name": str(price), "price": price} for price in (5.0, 1.0, 9.0, 1.0)
+    ]})
+    offer.remove_item(2)
+    assert offer.aggregates.max_price == 5.0
+    offer.remove_item(1)
+    assert offer.aggregates.min_price == 1.0
+    offer.remove_item(3)
+    assert offer.aggregates.min_price == offer.aggregates.max_price == 5.0
+    offer.remove_item(0)
+    assert offer.aggregates.summary() == OfferAggregates().summary()
+
+
+def test_merged_chunks_equal_the_whole_offer():
+    all_items = items(2500)
+    merged = OfferAggregates()
+    for start in range(0, len(all_items), 1200):
+        merged.merge(OfferAggregates.from_items(all_items[start:start + 1200]))
+    assert_same(merged, OfferAggregates.from_items(all_items))
+
+
+def test_item_routes_update_the_summary(client):
+    stored = client.post("/offers/", params={"mode": "store"}, json={**OFFER, "items": OFFER["items"][:2]})
+    offer_id = stored.json()["id"]
+    added = client.post(f"/offers/{offer_id}/items/", json={**ITEM, "price": 1000.0, "tags": ["jazz"]})
+    assert added.status_code == 201
+    summary = added.json()["summary"]
+    assert (summary["items"], summary["max_price"], summary["tag_prices"]["jazz"]) == (3, 1000.0, 1000.0)
+    item_id = added.json()["item_id"]
+    replaced = client.put(f"/offers/{offer_id}/items/{item_id}", json={**ITEM, "price": 1.0, "tags": []})
+    summary = replaced.json()["summary"]
+    assert (summary["items"], summary["min_price"], "jazz" in summary["tag_prices"]) == (3, 1.0, False)
+    assert client.delete(f"/offers/{offer_id}/items/{item_id}").status_code == 204
+    summary = client.get(f"/offers/{offer_id}/summary").json()["summary"]
+    assert (summary["items"], summary["min_price"], summary["max_price"]) == (2, 10.0, 11.0)
+    assert client.delete(f"/offers/{offer_id}/items/{item_id}").status_code == 404
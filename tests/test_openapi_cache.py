@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client("7")
+
+
+def test_schema_served_with_etag(client):
+    response = client.get("/openapi.json")
+    assert response.status_code == 200
+    assert response.json()["paths"]
+    cached = client.get("/openapi.json", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+@pytest.mark.parametrize("path, marker", [
+    ("/docs", "swagger-ui"),
+    ("/docs/oauth2-redirect", "oauth2"),
+    ("/redoc", "redoc"),
+])
+def test_docs_pages(client, path, marker):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert marker in response.text.lower()
+
+
+def test_docs_point_at_the_cached_schema(client):
+    assert "/openapi.json" in client.get("/redoc").text
+    assert "/docs/oauth2-redirect" in client.get("/docs").text
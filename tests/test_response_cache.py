@@ -0,0 +1,73 @@
+from typing import Literal
+
+import pytest
+from pydantic import BaseModel, Field
+
+from common.response_cache import CacheRule
+
+
+class Filter(BaseModel):
+    limit: int = Field(100, gt=0, le=100)
+    order_by: Literal["created_at", "updated_at"] = "created_at"
+    tags: list[str] = []
+    cursor: str | None = Field(None, alias="after")
+
+
+class StrictFilter(Filter):
+    model_config = {"extra": "forbid"}
+
+
+@pytest.mark.parametrize("first, second", [
+    (b"", b"limit=100&order_by=created_at"),  # Defaults
+    (b"tags=b&tags=a", b"tags=a&tags=b"),  # Unordered
+    (b"limit=10&tags=a", b"tags=a&limit=10"),  # Order of the names
+    (b"limit=10", b"limit=10&utm_source=mail"),  # Parameters the route doesn't read
+    (b"after=abc", b"cursor=abc&after=abc"),  # Alias, the field name itself isn't accepted
+])
+def test_equivalent_query_strings_share_a_key(first, second):
+    rule = CacheRule.from_model("/items/", Filter, unordered=("tags",))
+    assert rule.key(first) == rule.key(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    (b"limit=10", b"limit=20"),
+    (b"after=abc", b"after=abd"),
+    (b"tags=a", b"tags=a&tags=a"),
+])
+def test_different_query_strings_get_different_keys(first, second):
+    rule = CacheRule.from_model("/items/", Filter, unordered=("tags",))
+    assert rule.key(first) != rule.key(second)
+
+
+def test_order_kept_for_ordered_parameters():
+    rule = CacheRule.from_model("/items/", Filter)
+    assert rule.key(b"tags=b&tags=a") != rule.key(b"tags=a&tags=b")
+
+
+def test_extra_parameters_kept_when_the_route_forbids_them():
+    rule = CacheRule.from_model("/items/", StrictFilter)
+    assert rule.forbid_extra
+    assert rule.key(b"limit=10") != rule.key(b"limit=10&tool=plumbus")
+
+
+def test_not_modified(app_client):
+    client = app_client("3")
+    first = client.get("/items/", params={"limit": 5, "tags": ["b", "a"]})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    same = client.get("/items/", params=[("tags", "a"), ("tags", "b"), ("limit", "5")], headers={"If-None-Match": etag})
+    assert same.status_code == 304
+    assert same.content == b""
+    assert same.headers["etag"] == etag
+    other = client.get("/items/", params={"limit": 6}, headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+
+def test_aliased_query_served_from_the_cache(app_client):
+    client = app_client("1")
+    stats = client.get("/cache/stats").json()["routes"]["/items/alias/"]
+    first = client.get("/items/alias/", params={"item-query": "fixedquery", "other": "1"})
+    second = client.get("/items/alias/", params={"item-query": "fixedquery"})
+    assert first.content == second.content
+    after = client.get("/cache/stats").json()["routes"]["/items/alias/"]
+    assert after.get("hits", 0) == stats.get("hits", 0) + 1
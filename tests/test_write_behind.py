@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from common.write_behind import WriteBehindStore
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_snapshot_covers_the_flushed_lines(tmp_path):
+    store = WriteBehindStore(tmp_path / "items.log")
+    await store.start()
+    await store.put(1, {"name": "Foo"})
+    await store.flush()
+    await store.put(2, {"name": "Bar"})
+    await store.flush()
+    _, (inode, offset) = store.snapshot_state()
+    stat = os.stat(store.path)
+    assert (inode, offset) == (stat.st_ino, stat.st_size)
+    await store.stop()
+
+
+async def test_lines_of_other_processes_stay_after_the_snapshot(tmp_path):
+    store = WriteBehindStore(tmp_path / "items.log")
+    await store.start()
+    await store.put(1, {"name": "Foo"})
+    await store.flush()
+    _, covered = store.snapshot_state()
+    with open(store.path, "a") as log:
+        log.write('{"id":2,"data":{"name":"Bar"}}\n')  # Another worker appending to the same log
+    await store.put(3, {"name": "Baz"})
+    await store.flush()
+    assert store.snapshot_state()[1] == covered
+    await store.stop()
+
+
+async def test_replay_after_a_crash(tmp_path):
+    path = tmp_path / "items.log"
+    store = WriteBehindStore(path)
+    await store.start()
+    await store.put(1, {"name": "Foo", "price": 1.0})
+    await store.put(2, {"name": "Bar"})
+    await store.flush()
+    await store.put(1, {"price": 2.0})
+    await store.flush()
+    await store.put(3, {"name": "Baz"})  # Never flushed
+    store._flusher.cancel()  # The process dies: no stop, no last flush
+    with open(path, "a") as log:
+        log.write('{"id":4,"data":{"na')  # A line cut short
+
+    replayed = WriteBehindStore(path)
+    await replayed.start()
+    assert dict(replayed.items()) == {1: {"name": "Foo", "price": 2.0}, 2: {"name": "Bar"}}
+    await replayed.put(5, {"name": "Qux"})
+    await replayed.stop()
+
+    again = WriteBehindStore(path)
+    await again.start()
+    assert again.get(5) == {"name": "Qux"}
+    assert len(again) == 3
+    await again.stop()